@@ -0,0 +1,27 @@
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+
+@pytest.fixture
+def fake_server():
+    """
+    Start local stand-ins for upstream HTTP APIs: fake_server(Handler) serves
+    Handler on 127.0.0.1 on a free port from a daemon thread and returns the
+    server. Every server started is shut down and its socket closed after the
+    test, so later connections are refused instead of hanging.
+    """
+    servers = []
+
+    def start(handler):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+
+    for server in servers:
+        server.shutdown()
+        server.server_close()
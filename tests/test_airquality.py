@@ -0,0 +1,65 @@
+import os
+import sys
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'web')))
+
+from integration import airquality
+
+
+def _reset(monkeypatch, rules):
+    airquality._windows.clear()
+    airquality._active.clear()
+    monkeypatch.setattr(airquality, "_rules", lambda: rules)
+
+
+def _ids():
+    return [a["id"] for a in airquality.get_active_alerts()["alerts"]]
+
+
+def test_threshold_uses_hysteresis(monkeypatch):
+    """An alert is raised above the threshold and only cleared below clear_below."""
+    _reset(monkeypatch, [{"id": "co2_high", "field": "co2", "above": 1000, "clear_below": 800}])
+
+    assert airquality.evaluate_reading("stue", {"co2": 950}, now=0) == []
+    assert airquality.evaluate_reading("stue", {"co2": 1050}, now=300) == [("co2_high", "raised")]
+    version = airquality.get_active_alerts()["version"]
+
+    # Svinger rundt terskelen uten å gi nye varsler
+    assert airquality.evaluate_reading("stue", {"co2": 990}, now=600) == []
+    assert airquality.evaluate_reading("stue", {"co2": 1010}, now=900) == []
+    assert _ids() == ["co2_high"]
+    assert airquality.get_active_alerts()["version"] == version
+
+    assert airquality.evaluate_reading("stue", {"co2": 790}, now=1200) == [("co2_high", "cleared")]
+    assert _ids() == []
+    assert airquality.get_active_alerts()["version"] == version + 1
+
+
+def test_rate_of_change_over_window(monkeypatch):
+    """A rate rule compares the oldest and newest reading inside its window."""
+    _reset(monkeypatch, [{"id": "co2_rising", "field": "co2", "rate_above": 400, "clear_rate_below": 100, "window": 3600}])
+
+    airquality.evaluate_reading("stue", {"co2": 500}, now=0)
+    assert airquality.evaluate_reading("stue", {"co2": 550}, now=300) == []  # for kort tidsrom
+    assert airquality.evaluate_reading("stue", {"co2": 800}, now=1800) == [("co2_rising", "raised")]
+
+    airquality.evaluate_reading("stue", {"co2": 850}, now=3600)
+    assert _ids() == ["co2_rising"]
+    assert airquality.evaluate_reading("stue", {"co2": 850}, now=7200) == [("co2_rising", "cleared")]
+
+
+def test_devices_are_tracked_separately(monkeypatch):
+    """Each device has its own window and alerts, sorted by level."""
+    _reset(monkeypatch, [
+        {"id": "radon_high", "field": "radon_24h", "above": 100, "level": "warning"},
+        {"id": "radon_critical", "field": "radon_24h", "above": 200, "level": "critical"},
+    ])
+
+    airquality.evaluate_reading("stue", {"radon_24h": 120}, now=0)
+    airquality.evaluate_reading("kjeller", {"radon_24h": 250}, now=10)
+
+    alerts = airquality.get_active_alerts()["alerts"]
+    assert [(a["device"], a["id"]) for a in alerts] == [
+        ("kjeller", "radon_critical"), ("stue", "radon_high"), ("kjeller", "radon_high")
+    ]
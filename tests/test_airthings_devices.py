@@ -0,0 +1,144 @@
+import asyncio
+import os
+import sys
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'web')))
+
+from integration import airthings
+
+
+def _reading(name, co2):
+    return {"device": name, "temperature": 21.0, "humidity": 40, "radon_24h": 50, "radon_longterm": 60,
+            "co2": co2, "voc": 100, "pressure": 1000}
+
+
+class FakeBLEDevice:
+    def __init__(self, address, adapter):
+        self.address = address
+        self.details = {"path": f"/org/bluez/{adapter}/dev_{address}"}
+
+
+def _fake_ble(monkeypatch, present, delay=0.05):
+    """
+    Fake the BLE scan and device reads; `present` maps MAC to (co2, adapter it is
+    reachable on). Returns counters for scans and peak concurrency.
+    """
+    present = {mac: value if isinstance(value, tuple) else (value, "hci0") for mac, value in present.items()}
+    stats = {"scans": [], "active": 0, "peak": 0, "recorded": []}
+
+    async def fake_scan(macs, adapter=None):
+        stats["scans"].append(adapter)
+        return {
+            mac.upper(): FakeBLEDevice(mac.upper(), present[mac.upper()][1])
+            for mac in macs if mac.upper() in present and present[mac.upper()][1] == (adapter or "hci0")
+        }
+
+    async def fake_read(ble_device):
+        stats["active"] += 1
+        stats["peak"] = max(stats["peak"], stats["active"])
+        await asyncio.sleep(delay)
+        stats["active"] -= 1
+        return _reading(ble_device.address, present[ble_device.address][0])
+
+    airthings._device_cache.clear()
+    airthings._failure_cache.clear()
+    monkeypatch.setattr(airthings, "_scan", fake_scan)
+    monkeypatch.setattr(airthings, "_read_device", fake_read)
+    monkeypatch.setattr(airthings, "record_many", lambda prefix, values: stats["recorded"].append(prefix))
+    return stats
+
+
+def test_devices_on_different_adapters_read_concurrently(monkeypatch):
+    """Each adapter is scanned once for its devices, and reads on different adapters overlap."""
+    stats = _fake_ble(monkeypatch, {"AA": (500, "hci0"), "BB": (900, "hci1")})
+    devices = [
+        {"name": "stue", "mac": "aa", "adapter": "hci0"},
+        {"name": "kjeller", "mac": "bb", "adapter": "hci1"},
+    ]
+
+    data = airthings.get_airthings(devices)
+
+    assert sorted(stats["scans"]) == ["hci0", "hci1"]
+    assert stats["peak"] == 2
+    assert data["co2"] == 500
+    assert [d["name"] for d in data["devices"]] == ["stue", "kjeller"]
+    assert data["devices"][1]["co2"] == 900
+    assert stats["recorded"] == ["airthings.stue", "airthings.kjeller"]
+
+
+def test_limit_follows_the_adapter_that_found_the_device(monkeypatch):
+    """Two labels that resolve to the same physical adapter share its limit."""
+    stats = _fake_ble(monkeypatch, {"AA": (500, "hci0"), "BB": (900, "hci0")})
+    devices = [{"mac": "AA", "adapter": "hci0"}, {"mac": "BB"}]
+
+    data = airthings.get_airthings(devices)
+
+    assert stats["peak"] == airthings.ADAPTER_CONCURRENCY
+    assert [d["co2"] for d in data["devices"]] == [500, 900]
+
+
+def test_same_adapter_is_limited(monkeypatch):
+    """Reads on one adapter never exceed ADAPTER_CONCURRENCY."""
+    stats = _fake_ble(monkeypatch, {"AA": 500, "BB": 900, "CC": 700})
+    devices = [{"mac": mac} for mac in ("AA", "BB", "CC")]
+
+    airthings.get_airthings(devices)
+
+    assert stats["peak"] == airthings.ADAPTER_CONCURRENCY
+
+
+def test_cached_devices_skip_the_scan(monkeypatch):
+    """Only devices whose reading is older than READ_TTL are scanned for again."""
+    stats = _fake_ble(monkeypatch, {"AA": 500})
+
+    airthings.get_airthings("AA")
+    data = airthings.get_airthings("AA")
+
+    assert stats["scans"] == [None]
+    assert data["co2"] == 500
+    assert stats["recorded"] == ["airthings"]
+
+
+def test_missing_device_is_reported_alongside_others(monkeypatch):
+    """A device out of range gets an error entry without failing the response."""
+    _fake_ble(monkeypatch, {"BB": 900})
+
+    data = airthings.get_airthings([{"name": "stue", "mac": "AA"}, {"name": "kjeller", "mac": "BB"}])
+
+    assert data["name"] == "kjeller"
+    assert "error" in data["devices"][0]
+
+    _fake_ble(monkeypatch, {})
+    assert "error" in airthings.get_airthings("AA")
+
+
+def test_failed_device_is_not_rescanned_during_backoff(monkeypatch):
+    """A device that did not answer is left alone for FAILURE_BACKOFF seconds."""
+    stats = _fake_ble(monkeypatch, {})
+
+    first = airthings.get_airthings("AA")
+    second = airthings.get_airthings("AA")
+    monkeypatch.setattr(airthings, "FAILURE_BACKOFF", 0)
+    airthings.get_airthings("AA")
+
+    assert "error" in first and second == first
+    assert stats["scans"] == [None, None]
+
+
+def test_old_reading_is_flagged_stale_when_refresh_fails(monkeypatch):
+    """Every device carries its reading time; a reading past READ_TTL is marked stale."""
+    stats = _fake_ble(monkeypatch, {"AA": 500})
+
+    fresh = airthings.get_airthings("AA")["devices"][0]
+    airthings._device_cache["AA"]["time"] -= airthings.READ_TTL
+    # Enheten er borte ved neste skann
+    monkeypatch.setattr(airthings, "_scan", lambda macs, adapter=None: asyncio.sleep(0, {}))
+    old = airthings.get_airthings("AA")
+
+    assert fresh["stale"] is False and fresh["updated"] > 0
+    assert old["co2"] == 500
+    assert old["stale"] is True and old["updated"] == airthings._device_cache["AA"]["time"]
+    assert "AA" in airthings._failure_cache
+    assert stats["scans"] == [None]
+
@@ -0,0 +1,104 @@
+import os
+import sys
+import json
+from datetime import date, timedelta
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'web')))
+
+from integration import birthday
+from integration.birthday import get_birthdays_week, get_holidays_week
+
+
+def _write_json(path, payload):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f)
+
+
+def _freeze_today(monkeypatch, today):
+    """Make birthday.py see `today` as the current date."""
+    class FixedDate(date):
+        @classmethod
+        def today(cls):
+            return today
+
+    monkeypatch.setattr(birthday, "date", FixedDate)
+
+
+def test_birthdays_week_from_index(tmp_path, monkeypatch):
+    """Birthdays this week and next week get the right week_offset and age."""
+    today = date(2025, 3, 4)
+    _freeze_today(monkeypatch, today)
+    next_week = today + timedelta(days=7)
+    birthdays_file = tmp_path / "birthdays.json"
+    _write_json(birthdays_file, [
+        {"name": "Ola", "date": today.replace(year=2015).strftime("%Y-%m-%d")},
+        {"name": "Kari", "date": next_week.replace(year=2012).strftime("%Y-%m-%d")},
+        {"name": "Per", "date": (today + timedelta(days=60)).replace(year=2010).strftime("%Y-%m-%d")},
+    ])
+
+    events = get_birthdays_week(str(birthdays_file))
+    by_summary = {e["summary"]: e for e in events}
+
+    ola = by_summary[f"🎂 Ola ({today.year - 2015} år)"]
+    assert ola["week_offset"] == 0
+    assert ola["weekday_index"] == today.weekday()
+
+    kari = by_summary[f"🎂 Kari ({next_week.year - 2012} år)"]
+    assert kari["week_offset"] == 1
+    assert not any("Per" in e["summary"] for e in events)
+
+
+def test_leap_day_birthday_falls_on_28_february_in_other_years(tmp_path, monkeypatch):
+    """Someone born on 29 February is not dropped in non-leap years."""
+    _freeze_today(monkeypatch, date(2025, 2, 26))
+    birthdays_file = tmp_path / "birthdays.json"
+    _write_json(birthdays_file, [{"name": "Skuddår", "date": "2016-02-29"}])
+
+    events = get_birthdays_week(str(birthdays_file))
+
+    assert [(e["summary"], e["start"], e["week_offset"]) for e in events] == [
+        ("🎂 Skuddår (9 år)", "2025-02-28 00:00:00", 0)
+    ]
+    leap_year = dict(birthday._birthday_entries([{"name": "Skuddår", "date": "2016-02-29"}], 2028))
+    assert list(leap_year) == [date(2028, 2, 29)]
+
+
+def test_index_rebuilt_only_when_file_changes(tmp_path, monkeypatch):
+    """The week index is reused until the file's mtime changes."""
+    today = date.today()
+    holidays_file = tmp_path / "holidays.json"
+    _write_json(holidays_file, [{"name": "Testdag", "date": today.strftime("%m-%d"), "icon": "🧪"}])
+
+    calls = []
+    original = birthday._holiday_entries
+
+    def counting_entries(entries, year):
+        calls.append(year)
+        return original(entries, year)
+
+    monkeypatch.setattr(birthday, "_holiday_entries", counting_entries)
+    birthday._week_index_cache.clear()
+
+    assert [e["summary"] for e in get_holidays_week(str(holidays_file))] == ["🧪 Testdag"]
+    built = len(calls)
+    get_holidays_week(str(holidays_file))
+    assert len(calls) == built
+
+    _write_json(holidays_file, [{"name": "Annen dag", "date": today.strftime("%m-%d"), "icon": "🧪"}])
+    stat = os.stat(holidays_file)
+    os.utime(holidays_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    assert [e["summary"] for e in get_holidays_week(str(holidays_file))] == ["🧪 Annen dag"]
+    assert len(calls) > built
+
+
+def test_week_based_holiday_covers_weekdays(tmp_path):
+    """Week-based holidays expand to Monday-Friday of the given ISO week."""
+    today = date.today()
+    iso_week = today.isocalendar()[1]
+    holidays_file = tmp_path / "holidays.json"
+    _write_json(holidays_file, [{"name": "Ferie", "week": iso_week, "icon": "⛷️"}])
+
+    events = [e for e in get_holidays_week(str(holidays_file)) if e["week_offset"] == 0]
+    assert [e["weekday_index"] for e in events] == [0, 1, 2, 3, 4]
@@ -0,0 +1,187 @@
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'web')))
+
+from integration import bluesound
+
+
+class FakePlayerHandler(BaseHTTPRequestHandler):
+    """Stand-in for a BluOS player's /Status with etag/timeout long-polling, and /SyncStatus."""
+    state = {"etag": "1", "title": "Radio", "volume": "20"}
+    changed = threading.Condition()
+    requests_seen = []
+    sync = {}   # port -> (name, master, slaves)
+    delay = 0
+
+    def do_GET(self):
+        if self.path == "/SyncStatus":
+            name, master, slaves = self.sync.get(self.server.server_address[1], ("Stue", None, []))
+            body = f'<SyncStatus name="{name}">'
+            if master:
+                body += f'<master port="{master.split(":")[1]}">{master.split(":")[0]}</master>'
+            body += "".join(f'<slave id="{s.split(":")[0]}" port="{s.split(":")[1]}"/>' for s in slaves)
+            self._reply(body + "</SyncStatus>")
+            return
+
+        time.sleep(self.delay)
+        query = parse_qs(urlparse(self.path).query)
+        self.requests_seen.append(query)
+        etag = query.get("etag", [None])[0]
+        timeout = float(query.get("timeout", [0])[0])
+
+        with self.changed:
+            if etag == self.state["etag"]:
+                self.changed.wait_for(lambda: self.state["etag"] != etag, timeout=timeout)
+            state = dict(self.state)
+
+        self._reply(
+            f'<status etag="{state["etag"]}"><title1>{state["title"]}</title1><state>play</state>'
+            f'<volume>{state["volume"]}</volume><db>-30</db><inputId>Spotify</inputId></status>'
+        )
+
+    def _reply(self, body):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/xml")
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+    def log_message(self, *args):
+        pass
+
+
+def _change(**values):
+    with FakePlayerHandler.changed:
+        FakePlayerHandler.state.update(values, etag=str(int(FakePlayerHandler.state["etag"]) + 1))
+        FakePlayerHandler.changed.notify_all()
+
+
+def _start_fake_player(fake_server, monkeypatch):
+    server = fake_server(FakePlayerHandler)
+    FakePlayerHandler.state = {"etag": "1", "title": "Radio", "volume": "20"}
+    FakePlayerHandler.requests_seen = []
+    FakePlayerHandler.sync = {}
+    FakePlayerHandler.delay = 0
+    monkeypatch.setattr(bluesound, "LONG_POLL_TIMEOUT", 2)
+    monkeypatch.setattr(bluesound, "MIN_POLL_INTERVAL", 0)
+    return server, f"127.0.0.1:{server.server_address[1]}"
+
+
+def test_status_served_from_memory_and_updated_by_long_poll(fake_server, monkeypatch):
+    """After the first answer the watcher long-polls and /music reads memory."""
+    server, host = _start_fake_player(fake_server, monkeypatch)
+    try:
+        first = bluesound.get_powernode(host)
+        requests_after_first = len(FakePlayerHandler.requests_seen)
+        for _ in range(5):
+            assert bluesound.get_powernode(host) == first
+
+        _change(title="Podcast")
+        change = bluesound.wait_for_change(host, version=1, timeout=2)
+    finally:
+        bluesound.stop_bluesound_watcher(host)
+        with FakePlayerHandler.changed:
+            FakePlayerHandler.changed.notify_all()
+        server.shutdown()
+
+    assert first["title"] == "Radio"
+    assert first["volume"] == "20"
+    assert requests_after_first <= 2
+    assert change is not None and change[1]["title"] == "Podcast"
+    assert FakePlayerHandler.requests_seen[1]["etag"] == ["1"]
+
+
+def test_wait_for_change_times_out_without_changes(fake_server, monkeypatch):
+    """Nothing is pushed while the player's status stays the same."""
+    server, host = _start_fake_player(fake_server, monkeypatch)
+    try:
+        bluesound.get_powernode(host)
+        started = time.time()
+        change = bluesound.wait_for_change(host, version=1, timeout=0.3)
+        elapsed = time.time() - started
+    finally:
+        bluesound.stop_bluesound_watcher(host)
+        server.shutdown()
+
+    assert change is None
+    assert elapsed >= 0.3
+
+
+def test_unreachable_player_reports_error(monkeypatch):
+    """Without any status the error is returned instead of waiting forever."""
+    monkeypatch.setattr(bluesound, "RETRY_DELAY", 0.1)
+    try:
+        status = bluesound.get_powernode("127.0.0.1:9")
+    finally:
+        bluesound.stop_bluesound_watcher("127.0.0.1:9")
+
+    assert "error" in status
+
+
+def test_combined_payload_groups_players_and_waits_once(fake_server, monkeypatch):
+    """Players are fetched concurrently, grouped by SyncStatus, and the primary is on top."""
+    first, first_host = _start_fake_player(fake_server, monkeypatch)
+    second = fake_server(FakePlayerHandler)
+    second_host = f"127.0.0.1:{second.server_address[1]}"
+    FakePlayerHandler.sync = {
+        first.server_address[1]: ("Stue", None, [second_host]),
+        second.server_address[1]: ("Kjøkken", first_host, []),
+    }
+    FakePlayerHandler.delay = 0.4
+    hosts = [second_host, first_host, "127.0.0.1:9"]
+    try:
+        started = time.time()
+        music = bluesound.get_music(hosts)
+        elapsed = time.time() - started
+    finally:
+        for host in hosts:
+            bluesound.stop_bluesound_watcher(host)
+        with FakePlayerHandler.changed:
+            FakePlayerHandler.changed.notify_all()
+        first.shutdown()
+        second.shutdown()
+
+    assert elapsed < 0.75
+    assert music["host"] == first_host
+    assert music["title"] == "Radio" and music["name"] == "Stue"
+    assert [player["host"] for player in music["players"]] == hosts
+    assert "error" in music["players"][2]
+    assert music["groups"] == [{"name": "Stue", "primary": first_host, "members": [first_host, second_host], "state": "play"}]
+
+
+def test_discovery_without_zeroconf_returns_nothing(monkeypatch):
+    """Missing zeroconf disables discovery instead of failing /music."""
+    monkeypatch.setitem(sys.modules, "zeroconf", None)
+    monkeypatch.setitem(bluesound._discovery, "browser", None)
+
+    assert bluesound.discover_players() == []
+
+
+def test_lost_player_is_served_as_stale(fake_server, monkeypatch):
+    """After a failed poll the last status is kept but flagged, not shown as current."""
+    server, host = _start_fake_player(fake_server, monkeypatch)
+    monkeypatch.setattr(bluesound, "RETRY_DELAY", 0.1)
+    try:
+        assert "stale" not in bluesound.get_powernode(host)
+        server.shutdown()
+        server.server_close()
+
+        # En long-poll som allerede venter, svarer innen LONG_POLL_TIMEOUT; neste kall feiler
+        deadline = time.time() + 4
+        status = bluesound.get_powernode(host)
+        while "stale" not in status and time.time() < deadline:
+            time.sleep(0.05)
+            status = bluesound.get_powernode(host)
+        music = bluesound.get_music([host])
+    finally:
+        bluesound.stop_bluesound_watcher(host)
+
+    assert status["stale"] is True
+    assert status["title"] == "Radio"
+    assert "error" in status and status["updated"] is not None
+    assert music["stale"] is True and music["title"] == "Radio"
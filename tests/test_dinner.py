@@ -0,0 +1,120 @@
+import datetime
+import os
+import sys
+from http.server import BaseHTTPRequestHandler
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'web')))
+
+from integration import dinner
+
+PLAN = """Middager denne uken
+VIKTIG: Handle til helgen
+M: Taco
+T: Fiskesuppe
+O: Pasta
+T: Pizza
+F: Fiskegrateng
+
+Oppskrifter nedenfor
+S: ikke en dag
+"""
+
+
+class FakeDocumentHandler(BaseHTTPRequestHandler):
+    """Stand-in for the dinner document, honouring If-None-Match."""
+    text = PLAN
+    requests_seen = []
+
+    def do_GET(self):
+        self.requests_seen.append(self.headers.get("If-None-Match"))
+        etag = f'"{hash(self.text)}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = self.text.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _start_fake_document(fake_server):
+    server = fake_server(FakeDocumentHandler)
+    FakeDocumentHandler.text = PLAN
+    FakeDocumentHandler.requests_seen = []
+    dinner._dinner_cache.clear()
+    dinner._failures.clear()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/plan.txt"
+
+
+def test_both_views_share_one_fetch(fake_server):
+    """/dinner and /bigcalendar's week view come from the same parsed document."""
+    _, url = _start_fake_document(fake_server)
+    week = dinner.get_dinnerweek(url)
+    days = dinner.get_dinner(url)
+
+    assert FakeDocumentHandler.requests_seen == [None]
+    assert week["important"] == days["important"] == "Handle til helgen"
+    assert [(d["shorthand"], d["weekday_index"]) for d in week["days"]] == [
+        ("M", 0), ("T", 1), ("O", 2), ("T2", 3), ("F", 4)
+    ]
+    assert [d["day"] for d in days["days"]] == ["Mandag", "Tirsdag", "Onsdag", "Torsdag", "Fredag"]
+
+
+def test_dates_follow_the_listed_weekdays(fake_server):
+    """Dates start at the next occurrence of the first listed day (Norwegian names work)."""
+    _, url = _start_fake_document(fake_server)
+    days = dinner.get_dinner(url)["days"]
+
+    dates = [datetime.datetime.strptime(d["date"], "%Y-%m-%d %H:%M:%S").date() for d in days]
+    assert dates[0].weekday() == 0 and dates[0] >= datetime.date.today()
+    assert [d.weekday() for d in dates] == [0, 1, 2, 3, 4]
+
+
+def test_revalidated_with_etag_and_reparsed_on_change(fake_server, monkeypatch):
+    """After the TTL the document is revalidated, and only a changed one is parsed again."""
+    _, url = _start_fake_document(fake_server)
+    monkeypatch.setattr(dinner, "DOCUMENT_TTL", 0)
+    first = dinner.get_dinnerweek(url)
+    again = dinner.get_dinnerweek(url)
+    FakeDocumentHandler.text = PLAN.replace("Taco", "Lasagne")
+    changed = dinner.get_dinnerweek(url)
+
+    assert FakeDocumentHandler.requests_seen[0] is None
+    assert FakeDocumentHandler.requests_seen[1] == FakeDocumentHandler.requests_seen[2] is not None
+    assert first == again
+    assert changed["days"][0]["description"] == "Lasagne"
+
+
+def test_unreachable_document():
+    dinner._dinner_cache.clear()
+    dinner._failures.clear()
+
+    assert dinner.get_dinner("http://127.0.0.1:9/plan.txt") == {"error": "Failed to fetch dinner plan"}
+
+
+def test_failed_fetch_backs_off(monkeypatch):
+    """An unreachable document is only asked for again after FAILURE_RETRY."""
+    attempts = []
+
+    def failing_get(url, **kwargs):
+        attempts.append(url)
+        raise dinner.requests.ConnectionError("down")
+
+    dinner._dinner_cache.clear()
+    dinner._failures.clear()
+    monkeypatch.setattr(dinner.requests, "get", failing_get)
+
+    dinner.get_dinner("http://dokument/plan.txt")
+    dinner.get_dinnerweek("http://dokument/plan.txt")
+    assert len(attempts) == 1
+
+    dinner._failures["http://dokument/plan.txt"] -= dinner.FAILURE_RETRY
+    dinner.get_dinner("http://dokument/plan.txt")
+    assert len(attempts) == 2
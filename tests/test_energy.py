@@ -0,0 +1,188 @@
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'web')))
+
+from integration import energy, timeseries
+
+
+def _day_prices(day, step_minutes=60, base=1.0):
+    """Build a hvakosterstrommen-style price list for one day."""
+    start = energy.OSLO_TZ.localize(datetime.combine(day, datetime.min.time()))
+    slots = 24 * 60 // step_minutes
+    prices = []
+    for i in range(slots):
+        slot_start = start + timedelta(minutes=i * step_minutes)
+        slot_end = slot_start + timedelta(minutes=step_minutes)
+        prices.append({
+            "NOK_per_kWh": round(base + i / 100, 4),
+            "time_start": slot_start.isoformat(),
+            "time_end": slot_end.isoformat(),
+        })
+    return prices
+
+
+def _use_fake_api(monkeypatch, tmp_path, published):
+    """Point the price cache at tmp_path and serve prices from the published dict."""
+    calls = []
+
+    def fake_fetch(day, zone):
+        calls.append((day, zone))
+        return published.get((day, zone))
+
+    energy._price_cache.clear()
+    energy._slot_cache.clear()
+    timeseries.configure(tmp_path / "timeseries.sqlite")
+    monkeypatch.setattr(energy, "_base_dir", lambda: tmp_path)
+    monkeypatch.setattr(energy, "_fetch_prices", fake_fetch)
+    monkeypatch.setattr(energy, "start_price_scheduler", lambda *args, **kwargs: None)
+    return calls
+
+
+def test_prices_cached_per_day_and_zone(tmp_path, monkeypatch):
+    """A day is downloaded once, then served from memory and from disk."""
+    today = datetime.now(energy.OSLO_TZ).date()
+    calls = _use_fake_api(monkeypatch, tmp_path, {(today, "NO1"): _day_prices(today)})
+
+    assert energy.get_prices(today, "NO1")
+    assert energy.get_prices(today, "NO1")
+    assert len(calls) == 1
+
+    energy._price_cache.clear()
+    assert energy.get_prices(today, "NO1")
+    assert len(calls) == 1
+    assert (tmp_path / "data" / "energy" / f"{today.isoformat()}_NO1.json").exists()
+
+
+def test_hvakosterstrom_reads_tomorrow_from_cache_only(tmp_path, monkeypatch):
+    """The route never downloads tomorrow's prices; the scheduler does."""
+    today = datetime.now(energy.OSLO_TZ).date()
+    tomorrow = today + timedelta(days=1)
+    calls = _use_fake_api(monkeypatch, tmp_path, {
+        (today, "NO1"): _day_prices(today),
+        (tomorrow, "NO1"): _day_prices(tomorrow, base=2.0),
+    })
+
+    result = energy.get_hvakosterstrom()
+    assert result["now"]["price"] is not None
+    assert result["max_today"]["price"] == 1.23
+    assert result["max_tomorrow"]["price"] is None
+    assert calls == [(today, "NO1")]
+
+    energy.get_prices(tomorrow, "NO1")
+    assert energy.get_hvakosterstrom()["max_tomorrow"]["price"] == 2.23
+
+
+def test_find_cheapest_contiguous_window():
+    """The sliding window finds the cheapest run of consecutive slots."""
+    slots = [(i, i + 1, price) for i, price in enumerate([5, 4, 1, 2, 9, 1, 1, 8])]
+
+    assert [s[2] for s in energy.find_cheapest_slots(slots, 2)] == [1, 1]
+    assert [s[0] for s in energy.find_cheapest_slots(slots, 3)] == [1, 2, 3]
+    assert [s[0] for s in energy.find_cheapest_slots(slots, 3, contiguous=False)] == [2, 5, 6]
+    assert energy.find_cheapest_slots(slots, 9) is None
+
+
+def test_plan_cheapest_before_deadline(tmp_path, monkeypatch):
+    """Only slots ending before the deadline are considered, across midnight."""
+    now = energy.OSLO_TZ.localize(datetime(2026, 1, 14, 20, 30))
+    today, tomorrow = now.date(), now.date() + timedelta(days=1)
+    tomorrow_prices = _day_prices(tomorrow, base=0.5)
+    tomorrow_prices[2]["NOK_per_kWh"] = 0.01
+    _use_fake_api(monkeypatch, tmp_path, {(today, "NO1"): _day_prices(today), (tomorrow, "NO1"): tomorrow_prices})
+
+    plan = energy.plan_cheapest(3, "07:00", now=now)
+    assert plan["from"].startswith("2026-01-15T00:00")
+    assert plan["to"].startswith("2026-01-15T03:00")
+    assert len(plan["slots"]) == 3
+
+    plan = energy.plan_cheapest(2, "07:00", contiguous=False, now=now)
+    assert [s["from"][11:16] for s in plan["slots"]] == ["00:00", "02:00"]
+
+    assert "error" in energy.plan_cheapest(12, "07:00", now=now)
+
+
+def test_plan_cheapest_fetches_tomorrow_only_after_publishing(tmp_path, monkeypatch):
+    """Before 13:00 tomorrow is not asked for; zero or negative hours are rejected."""
+    now = energy.OSLO_TZ.localize(datetime(2026, 1, 14, 9, 0))
+    today, tomorrow = now.date(), now.date() + timedelta(days=1)
+    started = []
+    calls = _use_fake_api(monkeypatch, tmp_path, {(today, "NO1"): _day_prices(today), (tomorrow, "NO1"): _day_prices(tomorrow)})
+    monkeypatch.setattr(energy, "start_price_scheduler", lambda zones: started.append(list(zones)))
+
+    plan = energy.plan_cheapest(2, now=now, areas=["NO1", "NO2"])
+
+    assert plan["to"].startswith("2026-01-14T")
+    assert calls == [(today, "NO1")]
+    assert started == [["NO1", "NO2"]]
+    for hours in (0, -1):
+        with pytest.raises(ValueError):
+            energy.plan_cheapest(hours, now=now)
+
+
+def test_quarter_hour_resolution_and_zone(tmp_path, monkeypatch):
+    """15-minute prices are looked up per quarter and per price area."""
+    today = datetime.now(energy.OSLO_TZ).date()
+    _use_fake_api(monkeypatch, tmp_path, {
+        (today, "NO1"): _day_prices(today),
+        (today, "NO5"): _day_prices(today, step_minutes=15, base=3.0),
+    })
+
+    result = energy.get_hvakosterstrom("NO5", ["NO1", "NO5"])
+    assert result["zone"] == "NO5"
+    assert result["resolution_minutes"] == 15
+    assert result["now"]["price"] >= 3.0
+
+    now_start = datetime.fromisoformat(result["now"]["from"])
+    next_start = datetime.fromisoformat(result["next"]["from"])
+    assert next_start - now_start == timedelta(minutes=15)
+
+    assert energy.get_hvakosterstrom("NO1")["resolution_minutes"] == 60
+
+
+def test_prefetch_prices_for_several_areas(tmp_path, monkeypatch):
+    """All configured price areas are fetched in one call."""
+    today = datetime.now(energy.OSLO_TZ).date()
+    calls = _use_fake_api(monkeypatch, tmp_path, {
+        (today, zone): _day_prices(today) for zone in ("NO1", "NO2", "NO3")
+    })
+
+    prices = energy.prefetch_prices(today, ["NO1", "NO2", "NO3"])
+    assert set(prices) == {"NO1", "NO2", "NO3"}
+    assert sorted(zone for _, zone in calls) == ["NO1", "NO2", "NO3"]
+
+
+def test_price_scheduler_covers_zones_from_every_caller(monkeypatch):
+    """Heating and /energy start the scheduler with different zones; tomorrow is fetched for both."""
+    started = []
+
+    class FakeThread:
+        def __init__(self, target, **kwargs):
+            started.append(target)
+
+        def start(self):
+            pass
+
+    monkeypatch.setattr(energy.threading, "Thread", FakeThread)
+    monkeypatch.setitem(energy._scheduler, "thread", None)
+    monkeypatch.setitem(energy._scheduler, "zones", set())
+
+    energy.start_price_scheduler(["NO1"])       # f.eks. varmestyringen
+    energy.start_price_scheduler(["NO1", "NO2"])  # /energy med PRICE_AREAS
+    assert len(started) == 1
+    assert energy._scheduler["wake"].is_set()
+    energy._scheduler["wake"].clear()
+
+    fetched = []
+    monkeypatch.setattr(energy, "prefetch_prices", lambda day, zones: fetched.append((day, list(zones))) or {z: True for z in zones})
+    monkeypatch.setattr(energy, "get_prices", lambda day, zone, fetch=True: None)
+    now = energy.OSLO_TZ.localize(datetime(2026, 3, 10, 14, 0))
+
+    energy._price_scheduler_pass(now)
+
+    tomorrow = now.date() + timedelta(days=1)
+    assert fetched == [(now.date(), ["NO1", "NO2"]), (tomorrow, ["NO1", "NO2"])]
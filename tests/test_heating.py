@@ -0,0 +1,174 @@
+import os
+import sys
+from datetime import date, datetime, timedelta
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'web')))
+
+from integration import heating
+
+
+SETTINGS = {
+    "zone": "NO1",
+    "kw_per_degree": 0.5,
+    "rooms": {
+        "42": {"name": "Stue", "comfort": 21, "setback": 17, "setback_share": 0.25, "max_setback_hours": 3},
+    },
+}
+
+
+def _slots(day, prices):
+    """Build hourly (start, end, price) slots for one day."""
+    start = heating.OSLO_TZ.localize(datetime.combine(day, datetime.min.time()))
+    return [
+        (start + timedelta(hours=i), start + timedelta(hours=i + 1), price)
+        for i, price in enumerate(prices)
+    ]
+
+
+def _use_prices(monkeypatch, published):
+    """Serve price slots from the published dict and count lookups per day."""
+    calls = []
+
+    def fake_slots(day, zone="NO1", fetch=True):
+        calls.append(day)
+        return published.get(day, [])
+
+    heating._day_plans.clear()
+    heating._last_pushed.clear()
+    monkeypatch.setattr(heating, "get_price_slots", fake_slots)
+    monkeypatch.setattr(heating, "command_failed", lambda kind, target_id: False)
+    return calls
+
+
+def test_plan_day_sets_back_the_most_expensive_hours():
+    """The top quarter of the day's prices get the setback temperature."""
+    prices = [1.0] * 24
+    for hour in (7, 8, 17, 18, 19, 20):
+        prices[hour] = 3.0
+    plan = heating.plan_day(_slots(date(2025, 1, 6), prices), heating._room_settings(SETTINGS, "42"))
+
+    setback_hours = [start.hour for start, _, setpoint in plan if setpoint == 17]
+    assert setback_hours == [7, 8, 17, 18, 19]
+
+
+def test_plan_day_limits_consecutive_setback():
+    """A long expensive stretch is broken up so the room can recover."""
+    prices = [1.0] * 18 + [5.0] * 6
+    room = {**heating._room_settings(SETTINGS, "42"), "max_setback_hours": 2}
+    plan = heating.plan_day(_slots(date(2025, 1, 6), prices), room)
+
+    setpoints = [setpoint for _, _, setpoint in plan[18:]]
+    assert setpoints == [17, 17, 21, 17, 17, 21]
+
+
+def test_plan_day_recovers_between_setbacks_at_quarter_hours():
+    """With 15-minute prices every capped setback is followed by the full recovery time."""
+    start = heating.OSLO_TZ.localize(datetime(2025, 1, 6))
+    prices = [1.0] * 64 + [5.0] * 32
+    slots = [
+        (start + timedelta(minutes=15 * i), start + timedelta(minutes=15 * (i + 1)), price)
+        for i, price in enumerate(prices)
+    ]
+    room = {**heating._room_settings(SETTINGS, "42"), "setback_share": 0.5,
+            "max_setback_hours": 1, "min_recovery_hours": 0.5}
+    plan = heating.plan_day(slots, room)
+
+    runs = "".join("s" if setpoint == 17 else "c" for _, _, setpoint in plan[64:])
+    assert runs == "sssscc" * 5 + "ss"
+    assert all(len(run) <= 4 for run in runs.split("c"))
+    assert all(len(gap) >= 2 for gap in runs.strip("c").split("s") if gap)
+
+
+def test_heating_plan_adds_tomorrow_incrementally(monkeypatch):
+    """Today's plan is kept; tomorrow is planned once its prices show up."""
+    now = heating.OSLO_TZ.localize(datetime(2025, 1, 6, 10, 30))
+    today, tomorrow = now.date(), now.date() + timedelta(days=1)
+    published = {today: _slots(today, [1.0] * 24)}
+    calls = _use_prices(monkeypatch, published)
+
+    plan = heating.get_heating_plan(SETTINGS, now)["42"]
+    assert plan["segments"][-1]["to"].startswith(tomorrow.isoformat())
+    assert calls == [today, tomorrow]
+
+    published[tomorrow] = _slots(tomorrow, [2.0] * 24)
+    plan = heating.get_heating_plan(SETTINGS, now)["42"]
+    assert plan["segments"][-1]["to"].startswith((tomorrow + timedelta(days=1)).isoformat())
+    assert calls == [today, tomorrow, tomorrow]
+
+    heating.get_heating_plan(SETTINGS, now)
+    assert calls == [today, tomorrow, tomorrow]
+
+
+def test_apply_pushes_only_changed_setpoints(monkeypatch):
+    """Mill only receives a command when the room's setpoint changes."""
+    day = date(2025, 1, 6)
+    prices = [1.0] * 24
+    prices[8] = 3.0
+    _use_prices(monkeypatch, {day: _slots(day, prices)})
+    settings = {**SETTINGS, "rooms": {"42": {**SETTINGS["rooms"]["42"], "setback_share": 0.05}}}
+
+    pushed = []
+    monkeypatch.setattr(heating, "queue_mill_command", lambda user, pw, kind, target_id, target_temp=None: pushed.append((kind, target_id, target_temp)))
+
+    def at(hour, minute=0):
+        return heating.OSLO_TZ.localize(datetime(2025, 1, 6, hour, minute))
+
+    assert heating.apply_heating_plan(settings, "user", "pw", at(7)) == {"42": 21}
+    assert heating.apply_heating_plan(settings, "user", "pw", at(7, 30)) == {}
+    assert heating.apply_heating_plan(settings, "user", "pw", at(8, 15)) == {"42": 17}
+    assert heating.apply_heating_plan(settings, "user", "pw", at(9)) == {"42": 21}
+    assert pushed == [("room", "42", 21), ("room", "42", 17), ("room", "42", 21)]
+
+
+def test_apply_repushes_setpoint_mill_rejected(monkeypatch):
+    """A setpoint Mill did not accept is sent again instead of being treated as applied."""
+    day = date(2025, 1, 6)
+    _use_prices(monkeypatch, {day: _slots(day, [1.0] * 24)})
+    failed = set()
+    monkeypatch.setattr(heating, "command_failed", lambda kind, target_id: (kind, target_id) in failed)
+    pushed = []
+    monkeypatch.setattr(heating, "queue_mill_command", lambda user, pw, kind, target_id, target_temp=None: pushed.append(target_temp))
+    now = heating.OSLO_TZ.localize(datetime(2025, 1, 6, 7))
+
+    assert heating.apply_heating_plan(SETTINGS, "user", "pw", now) == {"42": 21}
+    failed.add(("room", "42"))
+    assert heating.apply_heating_plan(SETTINGS, "user", "pw", now) == {"42": 21}
+    failed.clear()
+    assert heating.apply_heating_plan(SETTINGS, "user", "pw", now) == {}
+    assert pushed == [21, 21]
+
+
+def test_simulation_replays_stored_prices(monkeypatch):
+    """Savings are setback degrees × kW per degree × the price in that hour."""
+    first, second = date(2025, 1, 6), date(2025, 1, 7)
+    prices = [1.0] * 24
+    prices[12] = 2.0
+    _use_prices(monkeypatch, {first: _slots(first, prices), second: _slots(second, prices)})
+    settings = {**SETTINGS, "rooms": {"42": {**SETTINGS["rooms"]["42"], "setback_share": 0.05}}}
+
+    result = heating.simulate_heating(settings, first, second + timedelta(days=1))
+
+    assert result["days_with_prices"] == 2
+    room = result["rooms"]["42"]
+    assert room["setback_hours"] == 2
+    assert room["saved_kwh"] == 4.0   # 2 timer × 4 grader × 0.5 kW
+    assert room["saved_nok"] == 8.0
+    assert result["saved_nok"] == 8.0
+
+
+def test_scheduler_starts_on_first_request_not_on_import(monkeypatch):
+    """Importing app.py (as the reloader's watcher process does) starts nothing."""
+    import app as app_module
+
+    started = []
+    monkeypatch.setattr(app_module, "start_heating_scheduler", lambda *args: started.append(args))
+    monkeypatch.setitem(app_module.CONFIG, "HEATING", {"enabled": True})
+    monkeypatch.setitem(app_module.CONFIG, "MILL_USERNAME", "user")
+    monkeypatch.setitem(app_module.CONFIG, "MILL_PASSWORD", "secret")
+    assert started == []
+
+    with app_module.app.test_client() as client:
+        client.get("/widgets")
+
+    assert started == [({"enabled": True}, "user", "secret")]
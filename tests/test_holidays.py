@@ -0,0 +1,42 @@
+import os
+import sys
+from datetime import date
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'web')))
+
+from integration.holidays import easter_sunday, public_holidays, get_public_holiday
+
+
+def test_easter_sunday_known_years():
+    """Computus matches known Easter Sundays."""
+    assert easter_sunday(2024) == date(2024, 3, 31)
+    assert easter_sunday(2025) == date(2025, 4, 20)
+    assert easter_sunday(2026) == date(2026, 4, 5)
+    assert easter_sunday(2038) == date(2038, 4, 25)
+
+
+def test_moving_holidays_follow_easter():
+    """Ascension and Whit Monday are derived from Easter."""
+    holidays = public_holidays(2026)
+    names = {d: [h["name"] for h in day] for d, day in holidays.items()}
+
+    assert names[date(2026, 4, 2)] == ["Skjærtorsdag"]
+    assert names[date(2026, 4, 3)] == ["Langfredag"]
+    assert names[date(2026, 5, 14)] == ["Kristi himmelfartsdag"]
+    assert names[date(2026, 5, 25)] == ["2. pinsedag"]
+    assert names[date(2026, 5, 17)] == ["17. mai"]
+    assert len(holidays) == 13
+
+
+def test_holidays_on_the_same_date_are_all_kept():
+    """Ascension on 1. mai (2008) and Whit Monday on 17. mai (2027) keep both names."""
+    assert [h["name"] for h in get_public_holiday(date(2008, 5, 1))] == ["1. mai", "Kristi himmelfartsdag"]
+    assert [h["name"] for h in get_public_holiday(date(2027, 5, 17))] == ["17. mai", "2. pinsedag"]
+    assert sum(len(day) for day in public_holidays(2027).values()) == 13
+
+
+def test_lookup_outside_precomputed_table():
+    """Years outside the startup table are computed on demand."""
+    assert [h["name"] for h in get_public_holiday(date(2150, 12, 25))] == ["1. juledag"]
+    assert get_public_holiday(date(2150, 12, 27)) == []
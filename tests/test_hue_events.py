@@ -0,0 +1,138 @@
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'web')))
+
+from integration import hue_events
+
+RESOURCES = [
+    {"id": "room-1", "id_v1": "/groups/1", "type": "room", "metadata": {"name": "Stue"},
+     "children": [{"rid": "dev-1", "rtype": "device"}, {"rid": "dev-2", "rtype": "device"}],
+     "services": [{"rid": "gl-1", "rtype": "grouped_light"}]},
+    {"id": "gl-1", "type": "grouped_light", "on": {"on": True}, "dimming": {"brightness": 80.0}},
+    {"id": "dev-9", "type": "device", "metadata": {"name": "Ute terrasse"}},
+    {"id": "temp-1", "id_v1": "/sensors/5", "type": "temperature", "owner": {"rid": "dev-9", "rtype": "device"},
+     "temperature": {"temperature": 4.5, "temperature_valid": True}},
+]
+
+
+class FakeEventBridgeHandler(BaseHTTPRequestHandler):
+    """Stand-in for the Hue bridge's CLIP v2 resource list and SSE event stream."""
+    protocol_version = "HTTP/1.1"
+    events = []
+    release = None
+
+    def do_GET(self):
+        if self.headers.get("hue-application-key") != "key":
+            self.send_response(403)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        if self.path == "/clip/v2/resource":
+            body = json.dumps({"errors": [], "data": RESOURCES}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self._chunk(b": hi\n\n")
+
+        # Sender hendelsene når testen slipper dem, og holder så strømmen åpen litt
+        self.release.wait(5)
+        for event in self.events:
+            self._chunk(f"id: 1:0\ndata: {json.dumps(event)}\n\n".encode())
+        time.sleep(1)
+        self._chunk(b"")
+
+    def _chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def log_message(self, *args):
+        pass
+
+
+def _start_fake_bridge(fake_server, monkeypatch, events):
+    server = fake_server(FakeEventBridgeHandler)
+    FakeEventBridgeHandler.events = events
+    FakeEventBridgeHandler.release = threading.Event()
+
+    hue_events.stop_hue_events()
+    monkeypatch.setattr(hue_events, "record", lambda *args, **kwargs: None)
+    hue_events.start_hue_events("bridge", "key", base_url=f"http://127.0.0.1:{server.server_address[1]}")
+    return server
+
+
+def _wait_for(condition, timeout=2):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        state = hue_events.get_lights_state()
+        if state is not None and condition(state):
+            return state
+        time.sleep(0.02)
+    raise AssertionError("state did not update in time")
+
+
+def test_snapshot_builds_lights_state(fake_server, monkeypatch):
+    """The initial resource list gives zones and outdoor sensors in the /lights shape."""
+    server = _start_fake_bridge(fake_server, monkeypatch, [])
+    try:
+        state = _wait_for(lambda s: s["zones"])
+    finally:
+        FakeEventBridgeHandler.release.set()
+        hue_events.stop_hue_events()
+        server.shutdown()
+
+    assert state == {
+        "zones": [{"id": "1", "name": "Stue", "num_lights": 2, "status": "on"}],
+        "outdoor_sensors": [{"id": "5", "name": "Ute terrasse", "temperature": 4.5}],
+    }
+
+
+def test_events_update_state_without_polling(fake_server, monkeypatch):
+    """Pushed updates are merged into the model within a second."""
+    events = [[
+        {"type": "update", "id": "evt-1", "data": [{"id": "gl-1", "type": "grouped_light", "on": {"on": False}}]},
+        {"type": "update", "id": "evt-2", "data": [{"id": "temp-1", "type": "temperature", "temperature": {"temperature": 2.0}}]},
+    ]]
+    server = _start_fake_bridge(fake_server, monkeypatch, events)
+    try:
+        _wait_for(lambda s: s["zones"])
+        FakeEventBridgeHandler.release.set()
+        state = _wait_for(lambda s: s["zones"][0]["status"] == "off", timeout=1)
+    finally:
+        hue_events.stop_hue_events()
+        server.shutdown()
+
+    assert state["outdoor_sensors"][0]["temperature"] == 2.0
+
+
+def test_apply_events_handles_add_and_delete():
+    """Added resources appear in the model and deleted ones disappear."""
+    hue_events.stop_hue_events()
+    with hue_events._model_lock:
+        hue_events._model.update(resources={r["id"]: json.loads(json.dumps(r)) for r in RESOURCES}, ready=True)
+
+    hue_events.apply_events([
+        {"type": "add", "data": [{"id": "zone-2", "id_v1": "/groups/2", "type": "zone", "metadata": {"name": "Kjøkken"},
+                                  "children": [{"rid": "light-3", "rtype": "light"}], "services": []}]},
+        {"type": "delete", "data": [{"id": "temp-1", "type": "temperature"}]},
+    ])
+    state = hue_events.get_lights_state()
+    hue_events.stop_hue_events()
+
+    assert [z["name"] for z in state["zones"]] == ["Stue", "Kjøkken"]
+    assert state["outdoor_sensors"] == []
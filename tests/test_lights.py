@@ -0,0 +1,213 @@
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'web')))
+
+from integration import lights
+
+GROUPS = {
+    "1": {"name": "Stue", "lights": ["1", "2"], "state": {"any_on": True}},
+    "2": {"name": "Kjøkken", "lights": ["3"], "state": {"any_on": False}},
+}
+SENSORS = {
+    "5": {"name": "Ute terrasse", "type": "ZLLTemperature", "state": {"temperature": 1234, "lastupdated": "2025-01-06T10:00:00"}},
+    "6": {"name": "Gang", "type": "ZLLTemperature", "state": {"temperature": 2100}},
+    "7": {"name": "Ute bevegelse", "type": "ZLLPresence", "state": {"presence": False}},
+}
+
+
+class FakeBridgeHandler(BaseHTTPRequestHandler):
+    """Stand-in for the Hue bridge v1 REST API."""
+    requests_seen = []
+    actions = []
+    delay = 0
+    put_reply = None   # overstyrer svaret på PUT, f.eks. en ugyldig form
+
+    def do_GET(self):
+        self.requests_seen.append(self.path)
+        time.sleep(self.delay)
+        parts = self.path.rstrip("/").split("/")
+        if parts[-2] == "sensors":
+            # Enkeltsensor; broen svarer 200 med en feilliste for ukjente id-er
+            body = SENSORS.get(parts[-1], [{"error": {"type": 3, "description": "resource not available"}}])
+        else:
+            body = {"groups": GROUPS, "sensors": SENSORS}.get(parts[-1])
+        if body is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_PUT(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.actions.append((time.time(), self.path, body))
+        reply = self.put_reply or [{"success": {f"{self.path}/{key}": value}} for key, value in body.items()]
+        payload = json.dumps(reply).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def _start_fake_bridge(fake_server, monkeypatch, delay=0):
+    server = fake_server(FakeBridgeHandler)
+    FakeBridgeHandler.requests_seen = []
+    FakeBridgeHandler.actions = []
+    FakeBridgeHandler.delay = delay
+    FakeBridgeHandler.put_reply = None
+    lights._lights_cache.clear()
+    lights._sensor_index.clear()
+    lights._sensor_readings.clear()
+    monkeypatch.setattr(lights, "record", lambda *args, **kwargs: None)
+    return server, f"127.0.0.1:{server.server_address[1]}"
+
+
+def test_combined_fetch_parses_zones_and_outdoor_sensors(fake_server, monkeypatch):
+    """One call returns zones and only outdoor temperature sensors."""
+    _, host = _start_fake_bridge(fake_server, monkeypatch)
+    data = lights.get_lights(host, "key")
+
+    assert data["zones"] == [
+        {"id": "1", "name": "Stue", "num_lights": 2, "status": "on"},
+        {"id": "2", "name": "Kjøkken", "num_lights": 1, "status": "off"},
+    ]
+    assert data["outdoor_sensors"] == [{"id": "5", "name": "Ute terrasse", "temperature": 12.34}]
+
+
+def test_groups_and_sensors_fetched_concurrently_and_cached(fake_server, monkeypatch):
+    """Both resources are fetched in parallel, and simultaneous callers share one fetch."""
+    _, host = _start_fake_bridge(fake_server, monkeypatch, delay=0.3)
+    results = []
+    started = time.time()
+    threads = [threading.Thread(target=lambda: results.append(lights.get_lights(host, "key"))) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - started
+
+    assert elapsed < 0.55
+    assert len(results) == 3
+    assert sorted(FakeBridgeHandler.requests_seen) == ["/api/key/groups", "/api/key/sensors"]
+
+
+def test_unreachable_bridge_is_not_cached(monkeypatch):
+    """A failed fetch returns no zones and is retried on the next call."""
+    monkeypatch.setattr(lights, "REQUEST_TIMEOUT", 0.5)
+    lights._lights_cache.clear()
+
+    data = lights.get_lights("127.0.0.1:9", "key")
+
+    assert data == {"zones": None, "outdoor_sensors": []}
+    assert lights._lights_cache == {}
+
+
+def _wait_for_actions(count, timeout=3):
+    deadline = time.time() + timeout
+    while len(FakeBridgeHandler.actions) < count and time.time() < deadline:
+        time.sleep(0.02)
+    time.sleep(0.3)
+    return FakeBridgeHandler.actions
+
+
+def test_build_group_action():
+    """Brightness is given in percent and mapped to the bridge's 1-254 range."""
+    assert lights.build_group_action(brightness=100) == {"on": True, "bri": 254}
+    assert lights.build_group_action(brightness=0) == {"on": False}
+    assert lights.build_group_action(scene=7) == {"scene": "7"}
+    for bad in ({}, {"brightness": 120}):
+        with pytest.raises(ValueError):
+            lights.build_group_action(**bad)
+
+
+def test_group_commands_are_coalesced_and_rate_limited(fake_server, monkeypatch):
+    """A burst of commands becomes one group action per group, spaced by the interval."""
+    _, host = _start_fake_bridge(fake_server, monkeypatch)
+    monkeypatch.setattr(lights, "GROUP_COMMAND_INTERVAL", 0.3)
+    monkeypatch.setitem(lights._group_commands, "last_sent", 0)
+    lights.queue_group_action(host, "key", "1", {"on": True})
+    time.sleep(0.05)
+    for brightness in (20, 40, 60, 80):
+        lights.queue_group_action(host, "key", "1", lights.build_group_action(brightness=brightness))
+    lights.queue_group_action(host, "key", "2", lights.build_group_action(scene="abc"))
+    actions = _wait_for_actions(3)
+
+    assert [(path, body) for _, path, body in actions] == [
+        ("/api/key/groups/1/action", {"on": True}),
+        ("/api/key/groups/1/action", {"on": True, "bri": 203}),
+        ("/api/key/groups/2/action", {"scene": "abc"}),
+    ]
+    gaps = [later[0] - earlier[0] for earlier, later in zip(actions, actions[1:])]
+    assert all(gap >= 0.25 for gap in gaps)
+
+
+def test_toggle_uses_queued_state(fake_server, monkeypatch):
+    """Toggling twice before the first command is sent ends up back where it started."""
+    _, host = _start_fake_bridge(fake_server, monkeypatch)
+    monkeypatch.setattr(lights, "GROUP_COMMAND_INTERVAL", 0.3)
+    monkeypatch.setitem(lights._group_commands, "last_sent", time.time())
+    zones = [{"id": "1", "name": "Stue", "num_lights": 2, "status": "on"}]
+    assert lights.toggle_group(host, "key", "1", zones) == {"on": False}
+    assert lights.toggle_group(host, "key", "1", zones) == {"on": True}
+    actions = _wait_for_actions(1)
+
+    assert [body for _, _, body in actions] == [{"on": True}]
+
+
+def test_outdoor_sensors_indexed_once_then_polled_by_id(fake_server, monkeypatch):
+    """Only the first call lists all sensors; later calls fetch the indexed ones."""
+    _, host = _start_fake_bridge(fake_server, monkeypatch)
+    recorded = []
+    monkeypatch.setattr(lights, "record", lambda metric, value: recorded.append((metric, value)))
+    monkeypatch.setitem(SENSORS, "5", json.loads(json.dumps(SENSORS["5"])))
+    first = lights.get_outdoor_sensor_temperatures(host, "key")
+    second = lights.get_outdoor_sensor_temperatures(host, "key")
+    SENSORS["5"]["state"].update(temperature=1500, lastupdated="2025-01-06T10:05:00")
+    third = lights.get_outdoor_sensor_temperatures(host, "key")
+
+    assert FakeBridgeHandler.requests_seen == ["/api/key/sensors", "/api/key/sensors/5", "/api/key/sensors/5"]
+    assert first == second == [{"id": "5", "name": "Ute terrasse", "temperature": 12.34}]
+    assert third[0]["temperature"] == 15.0
+    assert recorded == [("hue.Ute terrasse.temperature", 12.34), ("hue.Ute terrasse.temperature", 15.0)]
+
+
+def test_removed_sensor_triggers_rescan(fake_server, monkeypatch):
+    """A sensor that disappears keeps its last reading once, then the bridge is rescanned."""
+    _, host = _start_fake_bridge(fake_server, monkeypatch)
+    lights.get_outdoor_sensor_temperatures(host, "key")
+    monkeypatch.delitem(SENSORS, "5")
+    stale = lights.get_outdoor_sensor_temperatures(host, "key")
+    fresh = lights.get_outdoor_sensor_temperatures(host, "key")
+
+    assert stale[0]["temperature"] == 12.34
+    assert fresh == []
+    assert FakeBridgeHandler.requests_seen[-1] == "/api/key/sensors"
+
+
+def test_unexpected_reply_does_not_stall_the_queue(fake_server, monkeypatch):
+    """A reply that is not a list of results is logged, and the next group is still sent."""
+    _, host = _start_fake_bridge(fake_server, monkeypatch)
+    FakeBridgeHandler.put_reply = {"error": "not a list"}
+    monkeypatch.setattr(lights, "GROUP_COMMAND_INTERVAL", 0.1)
+    monkeypatch.setitem(lights._group_commands, "last_sent", 0)
+    lights.queue_group_action(host, "key", "1", {"on": True})
+    lights.queue_group_action(host, "key", "2", {"on": False})
+    actions = _wait_for_actions(2)
+
+    assert [path for _, path, _ in actions] == ["/api/key/groups/1/action", "/api/key/groups/2/action"]
+    assert lights._group_commands["timer"] is None
+
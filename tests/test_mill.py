@@ -0,0 +1,225 @@
+import os
+import sys
+import json
+import time
+import pytest
+from http.server import BaseHTTPRequestHandler
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'web')))
+
+from integration import mill, timeseries
+
+
+class FakeMillHandler(BaseHTTPRequestHandler):
+    """Local stand-in for the Mill cloud API that records every request."""
+
+    def _handle(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"null")
+        self.server.requests.append((self.command, self.path, body))
+
+        sign_in = self.path.endswith("sign-in")
+        payload = {"idToken": "token", "refreshToken": "refresh"} if sign_in else {}
+        data = json.dumps(payload).encode()
+        self.send_response(200 if sign_in else self.server.status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_POST = do_PATCH = do_GET = _handle
+
+    def log_message(self, *args):
+        pass
+
+
+def _fake_mill_api(fake_server, monkeypatch):
+    server = fake_server(FakeMillHandler)
+    server.requests = []
+    server.status = 200
+
+    monkeypatch.setattr(mill, "BASE_URL", f"http://127.0.0.1:{server.server_port}")
+    mill._auth_cache.update(token=None, expires=0)
+    return server
+
+
+def _device(device_id, room="Stue", ambient=20.5, power=0, mode="weekly_program", connected=True):
+    return {
+        "id": device_id,
+        "house": "Hjem",
+        "room": room,
+        "room_id": f"room-{room}",
+        "name": f"Ovn {device_id}",
+        "type": "Panel heater",
+        "connected": connected,
+        "ambient_temp": ambient,
+        "target_temp": 21,
+        "power": power,
+        "humidity": None,
+        "mode": mode
+    }
+
+
+def _reset_tracker(tmp_path):
+    timeseries.configure(tmp_path / "timeseries.sqlite")
+    with mill._tracker_lock:
+        mill._tracker.update(devices={}, changes=[], change_times=[], version=0, last_poll=0, rooms=None, rooms_version=-1)
+
+
+def test_tracker_records_only_changed_fields(tmp_path):
+    """The first poll records everything; later polls record field-level deltas only."""
+    _reset_tracker(tmp_path)
+
+    first = mill.track_mill_devices([_device("a"), _device("b", room="Bad")], now=100)
+    assert len(first) == 2
+
+    assert mill.track_mill_devices([_device("a"), _device("b", room="Bad")], now=160) == []
+
+    changed = mill.track_mill_devices([_device("a", ambient=21.0, power=800), _device("b", room="Bad")], now=220)
+    assert len(changed) == 1
+    assert changed[0]["device_id"] == "a"
+    assert changed[0]["changes"] == {
+        "ambient_temp": {"old": 20.5, "new": 21.0},
+        "power": {"old": 0, "new": 800},
+    }
+
+
+def test_changes_since_and_room_grouping(tmp_path):
+    """Clients can ask for changes since a timestamp; rooms are regrouped after changes."""
+    _reset_tracker(tmp_path)
+
+    mill.track_mill_devices([_device("a"), _device("b", room="Bad")], now=100)
+    rooms = mill.get_mill_rooms()
+    assert sorted(rooms) == ["Bad", "Stue"]
+    assert mill.get_mill_rooms() is rooms
+
+    mill.track_mill_devices([_device("a", connected=False), _device("b", room="Bad")], now=200)
+
+    assert [c["device_id"] for c in mill.get_mill_changes(100)] == ["a"]
+    assert mill.get_mill_changes(200) == []
+    assert len(mill.get_mill_changes(0)) == 3
+    assert mill.get_mill_rooms()["Stue"][0]["connected"] is False
+
+
+def test_command_queue_coalesces_writes(fake_server, tmp_path, monkeypatch):
+    """Rapid changes to one device and a room become one call each."""
+    _reset_tracker(tmp_path)
+    mill.track_mill_devices([_device("a"), _device("b"), _device("c", room="Bad")], now=100)
+    server = _fake_mill_api(fake_server, monkeypatch)
+    monkeypatch.setattr(mill, "COMMAND_DELAY", 60)
+
+    for temp in (20, 20.5, 21, 21.5):
+        mill.queue_mill_command("user", "pass", "device", "a", target_temp=temp)
+    mill.queue_mill_command("user", "pass", "device", "a", mode="control_individually")
+    mill.queue_mill_command("user", "pass", "room", "room-Stue", target_temp=19)
+    mill.queue_mill_command("user", "pass", "room", "room-Stue", target_temp=22)
+    mill.queue_mill_command("user", "pass", "room", "room-Bad", mode="off")
+
+    results = mill.flush_mill_commands()
+    server.shutdown()
+
+    writes = [r for r in server.requests if not r[1].endswith("sign-in")]
+    assert len(server.requests) - len(writes) == 1
+    assert len(results) == len(writes) == 3
+
+    by_path = {path: body for _, path, body in writes}
+    assert by_path["/rooms/room-Stue/temperature"] == {"roomComfortTemperature": 22.0}
+    assert by_path["/devices/a/settings"]["settings"] == {
+        "operation_mode": "control_individually",
+        "temperature_normal": 21.5
+    }
+    assert by_path["/devices/c/settings"]["settings"] == {"operation_mode": "off"}
+    assert mill.flush_mill_commands() == []
+
+
+def test_command_queue_flushes_after_delay(fake_server, tmp_path, monkeypatch):
+    """Queued commands are sent automatically once the delay has passed."""
+    _reset_tracker(tmp_path)
+    server = _fake_mill_api(fake_server, monkeypatch)
+    monkeypatch.setattr(mill, "COMMAND_DELAY", 0.05)
+
+    mill.queue_mill_command("user", "pass", "device", "a", target_temp=20)
+    mill.queue_mill_command("user", "pass", "device", "a", target_temp=22)
+
+    deadline = time.time() + 2
+    while time.time() < deadline and len(server.requests) < 2:
+        time.sleep(0.02)
+    server.shutdown()
+
+    assert [(method, path) for method, path, _ in server.requests] == [
+        ("POST", "/customer/auth/sign-in"),
+        ("PATCH", "/devices/a/settings"),
+    ]
+    # Bare temperaturen endres; enhetens modus (f.eks. ukeprogram) røres ikke
+    assert server.requests[1][2]["settings"] == {"temperature_normal": 22.0}
+
+
+def test_rejected_command_is_reported_until_accepted(fake_server, tmp_path, monkeypatch):
+    """command_failed() reflects the outcome of the last send to each target."""
+    _reset_tracker(tmp_path)
+    server = _fake_mill_api(fake_server, monkeypatch)
+    monkeypatch.setattr(mill, "COMMAND_DELAY", 60)
+
+    server.status = 500
+    mill.queue_mill_command("user", "pass", "room", "room-Stue", target_temp=19)
+    mill.flush_mill_commands()
+    rejected = mill.command_failed("room", "room-Stue")
+
+    server.status = 200
+    mill.queue_mill_command("user", "pass", "room", "room-Stue", target_temp=19)
+    mill.flush_mill_commands()
+    server.shutdown()
+
+    assert rejected is True
+    assert mill.command_failed("room", "room-Stue") is False
+    assert mill.command_failed("room", "room-Kjøkken") is False
+
+
+def test_unknown_mode_is_rejected_before_queueing():
+    """Only Mill's own operation modes are accepted."""
+    with pytest.raises(ValueError):
+        mill.queue_mill_command("user", "pass", "room", "room-Stue", mode="turbo")
+
+    assert ("room", "room-Stue") not in mill._commands["pending"]
+
+
+def test_room_mode_looks_up_devices_when_none_are_known(fake_server, tmp_path, monkeypatch):
+    """A room-wide mode fetches the device list first instead of silently doing nothing."""
+    _reset_tracker(tmp_path)
+    server = _fake_mill_api(fake_server, monkeypatch)
+    monkeypatch.setattr(mill, "COMMAND_DELAY", 60)
+    lookups = []
+    monkeypatch.setattr(mill, "get_mill_devices", lambda token: lookups.append(token) or [_device("c", room="Bad")])
+
+    mill.queue_mill_command("user", "pass", "room", "room-Bad", mode="off")
+    mill.queue_mill_command("user", "pass", "room", "room-Loft", mode="off")
+    results = mill.flush_mill_commands()
+    server.shutdown()
+
+    assert lookups == ["token"]
+    assert [body["settings"] for _, path, body in server.requests if path == "/devices/c/settings"] == [{"operation_mode": "off"}]
+    assert {"url": "room/room-Loft", "error": "No known devices in room"} in results
+    assert mill.command_failed("room", "room-Loft") is True
+
+
+def test_commands_kept_when_sign_in_fails(fake_server, tmp_path, monkeypatch):
+    """Queued changes survive a failed sign-in and are sent on the retry."""
+    _reset_tracker(tmp_path)
+    server = _fake_mill_api(fake_server, monkeypatch)
+    monkeypatch.setattr(mill, "COMMAND_DELAY", 60)
+    monkeypatch.setattr(mill, "COMMAND_RETRY_DELAY", 60)
+    get_token = mill.get_token
+    monkeypatch.setattr(mill, "get_token", lambda username, password: None)
+
+    mill.queue_mill_command("user", "pass", "device", "a", target_temp=20)
+    failed = mill.flush_mill_commands()
+    mill.queue_mill_command("user", "pass", "device", "b", target_temp=18)
+
+    monkeypatch.setattr(mill, "get_token", get_token)
+    sent = mill.flush_mill_commands()
+    server.shutdown()
+
+    assert failed == [{"url": "device/a", "error": "Mill authentication failed"}]
+    assert sorted(r["url"] for r in sent) == [f"{mill.BASE_URL}/devices/a/settings", f"{mill.BASE_URL}/devices/b/settings"]
+    assert mill.command_failed("device", "a") is False
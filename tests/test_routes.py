@@ -165,8 +165,8 @@ def test_holidays_json_structure():
         assert "name" in holiday
         assert "icon" in holiday
         
-        # Holiday should have either date or week
-        assert "date" in holiday or "week" in holiday
+        # Holiday should have either date, week or easter_offset
+        assert "date" in holiday or "week" in holiday or "easter_offset" in holiday
         
         if "date" in holiday:
             # Validate MM-DD format
@@ -183,11 +183,59 @@ def test_holidays_json_structure():
             assert isinstance(holiday["week"], int)
             assert 1 <= holiday["week"] <= 53
 
+        if "easter_offset" in holiday:
+            # Days relative to Easter Sunday
+            assert isinstance(holiday["easter_offset"], int)
+
 def test_invalid_route(client):
     """Test an invalid route returns 404."""
     response = client.get("/invalid")
     assert response.status_code == 404  # Should return Not Found
 
+def test_energy_rejects_unknown_price_area(client, monkeypatch):
+    """Only zones from PRICE_AREAS reach the price fetcher and its caches."""
+    import routes
+    monkeypatch.setitem(CONFIG, "PRICE_AREAS", ["NO1", "NO2"])
+    monkeypatch.setattr(routes, "plan_cheapest", lambda *args, **kwargs: {"error": "should not be called"})
+
+    for url in ("/energy?zone=../../etc", "/energy/cheapest?zone=NO9"):
+        response = client.get(url)
+        assert response.status_code == 400
+        assert "Unknown price area" in response.json["error"]
+
+def test_energy_cheapest_rejects_non_positive_hours(client):
+    """hours=0 or below is a bad request, not an empty plan."""
+    for hours in ("0", "-2"):
+        response = client.get(f"/energy/cheapest?hours={hours}")
+        assert response.status_code == 400
+        assert "hours must be positive" in response.json["error"]
+
+def test_history_error_before_streaming_is_json(client, monkeypatch):
+    """Unexpected errors while setting up /history return a JSON 500, not an HTML error page."""
+    import routes
+
+    def broken_history(*args):
+        raise RuntimeError("store unavailable")
+
+    monkeypatch.setattr(routes, "history_json", broken_history)
+    response = client.get("/history/energy.price.NO1")
+
+    assert response.status_code == 500
+    assert response.json == {"error": "store unavailable"}
+
+def test_music_events_stream_ends_and_asks_client_to_reconnect(client, monkeypatch):
+    """The SSE stream is bounded so a vanished client does not hold a thread forever."""
+    import routes
+    monkeypatch.setattr(routes, "MUSIC_STREAM_SECONDS", 0.3)
+    monkeypatch.setattr(routes, "get_music", lambda hosts, discover: {"title": "Radio"})
+    monkeypatch.setattr(routes, "wait_for_any_change", lambda version, timeout: None)
+
+    response = client.get("/music/events")
+    body = response.get_data(as_text=True)
+
+    assert body.startswith("retry: ")
+    assert ": keepalive" in body
+
 @pytest.mark.asyncio
 async def test_mill_heater():
     from mill import Mill
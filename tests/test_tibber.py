@@ -0,0 +1,101 @@
+import os
+import sys
+import base64
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'web')))
+
+from integration import tibber, timeseries
+
+
+class FakeResponse:
+    def __init__(self, payload):
+        self.payload = payload
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.payload
+
+
+def _node(day, hour, kwh):
+    return {
+        "from": f"2026-01-{day:02d}T{hour:02d}:00:00.000+01:00",
+        "to": f"2026-01-{day:02d}T{hour:02d}:59:59.000+01:00",
+        "consumption": kwh,
+        "cost": kwh * 2,
+        "unitPrice": 2.0,
+    }
+
+
+def _page(nodes, has_next=False, end_cursor=None):
+    return {"data": {"viewer": {"homes": [{"consumption": {
+        "pageInfo": {"hasNextPage": has_next, "endCursor": end_cursor},
+        "nodes": nodes,
+    }}]}}}
+
+
+def test_incremental_sync_follows_cursor(tmp_path, monkeypatch):
+    """First sync takes the last N hours, later syncs page from the last stored hour."""
+    tibber.configure(tmp_path / "tibber.sqlite")
+    timeseries.configure(tmp_path / "timeseries.sqlite")
+
+    pages = [
+        _page([_node(1, 10, 1.0), _node(1, 11, 2.0)]),
+        _page([_node(2, 10, 3.0)], has_next=True, end_cursor="page2"),
+        _page([_node(2, 11, 4.0), _node(2, 10, 3.0)]),
+    ]
+    requests_made = []
+
+    def fake_post(url, json, headers, timeout):
+        requests_made.append(json["variables"])
+        return FakeResponse(pages[len(requests_made) - 1])
+
+    monkeypatch.setattr(tibber.requests, "post", fake_post)
+
+    assert tibber.sync_tibber_consumption("token") == 2
+    assert requests_made[0] == {"last": tibber.INITIAL_HOURS}
+
+    assert tibber.sync_tibber_consumption("token") == 2
+    last_from = _node(1, 11, 0)["from"]
+    assert requests_made[1] == {"first": tibber.PAGE_SIZE, "after": base64.b64encode(last_from.encode()).decode()}
+    assert requests_made[2] == {"first": tibber.PAGE_SIZE, "after": "page2"}
+
+    monkeypatch.setattr(tibber, "ensure_tibber_sync", lambda token: None)
+    days = tibber.get_tibber_consumption("token", "day")["items"]
+    assert [(d["consumption"], d["hours"]) for d in days] == [(7.0, 2), (3.0, 2)]
+
+    months = tibber.get_tibber_consumption("token", "month")["items"]
+    assert months == [{"period": "2026-01", "consumption": 10.0, "cost": 20.0, "hours": 4}]
+
+
+class ImmediateThread:
+    """Runs the sync inline so the test does not depend on thread timing."""
+    def __init__(self, target, args, **kwargs):
+        self.target, self.args = target, args
+
+    def start(self):
+        self.target(*self.args)
+
+
+def test_failed_sync_backs_off(tmp_path, monkeypatch):
+    """A failing sync is not retried by every request, only after RETRY_INTERVAL."""
+    tibber.configure(tmp_path / "tibber.sqlite")
+    attempts = []
+
+    def failing_sync(token):
+        attempts.append(token)
+        raise RuntimeError("Tibber is down")
+
+    monkeypatch.setattr(tibber, "sync_tibber_consumption", failing_sync)
+    monkeypatch.setattr(tibber.threading, "Thread", ImmediateThread)
+
+    for _ in range(3):
+        tibber.ensure_tibber_sync("token")
+    assert attempts == ["token"]
+    assert not tibber._state["syncing"]
+
+    tibber._state["last_attempt"] -= tibber.RETRY_INTERVAL
+    tibber.ensure_tibber_sync("token")
+    assert len(attempts) == 2
@@ -0,0 +1,53 @@
+import json
+import os
+import sys
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'web')))
+
+from integration import timeplan
+
+
+def _write_plan(folder, name, plan):
+    (folder / f"{name}.json").write_text(json.dumps(plan), encoding="utf-8")
+
+
+def _week(subject):
+    return {day: [f"{subject} {day}"] for day in timeplan.WEEKDAYS}
+
+
+def test_plans_parsed_once_until_changed(tmp_path, monkeypatch):
+    """Repeated requests use the index; editing or adding a plan reloads it."""
+    timeplan._plan_index.clear()
+    builds = []
+    build_index = timeplan._build_index
+    monkeypatch.setattr(timeplan, "_build_index", lambda *args: builds.append(args) or build_index(*args))
+    _write_plan(tmp_path, "ola", _week("Matte"))
+    today = timeplan.get_dagens_dag()
+
+    first = timeplan.get_dagens_timeplaner(str(tmp_path))
+    timeplan.get_dagens_timeplaner(str(tmp_path))
+    _write_plan(tmp_path, "ola", _week("Norsk"))
+    edited = timeplan.get_dagens_timeplaner(str(tmp_path))
+    _write_plan(tmp_path, "kari", _week("Gym"))
+    added = timeplan.get_dagens_timeplaner(str(tmp_path))
+
+    assert first == {"ola": [f"Matte {today}"]}
+    assert edited == {"ola": [f"Norsk {today}"]}
+    assert added == {"kari": [f"Gym {today}"], "ola": [f"Norsk {today}"]}
+    assert len(builds) == 3
+
+
+def test_weekday_names_without_locale(tmp_path):
+    """Weekday keys come from the static Norwegian table; English keys still work."""
+    timeplan._plan_index.clear()
+    _write_plan(tmp_path, "per", {day: ["Engelsk"] for day in timeplan.WEEKDAYS_EN})
+    (tmp_path / "ødelagt.json").write_text("{", encoding="utf-8")
+    (tmp_path / "notater.txt").write_text("ikke en plan", encoding="utf-8")
+
+    plans = timeplan.get_dagens_timeplaner(str(tmp_path))
+
+    assert timeplan.get_dagens_dag() in timeplan.WEEKDAYS
+    assert plans["per"] == ["Engelsk"]
+    assert plans["ødelagt"][0].startswith("<Feil ved lesing")
+    assert set(plans) == {"per", "ødelagt"}
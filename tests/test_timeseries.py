@@ -0,0 +1,151 @@
+import os
+import sys
+import time
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'web')))
+
+from integration import timeseries
+from integration.timeseries import MINUTE, HOUR, DAY
+
+
+def test_rollups_aggregate_batched_readings(tmp_path):
+    """Readings land in raw samples and every rollup level with min/avg/max."""
+    timeseries.configure(tmp_path / "ts.sqlite")
+    start = int(time.time()) // HOUR * HOUR - HOUR
+
+    for i, value in enumerate([1.0, 2.0, 3.0, 6.0]):
+        timeseries.record("test.temp", value, start + i * 30)
+    timeseries.record("test.temp", None, start)  # ignored
+
+    raw = timeseries.query("test.temp", start, start + HOUR)
+    assert [row[1] for row in raw] == [1.0, 2.0, 3.0, 6.0]
+
+    minutes = timeseries.query("test.temp", start, start + HOUR, MINUTE)
+    assert minutes == [(start, 1.5, 1.0, 2.0), (start + MINUTE, 4.5, 3.0, 6.0)]
+
+    hours = timeseries.query("test.temp", start, start + HOUR, HOUR)
+    assert hours == [(start, 3.0, 1.0, 6.0)]
+
+
+def test_rollups_merge_across_flushes(tmp_path):
+    """A later batch for the same bucket updates the existing rollup row."""
+    timeseries.configure(tmp_path / "ts.sqlite")
+    start = int(time.time()) // HOUR * HOUR - HOUR
+
+    timeseries.record("test.power", 100, start)
+    timeseries.flush()
+    timeseries.record("test.power", 300, start + 10)
+    timeseries.flush()
+
+    assert timeseries.query("test.power", start, start + HOUR, HOUR) == [(start, 200.0, 100.0, 300.0)]
+
+
+def test_retention_prunes_old_levels(tmp_path):
+    """Raw samples expire before the rollups do."""
+    timeseries.configure(tmp_path / "ts.sqlite", retention={"samples": DAY, MINUTE: 2 * DAY})
+    now = int(time.time())
+    old = now - 3 * DAY
+
+    timeseries.record("test.co2", 500, old)
+    timeseries.flush()
+    timeseries.prune(now)
+
+    assert timeseries.query("test.co2", old - DAY, now) == []
+    assert timeseries.query("test.co2", old - DAY, now, MINUTE) == []
+    assert len(timeseries.query("test.co2", old - DAY, now, HOUR)) == 1
+
+
+def test_history_picks_coarsest_rollup(tmp_path):
+    """A daily step reads the day rollup; a 2-hour step regroups hourly rows."""
+    assert timeseries.pick_resolution(30) is None
+    assert timeseries.pick_resolution(5 * MINUTE) == MINUTE
+    assert timeseries.pick_resolution(2 * HOUR) == HOUR
+    assert timeseries.pick_resolution(7 * DAY) == DAY
+
+    timeseries.configure(tmp_path / "ts.sqlite")
+    start = int(time.time()) // HOUR * HOUR - 4 * HOUR
+    for hour, value in enumerate([1, 3, 5, 7]):
+        timeseries.record("test.price", value, start + hour * HOUR)
+
+    timestamps, values = timeseries.history("test.price", start, start + 4 * HOUR, 2 * HOUR)
+    assert timestamps == [start, start + 2 * HOUR]
+    assert values == [2.0, 6.0]
+
+    _, maxima = timeseries.history("test.price", start, start + 4 * HOUR, 2 * HOUR, agg="max")
+    assert maxima == [3.0, 7.0]
+
+
+def test_history_json_streams_several_metrics(tmp_path):
+    """The streamed document parses to compact t/v arrays per metric."""
+    import json
+
+    timeseries.configure(tmp_path / "ts.sqlite")
+    start = int(time.time()) // HOUR * HOUR - HOUR
+    timeseries.record("a", 1, start)
+    timeseries.record("b", 2, start)
+
+    chunks = list(timeseries.history_json(["a", "b", "missing"], start, start + HOUR, HOUR))
+    payload = json.loads("".join(chunks))
+
+    assert len(chunks) == 5
+    assert payload["resolution"] == HOUR
+    assert payload["metrics"]["a"] == {"t": [start], "v": [1.0]}
+    assert payload["metrics"]["b"] == {"t": [start], "v": [2.0]}
+    assert payload["metrics"]["missing"] == {"t": [], "v": []}
+
+
+def test_history_json_ends_with_error_when_a_query_fails(tmp_path, monkeypatch):
+    """A failure mid-stream still leaves a parseable document that says what went wrong."""
+    import json
+
+    timeseries.configure(tmp_path / "ts.sqlite")
+    start = int(time.time()) // HOUR * HOUR - HOUR
+    timeseries.record("a", 1, start)
+    history = timeseries.history
+
+    def failing_history(metric, *args, **kwargs):
+        if metric == "b":
+            raise RuntimeError("database is locked")
+        return history(metric, *args, **kwargs)
+
+    monkeypatch.setattr(timeseries, "history", failing_history)
+    payload = json.loads("".join(timeseries.history_json(["a", "b"], start, start + HOUR, HOUR)))
+
+    assert payload["metrics"] == {"a": {"t": [start], "v": [1.0]}}
+    assert payload["error"] == "database is locked"
+
+
+def _with_oslo_time(monkeypatch):
+    monkeypatch.setenv("TZ", "Europe/Oslo")
+    time.tzset()
+
+
+def test_daily_history_across_dst(tmp_path, monkeypatch):
+    """Daily buckets follow local midnight through both DST changes."""
+    _with_oslo_time(monkeypatch)
+    try:
+        from datetime import date, datetime, timedelta
+        timeseries.configure(tmp_path / "ts.sqlite", retention={DAY: None, HOUR: None, MINUTE: None, "samples": None})
+
+        for first in (date(2026, 3, 25), date(2026, 10, 21)):
+            days = [first + timedelta(days=i) for i in range(10)]
+            for day in days:
+                timeseries.record("test.daily", day.day, datetime(day.year, day.month, day.day, 12).timestamp())
+            start = datetime(first.year, first.month, first.day).timestamp()
+            end = datetime(days[-1].year, days[-1].month, days[-1].day).timestamp() + DAY
+
+            timestamps, values = timeseries.history("test.daily", start, end, DAY)
+            assert values == [float(day.day) for day in days]
+            assert [datetime.fromtimestamp(ts) for ts in timestamps] == [
+                datetime(day.year, day.month, day.day) for day in days
+            ]
+
+            weekly_ts, weekly = timeseries.history("test.daily", start, end, 7 * DAY, agg="max")
+            assert [datetime.fromtimestamp(ts) for ts in weekly_ts] == [
+                datetime(first.year, first.month, first.day), datetime(days[7].year, days[7].month, days[7].day)
+            ]
+            assert weekly == [float(days[6].day), float(days[9].day)]
+    finally:
+        monkeypatch.undo()
+        time.tzset()
@@ -0,0 +1,123 @@
+import json
+import os
+import sys
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'web')))
+
+from integration import waste
+
+
+def _answer(restavfall, papir):
+    return {"data": {"result": [{"HentePunkts": [{"Tjenester": [
+        {"Fraksjon": {"Tekst": "Restavfall"}, "TommeDato": restavfall.strftime("%d.%m.%Y"),
+         "HenteHyppighet": {"Tekst": "Hver 2. uke"}},
+        {"Fraksjon": {"Tekst": "Papir"}, "TommeDato": papir.strftime("%d.%m.%Y"),
+         "HenteHyppighet": {"Tekst": "Hver 4. uke"}},
+        {"Fraksjon": {"Tekst": "Glass og metall"}, "TommeDato": "01.01.2030",
+         "HenteHyppighet": {"Tekst": "Hver 8. uke"}},
+    ]}]}]}}
+
+
+class FakeKommuneHandler(BaseHTTPRequestHandler):
+    """Stand-in for Oslo kommune's ren.search service."""
+    answer = {}
+    requests_seen = []
+
+    def do_GET(self):
+        self.requests_seen.append(self.path)
+        body = json.dumps(self.answer).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _start_fake_kommune(fake_server, monkeypatch, tmp_path, answer):
+    server = fake_server(FakeKommuneHandler)
+    FakeKommuneHandler.answer = answer
+    FakeKommuneHandler.requests_seen = []
+    waste._waste_cache.clear()
+    waste._failures.clear()
+    monkeypatch.setattr(waste, "_base_dir", lambda: tmp_path)
+    return server, f"http://127.0.0.1:{server.server_address[1]}/ren"
+
+
+def test_frequency_text():
+    assert waste._frequency_weeks("Hver 4. uke") == 4
+    assert waste._frequency_weeks("Hver uke") == 1
+    assert waste._frequency_weeks("Etter bestilling") is None
+
+
+def test_schedule_cached_until_next_pickup(fake_server, monkeypatch, tmp_path):
+    """Repeated calls and a restart are served from the cache, which expires after the earliest pickup."""
+    today = date.today()
+    _, url = _start_fake_kommune(fake_server, monkeypatch, tmp_path, _answer(today + timedelta(days=3), today + timedelta(days=10)))
+    first = waste.get_garbage(url)
+    waste.get_garbage(url)
+    waste._waste_cache.clear()   # som etter omstart: leses fra disk
+    from_disk = waste.get_garbage(url)
+
+    assert first == from_disk == {
+        "Restavfall": (today + timedelta(days=3)).strftime("%d.%m.%Y"),
+        "Papir": (today + timedelta(days=10)).strftime("%d.%m.%Y"),
+    }
+    assert len(FakeKommuneHandler.requests_seen) == 1
+    cached = json.loads((tmp_path / "data" / "waste" / "schedule.json").read_text(encoding="utf-8"))
+    assert date.fromtimestamp(cached["expires"]) == today + timedelta(days=4)
+
+
+def test_expired_cache_refetches_and_falls_back_when_unreachable(fake_server, monkeypatch, tmp_path):
+    """An expired entry is refreshed; if the kommune is down the old plan is still served."""
+    today = date.today()
+    server, url = _start_fake_kommune(fake_server, monkeypatch, tmp_path, _answer(today, today))
+    try:
+        waste.get_garbage(url)
+        waste._waste_cache[url]["expires"] = 0
+        waste.get_garbage(url)
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert len(FakeKommuneHandler.requests_seen) == 2
+
+    waste._waste_cache[url]["expires"] = 0
+    assert waste.get_garbage(url)["Restavfall"] == today.strftime("%d.%m.%Y")
+
+
+def test_failed_fetch_is_not_retried_until_backoff_expires(monkeypatch, tmp_path):
+    """While the kommune is down only one request per FAILURE_RETRY is made."""
+    attempts = []
+
+    def failing_get(url, **kwargs):
+        attempts.append(url)
+        raise waste.requests.ConnectionError("down")
+
+    waste._waste_cache.clear()
+    waste._failures.clear()
+    monkeypatch.setattr(waste, "_base_dir", lambda: tmp_path)
+    monkeypatch.setattr(waste.requests, "get", failing_get)
+
+    assert waste.get_garbage("http://kommune/ren") == {"error": "Failed to fetch data"}
+    assert waste.get_garbage("http://kommune/ren") == {"error": "Failed to fetch data"}
+    assert len(attempts) == 1
+
+    waste._failures["http://kommune/ren"] -= waste.FAILURE_RETRY
+    waste.get_garbage("http://kommune/ren")
+    assert len(attempts) == 2
+
+
+def test_multi_week_schedule_from_frequency(fake_server, monkeypatch, tmp_path):
+    """Future and earlier dates in the same rhythm are derived without more calls."""
+    monday = date.today() - timedelta(days=date.today().weekday())
+    _, url = _start_fake_kommune(fake_server, monkeypatch, tmp_path, _answer(monday + timedelta(days=16), monday + timedelta(days=2)))
+    schedule = waste.get_garbage_schedule(url, start=monday, weeks=8)
+
+    assert schedule["Restavfall"] == [(monday + timedelta(days=d)).strftime("%d.%m.%Y") for d in (2, 16, 30, 44)]
+    assert schedule["Papir"] == [(monday + timedelta(days=d)).strftime("%d.%m.%Y") for d in (2, 30)]
+    assert "Glass og metall" not in schedule
+    assert len(FakeKommuneHandler.requests_seen) == 1
@@ -0,0 +1,183 @@
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'web')))
+
+from integration import weather
+
+LAST_MODIFIED = "Mon, 06 Jan 2025 10:00:00 GMT"
+
+
+def _timeseries(temperature, hours=6):
+    """Hourly met.no-style entries starting at the current hour, with fields we don't serve."""
+    start = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    return {"properties": {"timeseries": [
+        {
+            "time": (start + timedelta(hours=i)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "data": {
+                "instant": {"details": {"air_temperature": temperature + i, "wind_speed": 3.0, "dew_point_temperature": -1.0}},
+                "next_1_hours": {"summary": {"symbol_code": "cloudy"}, "details": {"precipitation_amount": 0.2}},
+                "next_6_hours": {"summary": {"symbol_code": "rain"}, "details": {"precipitation_amount": 1.5}},
+                "next_12_hours": {"summary": {"symbol_code": "rain"}},
+            },
+        }
+        for i in range(hours)
+    ]}}
+
+
+class FakeMetHandler(BaseHTTPRequestHandler):
+    """Stand-in for api.met.no that honours If-Modified-Since."""
+    requests_seen = []
+    expires_in = 1800
+    delay = 0
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        product = "nowcast" if "nowcast" in self.path else "locationforecast"
+        conditional = self.headers.get("If-Modified-Since")
+        self.requests_seen.append((product, conditional))
+
+        expires = formatdate(time.time() + self.expires_in, usegmt=True)
+        if conditional == LAST_MODIFIED:
+            self.send_response(304)
+            self.send_header("Expires", expires)
+            self.end_headers()
+            return
+
+        body = json.dumps(_timeseries(5.0 if product == "nowcast" else 3.0)).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Expires", expires)
+        self.send_header("Last-Modified", LAST_MODIFIED)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _start_fake_met(fake_server, monkeypatch, tmp_path, expires_in=1800, delay=0):
+    server = fake_server(FakeMetHandler)
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+
+    FakeMetHandler.requests_seen = []
+    FakeMetHandler.expires_in = expires_in
+    FakeMetHandler.delay = delay
+    weather._weather_cache.clear()
+    weather._failures.clear()
+    monkeypatch.setattr(weather, "_base_dir", lambda: tmp_path)
+    monkeypatch.setattr(weather, "PRODUCT_URLS", {
+        "locationforecast": f"{base}/locationforecast",
+        "nowcast": f"{base}/nowcast",
+    })
+    return server
+
+
+def test_weather_served_from_cache_until_expires(fake_server, tmp_path, monkeypatch):
+    """Repeated calls do not hit met.no before the Expires time."""
+    _start_fake_met(fake_server, monkeypatch, tmp_path)
+    first = weather.get_weather(59.9, 10.7)
+    second = weather.get_weather(59.9, 10.7)
+
+    assert first["data"]["instant"]["details"]["air_temperature"] == 5.0
+    assert second == first
+    assert len(FakeMetHandler.requests_seen) == 2
+
+
+def test_expired_entry_revalidates_with_if_modified_since(fake_server, tmp_path, monkeypatch):
+    """After Expires the cache sends If-Modified-Since and keeps its data on 304."""
+    _start_fake_met(fake_server, monkeypatch, tmp_path, expires_in=-10)
+    weather.get_weather(59.9, 10.7)
+    data = weather.get_weather(59.9, 10.7)
+
+    assert sorted(FakeMetHandler.requests_seen[2:]) == [("locationforecast", LAST_MODIFIED), ("nowcast", LAST_MODIFIED)]
+    assert data["data"]["instant"]["details"]["air_temperature"] == 5.0
+
+
+def test_cache_survives_restart(fake_server, tmp_path, monkeypatch):
+    """Entries on disk are used after the in-memory cache is lost."""
+    _start_fake_met(fake_server, monkeypatch, tmp_path)
+    weather.get_weather(59.9, 10.7)
+    weather._weather_cache.clear()
+    data = weather.get_weather(59.9, 10.7)
+
+    assert len(FakeMetHandler.requests_seen) == 2
+    assert (tmp_path / "data" / "weather").is_dir()
+    assert data["data"]["instant"]["details"]["air_temperature"] == 5.0
+
+
+def test_products_fetched_concurrently_and_trimmed(fake_server, tmp_path, monkeypatch):
+    """Forecast and nowcast are requested in parallel and only served fields are kept."""
+    _start_fake_met(fake_server, monkeypatch, tmp_path, delay=0.3)
+    started = time.time()
+    data = weather.get_weather(59.9, 10.7)["data"]
+    elapsed = time.time() - started
+
+    assert elapsed < 0.55
+    assert data["instant"]["details"] == {"air_temperature": 5.0, "wind_speed": 3.0}
+    assert data["next_1_hours"]["summary"]["symbol_code"] == "cloudy"
+    assert data["next_6_hours"]["details"]["precipitation_amount"] == 1.5
+    assert "next_12_hours" not in data
+
+
+def test_forecast_returns_requested_hours(fake_server, tmp_path, monkeypatch):
+    """The forecast is sliced from the cached series starting at the current hour."""
+    _start_fake_met(fake_server, monkeypatch, tmp_path)
+    forecast = weather.get_weather_forecast(59.9, 10.7, hours=3)
+    again = weather.get_weather_forecast(59.9, 10.7, hours=5)
+
+    temperatures = [e["data"]["instant"]["details"]["air_temperature"] for e in forecast["timeseries"]]
+    assert temperatures == [3.0, 4.0, 5.0]
+    assert len(again["timeseries"]) == 5
+    assert len(FakeMetHandler.requests_seen) == 1
+
+
+def test_simultaneous_requests_are_coalesced(fake_server, tmp_path, monkeypatch):
+    """Calls for the same rounded coordinates share one upstream request."""
+    _start_fake_met(fake_server, monkeypatch, tmp_path, delay=0.3)
+    results = []
+    coordinates = [(59.91234, 10.75), (59.912341, 10.75), (59.9123401, 10.75000004)]
+    threads = [
+        threading.Thread(target=lambda lat=lat, lon=lon: results.append(weather.get_weather_forecast(lat, lon, 2)))
+        for lat, lon in coordinates
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(results) == 3
+    assert all(len(r["timeseries"]) == 2 for r in results)
+    assert len(FakeMetHandler.requests_seen) == 1
+    assert weather._inflight == {}
+
+
+def test_failed_request_backs_off(tmp_path, monkeypatch):
+    """After met.no fails, the same point is not requested again until FAILURE_RETRY has passed."""
+    attempts = []
+
+    def failing_get(url, **kwargs):
+        attempts.append(url)
+        raise weather.requests.ConnectionError("down")
+
+    weather._weather_cache.clear()
+    weather._failures.clear()
+    monkeypatch.setattr(weather, "_base_dir", lambda: tmp_path)
+    monkeypatch.setattr(weather.requests, "get", failing_get)
+
+    assert "error" in weather.get_weather(59.9, 10.7)
+    assert "error" in weather.get_weather(59.9, 10.7)
+    assert len(attempts) == 2   # ett per produkt
+
+    for key in weather._failures:
+        weather._failures[key] -= weather.FAILURE_RETRY
+    weather.get_weather(59.9, 10.7)
+    assert len(attempts) == 4
+
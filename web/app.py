@@ -1,11 +1,20 @@
 from flask import Flask, send_from_directory, render_template, jsonify
 from routes import routes
 from config import CONFIG
+from integration.heating import start_heating_scheduler
 
 
 app = Flask(__name__)
 app.register_blueprint(routes)
 
+@app.before_request
+def start_heating():
+    # Prisstyrt senking av Mill-ovnene når HEATING er aktivert i config.json.
+    # Startes ved første forespørsel, så bare serverprosessen kjører planleggeren
+    # (Werkzeug-reloaderen importerer app.py også i overvåkingsprosessen).
+    if CONFIG.get("HEATING", {}).get("enabled"):
+        start_heating_scheduler(CONFIG["HEATING"], CONFIG["MILL_USERNAME"], CONFIG["MILL_PASSWORD"])
+
 @app.route("/")
 def home():
     return render_template("index.html")
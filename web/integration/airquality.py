@@ -0,0 +1,121 @@
+import logging
+import threading
+import time
+from collections import deque
+from config import CONFIG
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Regler: "above"/"clear_below" gir terskel med hysterese, "rate_above"/"clear_rate_below"
+# gir endring per time over "window" sekunder. Overstyres av CONFIG['AIRTHINGS_ALERTS'].
+DEFAULT_RULES = [
+    {"id": "radon_high", "field": "radon_24h", "above": 100, "clear_below": 80, "level": "warning",
+     "message": "Radon over tiltaksgrensen"},
+    {"id": "radon_critical", "field": "radon_24h", "above": 200, "clear_below": 180, "level": "critical",
+     "message": "Radon over maksgrensen"},
+    {"id": "co2_high", "field": "co2", "above": 1000, "clear_below": 800, "level": "warning",
+     "message": "Høy CO2 – luft ut"},
+    {"id": "co2_critical", "field": "co2", "above": 1500, "clear_below": 1200, "level": "critical",
+     "message": "Svært høy CO2"},
+    {"id": "voc_high", "field": "voc", "above": 2000, "clear_below": 1500, "level": "warning",
+     "message": "Høy VOC"},
+    {"id": "co2_rising", "field": "co2", "rate_above": 400, "clear_rate_below": 100, "window": 3600,
+     "level": "info", "message": "CO2 stiger raskt"},
+]
+
+LEVELS = {"critical": 0, "warning": 1, "info": 2}
+WINDOW_SIZE = 64            # avlesninger per sensor; ved 5 min mellom dem er det over 5 timer
+MIN_RATE_SPAN = 10 * 60     # minst 10 minutter mellom første og siste punkt før stigningstakt brukes
+
+# Rullerende vindu per (enhet, felt) og aktive varsler per (enhet, regel).
+# Versjonen starter på oppstartstidspunktet så ETag ikke gjenbrukes etter omstart.
+_windows = {}
+_active = {}
+_state = {"version": int(time.time())}
+_lock = threading.Lock()
+
+
+def _rules():
+    return CONFIG.get("AIRTHINGS_ALERTS", DEFAULT_RULES)
+
+
+def _rate_per_hour(window, span, now):
+    """Change per hour between the oldest reading inside span and the newest."""
+    points = [(ts, value) for ts, value in window if now - ts <= span]
+    if len(points) < 2:
+        return None
+    (first_ts, first), (last_ts, last) = points[0], points[-1]
+    if last_ts - first_ts < MIN_RATE_SPAN:
+        return None
+    return (last - first) / (last_ts - first_ts) * 3600
+
+
+def _rule_value(rule, device, now):
+    window = _windows.get((device, rule["field"]))
+    if not window:
+        return None
+    if "rate_above" in rule:
+        return _rate_per_hour(window, rule.get("window", 3600), now)
+    return window[-1][1]
+
+
+def _check(rule, value, active):
+    """Return the new active state for rule given value, with hysteresis."""
+    if value is None:
+        return active
+    if "rate_above" in rule:
+        above, clear_below = rule["rate_above"], rule.get("clear_rate_below", rule["rate_above"])
+    else:
+        above, clear_below = rule["above"], rule.get("clear_below", rule["above"])
+    if active:
+        return value >= clear_below
+    return value > above
+
+
+def evaluate_reading(device, reading, now=None):
+    """
+    Add one reading to the device's rolling windows and re-evaluate all rules.
+    Returns a list of (rule id, "raised" | "cleared") transitions.
+    """
+    now = time.time() if now is None else now
+    transitions = []
+
+    with _lock:
+        for field, value in reading.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                _windows.setdefault((device, field), deque(maxlen=WINDOW_SIZE)).append((now, value))
+
+        for rule in _rules():
+            key = (device, rule["id"])
+            value = _rule_value(rule, device, now)
+            was_active = key in _active
+            is_active = _check(rule, value, was_active)
+
+            if is_active and not was_active:
+                _active[key] = {
+                    "id": rule["id"],
+                    "device": device,
+                    "field": rule["field"],
+                    "level": rule.get("level", "warning"),
+                    "message": rule.get("message", rule["id"]),
+                    "value": round(value, 1),
+                    "since": int(now),
+                }
+                transitions.append((rule["id"], "raised"))
+            elif was_active and not is_active:
+                del _active[key]
+                transitions.append((rule["id"], "cleared"))
+
+        if transitions:
+            _state["version"] += 1
+
+    for rule_id, change in transitions:
+        logging.info(f"Air quality alert {rule_id} {change} for {device}")
+    return transitions
+
+
+def get_active_alerts():
+    """Return {"version", "alerts"}; version changes only when an alert is raised or cleared."""
+    with _lock:
+        alerts = sorted(_active.values(), key=lambda a: (LEVELS.get(a["level"], len(LEVELS)), a["since"]))
+        return {"version": _state["version"], "alerts": alerts}
@@ -1,80 +1,202 @@
 import asyncio
 import logging
+import time
+from integration.timeseries import record_many
+from integration.airquality import evaluate_reading
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
-async def get_airthings_data(mac_address):
+SCAN_TIMEOUT = 10
+READ_TTL = 5 * 60           # Wave-enhetene oppdaterer sensorene omtrent hvert 5. minutt
+ADAPTER_CONCURRENCY = 1     # BlueZ takler dårlig flere samtidige tilkoblinger per adapter
+FAILURE_BACKOFF = 60        # en enhet som ikke svarte, skannes ikke igjen før etter dette
+
+RECORDED_FIELDS = ("temperature", "humidity", "radon_24h", "radon_longterm", "co2", "voc", "pressure")
+
+# Siste avlesning per MAC-adresse: {"time": epoch, "data": {...}}
+_device_cache = {}
+# Siste mislykkede forsøk per MAC-adresse: {"time": epoch, "error": str}
+_failure_cache = {}
+
+
+def _format_reading(data):
+    """Flatten an airthings-ble device reading into the dashboard's field names."""
+    sensors = data.sensors
+    return {
+        "device": data.name,
+        "manufacturer": data.manufacturer,
+        "temperature": sensors.get('temperature'),
+        "humidity": sensors.get('humidity'),
+        "radon_24h": sensors.get('radon_1day_avg'),
+        "radon_24h_level": sensors.get('radon_1day_level'),
+        "radon_longterm": sensors.get('radon_longterm_avg'),
+        "radon_longterm_level": sensors.get('radon_longterm_level'),
+        "co2": sensors.get('co2'),
+        "voc": sensors.get('voc'),
+        "pressure": sensors.get('pressure'),
+        "battery": sensors.get('battery'),
+        "illuminance": sensors.get('illuminance')
+    }
+
+
+async def _scan(mac_addresses, adapter=None):
     """
-    Fetch sensor data from Airthings Wave device via Bluetooth
-    
+    Run one BLE scan on `adapter` (e.g. "hci1", None = default) for all wanted
+    devices and return {MAC: BLEDevice}. The scan stops as soon as every
+    address has been seen. A device found on an adapter is also connected
+    through it.
+    """
+    from bleak import BleakScanner
+
+    wanted = {mac.upper() for mac in mac_addresses}
+    found = {}
+    all_found = asyncio.Event()
+
+    def on_detect(device, advertisement_data):
+        address = device.address.upper()
+        if address in wanted and address not in found:
+            found[address] = device
+            logging.info(f"Found device: {device.name or 'Unknown'} ({address})")
+            if len(found) == len(wanted):
+                all_found.set()
+
+    kwargs = {"adapter": adapter} if adapter else {}
+    async with BleakScanner(detection_callback=on_detect, **kwargs):
+        try:
+            await asyncio.wait_for(all_found.wait(), SCAN_TIMEOUT)
+        except asyncio.TimeoutError:
+            pass
+
+    return found
+
+
+async def _scan_adapters(devices):
+    """Scan each configured adapter for its devices concurrently; returns {MAC: BLEDevice}."""
+    by_adapter = {}
+    for device in devices:
+        by_adapter.setdefault(device.get("adapter"), []).append(device["mac"])
+
+    found = {}
+    for result in await asyncio.gather(*(_scan(macs, adapter) for adapter, macs in by_adapter.items())):
+        found.update(result)
+    return found
+
+
+def _adapter_of(ble_device):
+    """The adapter a BLEDevice was found on, from its BlueZ object path (/org/bluez/hci0/dev_...)."""
+    details = getattr(ble_device, "details", None)
+    path = details.get("path") if isinstance(details, dict) else None
+    if path and path.startswith("/org/bluez/"):
+        return path.split("/")[3]
+    return None
+
+
+async def _read_device(ble_device):
+    """Connect to one Wave device and return its formatted reading."""
+    from airthings_ble import AirthingsBluetoothDeviceData
+
+    airthings = AirthingsBluetoothDeviceData(logger=logging.getLogger(__name__))
+    data = await airthings.update_device(ble_device)
+    return _format_reading(data)
+
+
+async def _read_devices(devices, found):
+    """
+    Read every device in `devices` that the scan found, concurrently across
+    adapters but at most ADAPTER_CONCURRENCY at a time on the same adapter.
+    The limit follows the adapter that actually found the device, not the
+    configured label. Returns {MAC: reading or {"error": ...}}.
+    """
+    semaphores = {}
+
+    async def read(device):
+        mac = device["mac"].upper()
+        ble_device = found.get(mac)
+        if ble_device is None:
+            logging.error(f"Device {mac} not found during scan")
+            return mac, {"error": "Device not found - check if it's powered on and in range"}
+
+        adapter = _adapter_of(ble_device) or device.get("adapter")
+        async with semaphores.setdefault(adapter, asyncio.Semaphore(ADAPTER_CONCURRENCY)):
+            try:
+                logging.info(f"Reading sensor data from {mac}...")
+                return mac, await _read_device(ble_device)
+            except Exception as e:
+                logging.error(f"Error reading Airthings data from {mac}: {e}")
+                return mac, {"error": str(e)}
+
+    return dict(await asyncio.gather(*(read(device) for device in devices)))
+
+
+async def get_airthings_data(devices):
+    """
+    Fetch sensor data from one or more Airthings Wave devices via Bluetooth
+
     Args:
-        mac_address: Bluetooth MAC/UUID address of the Airthings device
-        
+        devices: list of {"mac": ..., "name": ..., "adapter": ...} dicts; only
+                 "mac" is required
+
     Returns:
-        dict with sensor data or error message
+        dict with the first device's readings at the top level and every
+        device under "devices", or an error message
     """
-    try:
-        from airthings_ble import AirthingsBluetoothDeviceData
-        from bleak import BleakScanner
-    except ImportError:
-        logging.error("airthings-ble or bleak not installed")
-        return {"error": "Airthings BLE library not installed"}
-    
-    try:
-        # Create logger
-        logger = logging.getLogger(__name__)
-        
-        # Discover the device to get BLEDevice object
-        logging.info(f"Discovering Airthings device at {mac_address}...")
-        devices = await BleakScanner.discover(timeout=10, return_adv=True)
-        
-        ble_device = None
-        for addr, (dev, adv_data) in devices.items():
-            if addr.upper() == mac_address.upper():
-                ble_device = dev
-                logging.info(f"Found device: {dev.name or 'Unknown'}")
-                break
-        
-        if not ble_device:
-            logging.error(f"Device {mac_address} not found during scan")
-            return {"error": "Device not found - check if it's powered on and in range"}
-        
-        # Create Airthings BLE data handler
-        airthings = AirthingsBluetoothDeviceData(logger=logger)
-        
-        # Update data from device
-        logging.info("Reading sensor data...")
-        data = await airthings.update_device(ble_device)
-        
-        # Extract sensor data
-        sensors = data.sensors
-        
-        # Return formatted data
-        result = {
-            "device": data.name,
-            "manufacturer": data.manufacturer,
-            "temperature": sensors.get('temperature'),
-            "humidity": sensors.get('humidity'),
-            "radon_24h": sensors.get('radon_1day_avg'),
-            "radon_24h_level": sensors.get('radon_1day_level'),
-            "radon_longterm": sensors.get('radon_longterm_avg'),
-            "radon_longterm_level": sensors.get('radon_longterm_level'),
-            "co2": sensors.get('co2'),
-            "voc": sensors.get('voc'),
-            "pressure": sensors.get('pressure'),
-            "battery": sensors.get('battery'),
-            "illuminance": sensors.get('illuminance')
-        }
-        
-        logging.info("Successfully retrieved Airthings data")
-        return result
-        
-    except Exception as e:
-        logging.error(f"Error reading Airthings data: {e}")
-        return {"error": str(e)}
-
-def get_airthings(mac_address):
+    now = time.time()
+
+    def due(device):
+        mac = device["mac"].upper()
+        return (now - _device_cache.get(mac, {}).get("time", 0) >= READ_TTL
+                and now - _failure_cache.get(mac, {}).get("time", 0) >= FAILURE_BACKOFF)
+
+    stale = [d for d in devices if due(d)]
+
+    if stale:
+        try:
+            found = await _scan_adapters(stale)
+            readings = await _read_devices(stale, found)
+        except ImportError:
+            logging.error("airthings-ble or bleak not installed")
+            readings = {d["mac"].upper(): {"error": "Airthings BLE library not installed"} for d in stale}
+        except Exception as e:
+            logging.error(f"Error scanning for Airthings devices: {e}")
+            readings = {d["mac"].upper(): {"error": str(e)} for d in stale}
+
+        for device in stale:
+            mac = device["mac"].upper()
+            reading = readings[mac]
+            if "error" in reading:
+                _failure_cache[mac] = {"time": now, "error": reading["error"]}
+                continue
+            _device_cache[mac] = {"time": now, "data": reading}
+            _failure_cache.pop(mac, None)
+
+            name = device.get("name")
+            record_many(f"airthings.{name}" if name else "airthings", {key: reading[key] for key in RECORDED_FIELDS})
+            evaluate_reading(name or mac, reading, now)
+
+    # En eldre avlesning vises fortsatt når en ny feilet, men merkes som utdatert
+    result_devices = []
+    for device in devices:
+        mac = device["mac"].upper()
+        cached = _device_cache.get(mac)
+        if cached:
+            reading = {**cached["data"], "updated": cached["time"], "stale": now - cached["time"] >= READ_TTL}
+        else:
+            reading = {"error": _failure_cache.get(mac, {}).get("error", "No reading")}
+        result_devices.append({"name": device.get("name") or reading.get("device"), "mac": mac, **reading})
+
+    ok = [d for d in result_devices if "error" not in d]
+    if not ok:
+        return {"error": result_devices[0]["error"] if result_devices else "No Airthings devices configured"}
+
+    logging.info(f"Airthings data for {len(ok)}/{len(result_devices)} devices")
+    return {**ok[0], "devices": result_devices}
+
+
+def get_airthings(devices):
     """
-    Synchronous wrapper for get_airthings_data
+    Synchronous wrapper for get_airthings_data. Accepts a single MAC address
+    for compatibility with AIRTHINGS_MAC.
     """
-    return asyncio.run(get_airthings_data(mac_address))
+    if isinstance(devices, str):
+        devices = [{"mac": devices}]
+    return asyncio.run(get_airthings_data(devices))
@@ -4,10 +4,159 @@ from datetime import datetime, timedelta, date
 import requests
 import re
 import logging
+from integration.holidays import public_holidays, easter_sunday
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
 
+# Ukeindeks per kildefil: {path: {"mtime": ..., "year": ..., "index": {(iso_year, iso_week): [events]}}}
+_week_index_cache = {}
+
+
+def _holiday_entries(holidays, year):
+    """
+    Yield (date, event) pairs for every holiday in the given calendar year:
+    the computed public holidays merged with the school holidays and other
+    days listed in the JSON file.
+    """
+    seen = set()
+    for event_date, event in _file_holiday_entries(holidays, year):
+        seen.add((event_date, event["summary"]))
+        yield event_date, event
+
+    for event_date, day_holidays in public_holidays(year).items():
+        for holiday in day_holidays:
+            summary = f"{holiday['icon']} {holiday['name']}"
+            if (event_date, summary) not in seen:
+                yield event_date, _holiday_event(summary, event_date)
+
+
+def _file_holiday_entries(holidays, year):
+    for holiday in holidays:
+        name = holiday.get('name', 'Ukjent')
+        icon = holiday.get('icon', '📅')
+        date_str = holiday.get('date')
+        week_num = holiday.get('week')
+        easter_offset = holiday.get('easter_offset')
+        duration = holiday.get('duration', 1)
+        summary = f"{icon} {name}"
+
+        # Easter-relative weeks (e.g., Påskeferie) land on the ISO week of Easter + offset days
+        if easter_offset is not None:
+            week_num = (easter_sunday(year) + timedelta(days=easter_offset)).isocalendar()[1]
+
+        # Handle week-based holidays (e.g., Vinterferie uke 8)
+        if week_num:
+            for week_offset in range(duration):
+                for day_offset in range(1, 6):  # Monday to Friday
+                    try:
+                        event_date = date.fromisocalendar(year, week_num + week_offset, day_offset)
+                    except ValueError:
+                        break
+                    yield event_date, _holiday_event(summary, event_date)
+
+        # Handle date-based holidays (MM-DD format)
+        elif date_str:
+            try:
+                month, day = map(int, date_str.split('-'))
+                event_date = date(year, month, day)
+            except (ValueError, TypeError):
+                logging.warning(f"Invalid date format for {name}: {date_str}")
+                continue
+            yield event_date, _holiday_event(summary, event_date)
+
+
+def _holiday_event(summary, event_date):
+    return {
+        "summary": summary,
+        "start": event_date.strftime("%Y-%m-%d 00:00:00"),
+        "weekday_index": event_date.weekday(),
+        "is_holiday": True
+    }
+
+
+def _anniversary(birth_date, year):
+    """The birthday in the given year; 29 February is celebrated on the 28th in other years."""
+    try:
+        return birth_date.replace(year=year)
+    except ValueError:
+        return date(year, 2, 28)
+
+
+def _birthday_entries(birthdays, year):
+    """Yield (date, event) pairs for every birthday in the given calendar year."""
+    for person in birthdays:
+        name = person.get('name', 'Ukjent')
+        birth_date_str = person.get('date')
+
+        if not birth_date_str:
+            continue
+
+        # Parse date string (format: YYYY-MM-DD)
+        try:
+            birth_date = datetime.strptime(birth_date_str, '%Y-%m-%d').date()
+        except ValueError:
+            logging.warning(f"Invalid date format for {name}: {birth_date_str}")
+            continue
+        birthday_date = _anniversary(birth_date, year)
+
+        # Calculate age if birth year is known
+        age = birthday_date.year - birth_date.year
+
+        # Format summary
+        if age > 0:
+            summary = f"🎂 {name} ({age} år)"
+        else:
+            summary = f"🎂 {name}"
+
+        yield birthday_date, {
+            "summary": summary,
+            "start": birthday_date.strftime("%Y-%m-%d 00:00:00"),
+            "weekday_index": birthday_date.weekday(),
+            "is_birthday": True
+        }
+
+
+def _load_week_index(path, entries_for_year):
+    """
+    Return an index mapping (iso_year, iso_week) to ready-made events for the
+    file at path. The index covers last, this and next year and is only rebuilt
+    when the file's mtime or the current year changes.
+    """
+    mtime = os.stat(path).st_mtime_ns
+    year = date.today().year
+
+    cached = _week_index_cache.get(path)
+    if cached and cached["mtime"] == mtime and cached["year"] == year:
+        return cached["index"]
+
+    with open(path, 'r', encoding='utf-8') as f:
+        entries = json.load(f)
+
+    index = {}
+    for index_year in range(year - 1, year + 2):
+        for event_date, event in entries_for_year(entries, index_year):
+            iso_year, iso_week, _ = event_date.isocalendar()
+            index.setdefault((iso_year, iso_week), []).append(event)
+
+    _week_index_cache[path] = {"mtime": mtime, "year": year, "index": index}
+    logging.info(f"Built week index for {path} ({len(index)} weeks)")
+    return index
+
+
+def _events_this_and_next_week(index):
+    """Look up this week's and next week's events and tag them with week_offset."""
+    today = date.today()
+    events = []
+
+    for week_offset, day in enumerate((today, today + timedelta(days=7))):
+        iso_year, iso_week, _ = day.isocalendar()
+        for event in index.get((iso_year, iso_week), []):
+            events.append({**event, "week_offset": week_offset})
+
+    return events
+
+
 def get_holidays_week(holidays_file):
     """
     Read holidays from JSON file and return holidays for this week and next week
@@ -17,100 +166,10 @@ def get_holidays_week(holidays_file):
         if not os.path.exists(holidays_file):
             logging.error(f"Holidays file not found: {holidays_file}")
             return []
-        
-        with open(holidays_file, 'r', encoding='utf-8') as f:
-            holidays = json.load(f)
-        
-        today = date.today()
-        this_iso_year, this_iso_week, _ = today.isocalendar()
-        next_iso_week = this_iso_week + 1
-        
-        holiday_events = []
-        
-        for holiday in holidays:
-            name = holiday.get('name', 'Ukjent')
-            icon = holiday.get('icon', '📅')
-            date_str = holiday.get('date')
-            week_num = holiday.get('week')
-            duration = holiday.get('duration', 1)
-            
-            # Handle week-based holidays (e.g., Vinterferie uke 8)
-            if week_num:
-                # Check if this holiday week matches current or next week
-                for week_offset in range(duration):
-                    check_week = week_num + week_offset
-                    
-                    if check_week == this_iso_week:
-                        # Find Monday of this week
-                        days_since_monday = today.weekday()
-                        monday = today - timedelta(days=days_since_monday)
-                        
-                        # Add event for each day of the week
-                        for day_offset in range(5):  # Monday to Friday
-                            event_date = monday + timedelta(days=day_offset)
-                            
-                            holiday_events.append({
-                                "summary": f"{icon} {name}",
-                                "start": event_date.strftime("%Y-%m-%d 00:00:00"),
-                                "weekday_index": event_date.weekday(),
-                                "week_offset": 0,
-                                "is_holiday": True
-                            })
-                    
-                    elif check_week == next_iso_week:
-                        # Find Monday of next week
-                        days_until_next_monday = 7 - today.weekday()
-                        next_monday = today + timedelta(days=days_until_next_monday)
-                        
-                        # Add event for each day of the week
-                        for day_offset in range(5):  # Monday to Friday
-                            event_date = next_monday + timedelta(days=day_offset)
-                            
-                            holiday_events.append({
-                                "summary": f"{icon} {name}",
-                                "start": event_date.strftime("%Y-%m-%d 00:00:00"),
-                                "weekday_index": event_date.weekday(),
-                                "week_offset": 1,
-                                "is_holiday": True
-                            })
-            
-            # Handle date-based holidays (MM-DD format)
-            elif date_str:
-                try:
-                    month, day = map(int, date_str.split('-'))
-                    
-                    # Check this year and next year
-                    holiday_this_year = date(today.year, month, day)
-                    holiday_dates = [holiday_this_year]
-                    
-                    if holiday_this_year < today:
-                        holiday_dates.append(date(today.year + 1, month, day))
-                    
-                    for holiday_date in holiday_dates:
-                        event_iso_year, event_iso_week, _ = holiday_date.isocalendar()
-                        
-                        if not (
-                            (event_iso_year == this_iso_year and event_iso_week == this_iso_week) or
-                            (event_iso_year == this_iso_year and event_iso_week == next_iso_week)
-                        ):
-                            continue
-                        
-                        week_offset = event_iso_week - this_iso_week
-                        
-                        holiday_events.append({
-                            "summary": f"{icon} {name}",
-                            "start": holiday_date.strftime("%Y-%m-%d 00:00:00"),
-                            "weekday_index": holiday_date.weekday(),
-                            "week_offset": week_offset,
-                            "is_holiday": True
-                        })
-                
-                except (ValueError, TypeError) as e:
-                    logging.warning(f"Invalid date format for {name}: {date_str}")
-                    continue
-        
-        return holiday_events
-        
+
+        index = _load_week_index(holidays_file, _holiday_entries)
+        return _events_this_and_next_week(index)
+
     except json.JSONDecodeError as e:
         logging.error(f"Error parsing holidays JSON: {e}")
         return []
@@ -129,78 +188,10 @@ def get_birthdays_week(birthdays_file):
         if not os.path.exists(birthdays_file):
             logging.error(f"Birthdays file not found: {birthdays_file}")
             return []
-        
-        with open(birthdays_file, 'r', encoding='utf-8') as f:
-            birthdays = json.load(f)
-        
-        today = date.today()
-        this_iso_year, this_iso_week, _ = today.isocalendar()
-        next_iso_week = this_iso_week + 1
-        
-        birthday_events = []
-        
-        for person in birthdays:
-            name = person.get('name', 'Ukjent')
-            birth_date_str = person.get('date')
-            
-            if not birth_date_str:
-                continue
-            
-            # Parse date string (format: YYYY-MM-DD)
-            try:
-                birth_date = datetime.strptime(birth_date_str, '%Y-%m-%d').date()
-            except ValueError:
-                logging.warning(f"Invalid date format for {name}: {birth_date_str}")
-                continue
-            
-            birth_year = birth_date.year
-            day = birth_date.day
-            month = birth_date.month
-            
-            # Calculate birthday for this year
-            birthday_this_year = date(today.year, month, day)
-            
-            # If birthday has passed, check next year
-            birthday_dates = [birthday_this_year]
-            if birthday_this_year < today:
-                birthday_dates.append(date(today.year + 1, month, day))
-            
-            for birthday_date in birthday_dates:
-                # Check if birthday is in this week or next week
-                event_iso_year, event_iso_week, _ = birthday_date.isocalendar()
-                
-                if not (
-                    (event_iso_year == this_iso_year and event_iso_week == this_iso_week) or
-                    (event_iso_year == this_iso_year and event_iso_week == next_iso_week)
-                ):
-                    continue
-                
-                # Calculate age if birth year is known
-                age = birthday_date.year - birth_year if birth_year else None
-                
-                # Format summary
-                if age:
-                    summary = f"🎂 {name} ({age} år)"
-                else:
-                    summary = f"🎂 {name}"
-                
-                # Calculate week offset and weekday index
-                week_offset = event_iso_week - this_iso_week
-                weekday_index = birthday_date.weekday()
-                
-                # Format as all-day event
-                formatted_start = birthday_date.strftime("%Y-%m-%d 00:00:00")
-                
-                birthday_events.append({
-                    "summary": summary,
-                    "start": formatted_start,
-                    "weekday_index": weekday_index,
-                    "week_offset": week_offset,
-                    "is_birthday": True
-                })
-        
-        return birthday_events
-        
+
+        index = _load_week_index(birthdays_file, _birthday_entries)
+        return _events_this_and_next_week(index)
+
     except json.JSONDecodeError as e:
         logging.error(f"Error parsing birthdays JSON: {e}")
         return []
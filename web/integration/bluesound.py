@@ -1,27 +1,301 @@
+import logging
+import socket
+import threading
+import time
 import requests
 import xml.etree.ElementTree as ET
+from requests.adapters import HTTPAdapter
 
-def get_powernode():
-    URL = "http://powernode2.local:11000/Status"
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
+DEFAULT_HOST = "powernode2.local:11000"
+
+# BluOS long-polling: /Status?etag=<forrige>&timeout=<s> svarer først når statusen endres
+LONG_POLL_TIMEOUT = 100
+MIN_POLL_INTERVAL = 1   # BluOS ber klienter ikke spørre oftere enn én gang i sekundet
+RETRY_DELAY = 5
+FIRST_STATUS_TIMEOUT = 5  # felles frist for alle spillere, ikke per spiller
+
+# mDNS: BluOS-spillere annonserer seg som _musc._tcp
+MDNS_SERVICE = "_musc._tcp.local."
+MDNS_WAIT = 2
+
+# Én sesjon for alle watchere; hver long-poll holder en forbindelse, så bassenget må romme dem
+_session = requests.Session()
+_session.mount("http://", HTTPAdapter(pool_connections=16, pool_maxsize=16))
+
+# Siste status per spiller: {"data", "etag", "version", "error"}
+_players = {}
+_watchers = {}
+_addresses = {}
+_changed = threading.Condition()
+_state = {"version": 0}
+
+# Spillere funnet med mDNS: {tjenestenavn: "ip:port"}
+_discovered = {}
+_discovery = {"browser": None, "started": None}
+_discovery_lock = threading.Lock()
+
+
+def _parse_status(text):
+    """Parse a BluOS /Status document into (status dict, etag)."""
+    root = ET.fromstring(text)
+
+    status_data = {
+        "title": root.findtext("title1", "Unknown"),  # Currently playing source
+        "state": root.findtext("state", "Unknown"),  # Playing/Paused
+        "volume": root.findtext("volume", "Unknown"),  # Volume level
+        "input": root.findtext("inputId", "Unknown"),  # Input source
+        "db": root.findtext("db", "Unknown"),  # Decibel level
+        "image": root.findtext("image", None),  # Cover image (if available)
+        "group_name": root.findtext("groupName", None)  # Set when the player is grouped
+    }
+    return status_data, root.get("etag")
+
+
+def _parse_sync_status(text):
+    """
+    Parse /SyncStatus into the player's name and group links. A grouped
+    secondary has a <master> element, the primary lists its <slave>s.
+    """
+    root = ET.fromstring(text)
+    master = root.find("master")
+    return {
+        "name": root.get("name"),
+        "master": f"{master.text}:{master.get('port', '11000')}" if master is not None else None,
+        "slaves": [f"{slave.get('id')}:{slave.get('port', '11000')}" for slave in root.findall("slave")]
+    }
+
+
+def _fetch_status(session, host, etag=None):
+    """Fetch /Status, long-polling when an etag from the previous answer is given."""
+    if etag:
+        url = f"http://{host}/Status?etag={etag}&timeout={LONG_POLL_TIMEOUT}"
+        timeout = LONG_POLL_TIMEOUT + 10
+    else:
+        url = f"http://{host}/Status"
+        timeout = 5
+
+    response = session.get(url, timeout=timeout)
+    if response.status_code != 200:
+        raise RuntimeError(f"Failed to fetch status: {response.status_code}")
+    return _parse_status(response.text)
+
+
+def _fetch_sync_status(session, host):
+    response = session.get(f"http://{host}/SyncStatus", timeout=5)
+    if response.status_code != 200:
+        raise RuntimeError(f"Failed to fetch sync status: {response.status_code}")
+    return _parse_sync_status(response.text)
+
+
+def _address(host):
+    """Resolve "name:port" to "ip:port" so players can be matched against SyncStatus."""
+    name, _, port = host.partition(":")
     try:
-        response = requests.get(URL, timeout=5)
-        if response.status_code == 200:
-            root = ET.fromstring(response.text)
-
-            status_data = {
-                "title": root.findtext("title1", "Unknown"),  # Currently playing source
-                "state": root.findtext("state", "Unknown"),  # Playing/Paused
-                "volume": root.findtext("volume", "Unknown"),  # Volume level
-                "input": root.findtext("inputId", "Unknown"),  # Input source
-                "db": root.findtext("db", "Unknown"),  # Decibel level
-                "image": root.findtext("image", None)  # Cover image (if available)
-            }
-
-            return status_data
-        
+        return f"{socket.gethostbyname(name)}:{port or '11000'}"
+    except OSError:
+        return host
+
+
+def _store(host, data=None, etag=None, error=None):
+    """Update the in-memory status and wake up anyone waiting for a change."""
+    with _changed:
+        player = _players.setdefault(host, {"data": None, "etag": None, "version": 0, "error": None, "updated": None})
+        if error is not None:
+            player["etag"] = None
+            if error != player["error"]:
+                # Siste status er nå utdatert; si fra til dem som venter
+                player["error"] = error
+                player["version"] += 1
+                _state["version"] += 1
+                _changed.notify_all()
+        elif data != player["data"] or player["error"]:
+            player.update(data=data, etag=etag, error=None, updated=time.time())
+            player["version"] += 1
+            _state["version"] += 1
+            _changed.notify_all()
         else:
-            return {"error": f"Failed to fetch status: {response.status_code}"}
-    
-    except requests.RequestException as e:
-        return {"error": str(e)}
\ No newline at end of file
+            player.update(etag=etag, updated=time.time())
+
+
+def _watch(host, stop):
+    _addresses[host] = _address(host)
+    while not stop.is_set():
+        started = time.time()
+        try:
+            etag = _players.get(host, {}).get("etag")
+            data, etag = _fetch_status(_session, host, etag)
+            # Long-pollen svarer bare ved endringer, så gruppene sjekkes samtidig
+            data.update(_fetch_sync_status(_session, host))
+            _store(host, data, etag)
+        except (requests.RequestException, RuntimeError, ET.ParseError) as e:
+            logging.error(f"Bluesound status error for {host}: {e}")
+            _store(host, error=str(e))
+            stop.wait(RETRY_DELAY)
+            continue
+
+        stop.wait(max(0, MIN_POLL_INTERVAL - (time.time() - started)))
+
+
+def start_bluesound_watcher(host=DEFAULT_HOST):
+    """Start one long-polling watcher thread per player."""
+    with _changed:
+        if host in _watchers:
+            return
+        stop = threading.Event()
+        thread = threading.Thread(target=_watch, args=(host, stop), daemon=True, name=f"bluesound-{host}")
+        _watchers[host] = (thread, stop)
+    thread.start()
+
+
+def stop_bluesound_watcher(host=DEFAULT_HOST):
+    """Stop a watcher and forget its status (used by tests)."""
+    with _changed:
+        watcher = _watchers.pop(host, None)
+        _players.pop(host, None)
+    if watcher:
+        watcher[1].set()
+
+
+def _on_service_state_change(zeroconf, service_type, name, state_change):
+    from zeroconf import ServiceStateChange
+
+    if state_change is ServiceStateChange.Removed:
+        _discovered.pop(name, None)
+        return
+    info = zeroconf.get_service_info(service_type, name)
+    if info and info.parsed_addresses():
+        _discovered[name] = f"{info.parsed_addresses()[0]}:{info.port}"
+        logging.info(f"Found BluOS player {name} at {_discovered[name]}")
+
+
+def discover_players():
+    """
+    Return "ip:port" for BluOS players announced over mDNS. Browsing runs in
+    the background once started; the first call waits briefly for answers.
+    Returns an empty list when zeroconf is not installed.
+    """
+    with _discovery_lock:
+        if _discovery["browser"] is None:
+            try:
+                from zeroconf import ServiceBrowser, Zeroconf
+            except ImportError:
+                logging.error("zeroconf not installed, BluOS discovery disabled")
+                _discovery["browser"] = False
+                return []
+            _discovery["browser"] = ServiceBrowser(Zeroconf(), MDNS_SERVICE, handlers=[_on_service_state_change])
+            _discovery["started"] = time.time()
+
+    if _discovery["browser"] and not _discovered:
+        time.sleep(max(0, _discovery["started"] + MDNS_WAIT - time.time()))
+    return sorted(set(_discovered.values()))
+
+
+def _player_status(host):
+    """Current status for one player from memory. Caller holds _changed."""
+    player = _players.get(host)
+    if player is None or player["data"] is None:
+        return {"error": player["error"] if player else "No status from player"}
+    if player["error"]:
+        # Watcheren mistet kontakten: vis siste kjente status, men merket som utdatert
+        return {**player["data"], "stale": True, "error": player["error"], "updated": player["updated"]}
+    return dict(player["data"])
+
+
+def _wait_for_first_status(hosts, timeout=None):
+    """Start watchers for all hosts and wait, with one shared deadline, until each has answered."""
+    for host in hosts:
+        start_bluesound_watcher(host)
+
+    def answered(host):
+        player = _players.get(host, {})
+        return player.get("data") is not None or player.get("error") is not None
+
+    with _changed:
+        _changed.wait_for(lambda: all(answered(host) for host in hosts),
+                          timeout=FIRST_STATUS_TIMEOUT if timeout is None else timeout)
+        return {host: _player_status(host) for host in hosts}
+
+
+def get_powernode(host=DEFAULT_HOST):
+    """
+    Return the player's status from memory. The first call starts the watcher
+    and fetches once so there is something to show.
+    """
+    return _wait_for_first_status([host])[host]
+
+
+def _groups(statuses):
+    """Collapse synced players into groups keyed by their primary player."""
+    by_address = {_addresses.get(host, host): host for host in statuses}
+    groups = []
+    for host, status in statuses.items():
+        if status.get("master") or "error" in status:
+            continue
+        members = [host] + [by_address[address] for address in status.get("slaves", []) if address in by_address]
+        groups.append({
+            "name": status.get("group_name") or status.get("name") or host,
+            "primary": host,
+            "members": members,
+            "state": status.get("state")
+        })
+    return groups
+
+
+def get_music(hosts=None, discover=False):
+    """
+    Return one combined payload for all BluOS players.
+
+    Players come from `hosts` (e.g. CONFIG['BLUOS_PLAYERS']), plus mDNS
+    discovery when `discover` is set or no hosts are given. All players are
+    watched concurrently, so a slow or missing player costs one shared wait,
+    not one timeout each.
+
+    Returns:
+        dict with the primary player's status at the top level (the first
+        playing group primary, else the first player), every player under
+        "players" and the sync groups under "groups"
+    """
+    hosts = list(hosts or [])
+    if discover or not hosts:
+        hosts += [host for host in discover_players() if host not in hosts]
+    if not hosts:
+        hosts = [DEFAULT_HOST]
+
+    statuses = _wait_for_first_status(hosts)
+    players = [{"host": host, **status} for host, status in statuses.items()]
+    groups = _groups(statuses)
+
+    # Spillere som svarer går foran dem med utdatert status
+    ok = [player for player in players if "error" not in player] or [p for p in players if p.get("stale")]
+    if not ok:
+        return {"error": players[0]["error"], "players": players, "groups": []}
+
+    playing = [p for p in ok if p["state"] in ("play", "stream") and not p.get("master")]
+    primary = (playing or ok)[0]
+    return {
+        **{key: value for key, value in primary.items() if key != "slaves"},
+        "players": players,
+        "groups": groups
+    }
+
+
+def wait_for_change(host=DEFAULT_HOST, version=0, timeout=25):
+    """
+    Block until the player's status version is newer than `version`.
+    Returns (version, status) or None on timeout.
+    """
+    with _changed:
+        changed = _changed.wait_for(lambda: _players.get(host, {}).get("version", 0) > version, timeout=timeout)
+        if not changed:
+            return None
+        return _players[host]["version"], _player_status(host)
+
+
+def wait_for_any_change(version=0, timeout=25):
+    """Block until any player's status changes after `version`. Returns the new version or None."""
+    with _changed:
+        if _changed.wait_for(lambda: _state["version"] > version, timeout=timeout):
+            return _state["version"]
+        return None
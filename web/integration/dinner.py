@@ -2,6 +2,8 @@ import requests
 import datetime
 import re
 import logging
+import threading
+import time
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
@@ -16,32 +18,35 @@ day_map = {
     "S": "Søndag" # Søndag
 }
 
-def get_dinnerweek(DINNERURL):
-    weekday_index_map = {
-        "M": 0,   # Mandag
-        "T": 1,   # Tirsdag (første T)
-        "O": 2,   # Onsdag
-        "T2": 3,  # Torsdag (andre T)
-        "F": 4,   # Fredag
-        "L": 5,   # Lørdag
-        "S": 6    # Søndag (om nødvendig)
-    }
-    
-    response = requests.get(DINNERURL)
-    logging.info(f"Response: {response}")
+weekday_index_map = {
+    "M": 0,   # Mandag
+    "T": 1,   # Tirsdag (første T)
+    "O": 2,   # Onsdag
+    "T2": 3,  # Torsdag (andre T)
+    "F": 4,   # Fredag
+    "L": 5,   # Lørdag
+    "S": 6    # Søndag (om nødvendig)
+}
 
-    if response.status_code != 200:
-        return {"error": "Failed to fetch dinner plan"}
+LINE_RE = re.compile(r"(VIKTIG|[MTOLFS]):\s*(.*)")
+DOCUMENT_TTL = 5 * 60  # innenfor dette brukes planen uten å spørre; deretter betinget GET
+FAILURE_RETRY = 60     # etter en feilet henting spørres ikke dokumentet igjen før etter dette
 
-    raw_text = response.text.strip()
-    lines = raw_text.split("\n")
+# Siste dokument per URL: {"etag", "last_modified", "checked", "plan"}
+_dinner_cache = {}
+_dinner_lock = threading.Lock()
+# Tidspunkt for siste feilede henting per URL
+_failures = {}
 
+
+def _parse_plan(raw_text):
+    """Parse the dinner document into {"important", "days": [{shorthand, weekday_index, day, description}]}."""
     important = ""
     entries = []
     seen_t = False  # For å bestemme T vs T2
 
-    for line in lines:
-        match = re.match(r"(VIKTIG|[MTOLFS]):\s*(.*)", line.strip())
+    for line in raw_text.strip().split("\n"):
+        match = LINE_RE.match(line.strip())
         if match:
             shorthand, description = match.groups()
 
@@ -49,82 +54,108 @@ def get_dinnerweek(DINNERURL):
                 important = description.strip()
                 continue
 
-            # Håndtering av T (første er tirsdag, andre er torsdag)
+            # Håndtering av T: tirsdag, med mindre onsdag eller en T allerede er passert
             if shorthand == "T":
-                if not seen_t:
-                    shorthand = "T"   # Tirsdag
-                    seen_t = True
-                else:
+                if seen_t or "O" in [e["shorthand"] for e in entries]:
                     shorthand = "T2"  # Torsdag
+                seen_t = True
 
             entries.append({
                 "shorthand": shorthand,
                 "weekday_index": weekday_index_map[shorthand],
+                "day": day_map[shorthand],  # Convert to full day name
                 "description": description.strip()
             })
         else:
             if len(entries) > 0:
+                # We have found some days, so we stop now
                 break
 
-    return {
-        "important": important,
-        "days": entries
-    }
-
-def get_dinner(DINNERURL):
-    response = requests.get(DINNERURL)
+    return {"important": important, "days": entries}
+
+
+def _get_plan(DINNERURL):
+    """
+    Fetch and parse the dinner plan once for all views. Within DOCUMENT_TTL the
+    parsed plan is reused; after that the document is revalidated with
+    If-None-Match/If-Modified-Since and only re-parsed when it has changed.
+    Returns None if there is no plan at all.
+    """
+    with _dinner_lock:
+        cached = _dinner_cache.get(DINNERURL)
+        if cached and time.time() - cached["checked"] < DOCUMENT_TTL:
+            return cached["plan"]
+        if time.time() - _failures.get(DINNERURL, 0) < FAILURE_RETRY:
+            return cached["plan"] if cached else None
+
+        headers = {}
+        if cached and cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached and cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+        try:
+            response = requests.get(DINNERURL, headers=headers, timeout=10)
+        except requests.RequestException as e:
+            logging.error(f"Failed to fetch dinner plan: {e}")
+            _failures[DINNERURL] = time.time()
+            return cached["plan"] if cached else None
+        logging.info(f"Response: {response}")
+
+        if response.status_code == 304 and cached:
+            _failures.pop(DINNERURL, None)
+            cached["checked"] = time.time()
+            return cached["plan"]
+        if response.status_code != 200:
+            logging.error(f"Failed to fetch dinner plan: status {response.status_code}")
+            _failures[DINNERURL] = time.time()
+            return cached["plan"] if cached else None
+
+        _failures.pop(DINNERURL, None)
+
+        plan = _parse_plan(response.text)
+        logging.info(f"Dager: {plan['days']}")
+        _dinner_cache[DINNERURL] = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "checked": time.time(),
+            "plan": plan
+        }
+        return plan
 
-    logging.info(f"Response: {response}") 
 
-    if response.status_code != 200:
+def get_dinnerweek(DINNERURL):
+    plan = _get_plan(DINNERURL)
+    if plan is None:
         return {"error": "Failed to fetch dinner plan"}
 
-    raw_text = response.text.strip()
-    lines = raw_text.split("\n")
-    important = ""
-    entries = []
+    return {
+        "important": plan["important"],
+        "days": [
+            {key: entry[key] for key in ("shorthand", "weekday_index", "description")}
+            for entry in plan["days"]
+        ]
+    }
 
-    # Step 1: Parse days and descriptions
-    for line in lines:
-        match = re.match(r"(VIKTIG|[MTOLFS]):\s*(.*)", line.strip())  # Match shorthand + text
-        if match:
-            shorthand, description = match.groups()
 
-            if shorthand == "VIKTIG":
-                important = description.strip()
-            else:
-                # Determine if "T" is Tuesday or Thursday
-                if shorthand == "T":
-                    if "O" not in [e["shorthand"] for e in entries]:  
-                        shorthand = "T"  # First "T" is Tuesday
-                    else:
-                        shorthand = "T2"  # Second "T" is Thursday
-
-                entries.append({
-                    "shorthand": shorthand,
-                    "day": day_map[shorthand],  # Convert to full day name
-                    "description": description.strip()
-                })
-        else:
-            if len(entries) > 0:
-                # We have found some days, so we stop now
-                break
+def get_dinner(DINNERURL):
+    plan = _get_plan(DINNERURL)
+    if plan is None:
+        return {"error": "Failed to fetch dinner plan"}
 
-    logging.info(f"Dager: {entries}") 
+    entries = [dict(entry) for entry in plan["days"]]
+    if not entries:
+        return {"important": plan["important"], "days": entries}
 
-    # Step 2: Assign Correct Dates
+    # Assign Dates: next occurrence of the first listed day, then each day after it
     today = datetime.date.today()
-    weekday_map = ["Mandag", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-
-    # Find next occurrence of first listed day
-    first_day = entries[0]["day"]
-    first_day_index = weekday_map.index(first_day)
+    first_day_index = entries[0]["weekday_index"]
     days_ahead = (first_day_index - today.weekday()) % 7  # Calculate offset
 
     start_date = today + datetime.timedelta(days=days_ahead)
 
-    # Assign Dates
-    for i, entry in enumerate(entries):
-        entry["date"] = (start_date + datetime.timedelta(days=i)).strftime("%Y-%m-%d %H:%M:%S")
+    for entry in entries:
+        offset = (entry.pop("weekday_index") - first_day_index) % 7
+        entry["date"] = (start_date + datetime.timedelta(days=offset)).strftime("%Y-%m-%d %H:%M:%S")
 
-    return {"important": important, "days": entries}  # ✅ Returns structured JSON data
+    return {"important": plan["important"], "days": entries}  # ✅ Returns structured JSON data
@@ -1,8 +1,37 @@
 import requests
 import logging
+import json
+import math
+import heapq
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time as time_module
+from datetime import datetime, timedelta, time
+from pathlib import Path
+import pytz
+from integration.timeseries import record
+from integration.storage import write_json_atomic
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
+OSLO_TZ = pytz.timezone("Europe/Oslo")
+PRICE_URL = "https://www.hvakosterstrommen.no/api/v1/prices/{day:%Y/%m-%d}_{zone}.json"
+DEFAULT_ZONE = "NO1"
+
+# Morgendagens priser publiseres rundt kl 13
+PRICE_PUBLISH_HOUR = 13
+PRICE_RETRY_INTERVAL = 10 * 60  # 10 minutes
+
+# Priser per (dato, sone) – endres aldri etter publisering
+_price_cache = {}
+# Ferdig parsede slots per (dato, sone): ([(start, end, pris)], [start som epoch-sekunder])
+_slot_cache = {}
+# Planleggeren er felles for alle kallere; hver kaller legger til sine soner, og løkken leser dem hver runde
+_scheduler = {"thread": None, "zones": set(), "wake": threading.Event()}
+_scheduler_lock = threading.Lock()
+
+
 def get_tibber(token):
     """
     Fetches the current electricity price from Tibber API.
@@ -58,7 +87,7 @@ def get_tibber(token):
         response = requests.post(url, json=payload, headers=headers)
         data = response.json()
 
-        logging.info(f"🔍 Full API Response: {data}")  # ✅ Debugging
+        logging.debug(f"🔍 Full API Response: {data}")
 
         if not isinstance(data, dict):
             return {"error": "API response is not a dictionary"}
@@ -97,70 +126,286 @@ def get_tibber(token):
     except requests.RequestException as e:
         return {"error": f"Request error: {str(e)}"}
 
-def get_hvakosterstrom():
-    import requests
-    from datetime import datetime, timedelta
-    import pytz
+def _base_dir():
+    return Path(__file__).resolve().parents[2]
+
+
+def _price_path(day, zone):
+    return _base_dir() / "data" / "energy" / f"{day.isoformat()}_{zone}.json"
+
+
+def _fetch_prices(day, zone):
+    """Download prices for one day and zone. Returns None if not published yet."""
+    url = PRICE_URL.format(day=day, zone=zone)
+    response = requests.get(url, timeout=10)
+
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+
+    return response.json() or None
+
+
+def get_prices(day, zone=DEFAULT_ZONE, fetch=True):
+    """
+    Return the spot prices for a day and zone, looking in memory, then on disk,
+    then (if fetch is set) at hvakosterstrommen.no. Returns None if unavailable.
+    """
+    key = (day.isoformat(), zone)
+    prices = _price_cache.get(key)
+    if prices is not None:
+        return prices
+
+    path = _price_path(day, zone)
+    if path.exists():
+        with open(path, "r", encoding="utf-8") as f:
+            prices = json.load(f)
+    elif fetch:
+        prices = _fetch_prices(day, zone)
+        if prices:
+            write_json_atomic(path, prices)
+            logging.info(f"Fetched spot prices for {day} {zone}")
+            for p in prices:
+                record(f"energy.price.{zone}", p["NOK_per_kWh"], _parse_time(p["time_start"]).timestamp())
+
+    if prices:
+        _price_cache[key] = prices
+    return prices
+
+
+def _parse_time(timestr):
+    dt = datetime.fromisoformat(timestr.replace("Z", "+00:00"))
+    return dt.astimezone(OSLO_TZ)
+
+
+def _slot_index(day, zone, fetch=True):
+    """
+    Parse the day's prices once into a time-ordered list of (start, end, price)
+    tuples plus a parallel list of slot start epochs for bisect lookups.
+    Works for both hourly and 15-minute market resolution.
+    """
+    key = (day.isoformat(), zone)
+    index = _slot_cache.get(key)
+    if index is not None:
+        return index
+
+    prices = get_prices(day, zone, fetch=fetch)
+    if not prices:
+        return [], []
+
+    slots = sorted((_parse_time(p["time_start"]), _parse_time(p["time_end"]), p["NOK_per_kWh"]) for p in prices)
+    index = _slot_cache[key] = (slots, [s[0].timestamp() for s in slots])
+    return index
+
+
+def get_price_slots(day, zone=DEFAULT_ZONE, fetch=True):
+    """Return the day's prices as a time-ordered list of (start, end, price) tuples."""
+    return _slot_index(day, zone, fetch)[0]
+
+
+def _find_slot(day, zone, moment, fetch=True):
+    """Return the position of the slot containing moment, or None."""
+    slots, starts = _slot_index(day, zone, fetch)
+    i = bisect_right(starts, moment.timestamp()) - 1
+    if i >= 0 and moment < slots[i][1]:
+        return i
+    return None
+
+
+def prefetch_prices(day, zones, fetch=True):
+    """Load prices for several price areas concurrently. Returns {zone: prices}."""
+    with ThreadPoolExecutor(max_workers=max(len(zones), 1)) as executor:
+        results = executor.map(lambda zone: get_prices(day, zone, fetch=fetch), zones)
+        return dict(zip(zones, results))
+
+
+def find_cheapest_slots(slots, count, contiguous=True):
+    """
+    Pick the cheapest `count` slots from a time-ordered slot list.
+    Contiguous mode slides a window over the prices keeping a running sum;
+    otherwise the cheapest individual slots are returned in time order.
+    Returns None if there are fewer than `count` slots.
+    """
+    if count <= 0 or len(slots) < count:
+        return None
+
+    if not contiguous:
+        return sorted(heapq.nsmallest(count, slots, key=lambda s: s[2]))
+
+    window = sum(s[2] for s in slots[:count])
+    best_sum, best_start = window, 0
+    for i in range(count, len(slots)):
+        window += slots[i][2] - slots[i - count][2]
+        if window < best_sum:
+            best_sum, best_start = window, i - count + 1
 
-    oslo_tz = pytz.timezone("Europe/Oslo")
-    now = datetime.now(oslo_tz)
+    return slots[best_start:best_start + count]
+
+
+def _parse_deadline(deadline, now):
+    """Accept "HH:MM" (next occurrence after now) or an ISO timestamp."""
+    if not deadline:
+        return None
+    if len(deadline) <= 5:
+        hour, minute = map(int, deadline.split(":"))
+        target = OSLO_TZ.localize(datetime.combine(now.date(), time(hour, minute)))
+        if target <= now:
+            target = OSLO_TZ.localize(datetime.combine(now.date() + timedelta(days=1), time(hour, minute)))
+        return target
+    target = datetime.fromisoformat(deadline)
+    if target.tzinfo is None:
+        target = OSLO_TZ.localize(target)
+    return target
+
+
+def plan_cheapest(hours, deadline=None, contiguous=True, zone=DEFAULT_ZONE, now=None, areas=None):
+    """
+    Find the cheapest slots to run a load for `hours` before `deadline`
+    (e.g. 3 hours of dishwasher before "07:00"), using today's and tomorrow's
+    prices. The slot in progress counts as available. Raises ValueError if
+    hours is not positive.
+    """
+    if hours <= 0:
+        raise ValueError("hours must be positive")
+    start_price_scheduler(areas or [zone])
+
+    now = now or datetime.now(OSLO_TZ)
     today = now.date()
+    end = _parse_deadline(deadline, now)
+
+    # Etter kl 13 hentes morgendagen direkte hvis scheduleren ikke har rukket det ennå
+    tomorrow = get_price_slots(today + timedelta(days=1), zone, fetch=now.hour >= PRICE_PUBLISH_HOUR)
+    slots = get_price_slots(today, zone) + tomorrow
+    first = _find_slot(today, zone, now) or 0
+    candidates = [s for s in slots[first:] if s[1] > now and (end is None or s[1] <= end)]
+    if not candidates:
+        return {"error": "No prices available before deadline"}
+
+    slot_minutes = (candidates[0][1] - candidates[0][0]).total_seconds() / 60
+    count = math.ceil(hours * 60 / slot_minutes)
+
+    chosen = find_cheapest_slots(candidates, count, contiguous)
+    if chosen is None:
+        return {"error": f"Only {len(candidates)} slots of {slot_minutes:.0f} min available before deadline"}
+
+    average = sum(s[2] for s in chosen) / len(chosen)
+    return {
+        "zone": zone,
+        "from": chosen[0][0].isoformat(),
+        "to": chosen[-1][1].isoformat(),
+        "average_price": round(average, 4),
+        "contiguous": contiguous,
+        "slots": [_slot_json(s) for s in chosen]
+    }
+
+
+def _slot_json(slot):
+    if slot is None:
+        return {"price": None, "from": None, "to": None}
+    return {"price": slot[2], "from": slot[0].isoformat(), "to": slot[1].isoformat()}
+
+
+def _prune_price_cache(today):
+    """Drop in-memory prices older than yesterday (they stay on disk)."""
+    oldest = (today - timedelta(days=1)).isoformat()
+    for cache in (_price_cache, _slot_cache):
+        for key in [k for k in cache if k[0] < oldest]:
+            del cache[key]
+
 
-    # Hent dagens priser
-    url_today = today.strftime("%Y/%m-%d")
-    url_today = f"https://www.hvakosterstrommen.no/api/v1/prices/{url_today}_NO1.json"
+def _seconds_until(now, day, hour):
+    target = OSLO_TZ.localize(datetime.combine(day, time(hour)))
+    return max((target - now).total_seconds(), 1)
 
-    prices_today = requests.get(url_today).json()
 
-    # Hent morgendagens priser (kan være tom før kl 13)
+def _price_scheduler_pass(now):
+    """One round of the price scheduler for all registered zones; returns seconds until the next round."""
+    today = now.date()
     tomorrow = today + timedelta(days=1)
-    url_tomorrow = tomorrow.strftime("%Y/%m-%d")
-    url_tomorrow = f"https://www.hvakosterstrommen.no/api/v1/prices/{url_tomorrow}_NO1.json"
+    with _scheduler_lock:
+        zones = sorted(_scheduler["zones"])
 
     try:
-        prices_tomorrow = requests.get(url_tomorrow).json()
-        max_tomorrow = max(prices_tomorrow, key=lambda p: p["NOK_per_kWh"])
-    except:
-        max_tomorrow = None
+        prefetch_prices(today, zones)
+
+        missing = [z for z in zones if not get_prices(tomorrow, z, fetch=False)]
+        if missing and now.hour >= PRICE_PUBLISH_HOUR:
+            fetched = prefetch_prices(tomorrow, missing)
+            missing = [z for z in missing if not fetched[z]]
+
+        if not missing:
+            # Alt er hentet; neste runde er når prisene for overmorgen publiseres
+            delay = _seconds_until(now, tomorrow, PRICE_PUBLISH_HOUR)
+        elif now.hour < PRICE_PUBLISH_HOUR:
+            delay = _seconds_until(now, today, PRICE_PUBLISH_HOUR)
+        else:
+            logging.info(f"Prices for {tomorrow} {', '.join(missing)} not published yet, retrying")
+            delay = PRICE_RETRY_INTERVAL
+    except Exception as e:
+        logging.error(f"Spot price fetch failed: {e}")
+        delay = PRICE_RETRY_INTERVAL
 
-    def parse_time(timestr):
-        dt = datetime.fromisoformat(timestr.replace("Z", "+00:00"))
-        return dt.astimezone(oslo_tz)
+    _prune_price_cache(today)
+    return delay
 
-    # Finn nåværende og neste pris
-    current_price = None
-    next_price = None
 
-    for i, price in enumerate(prices_today):
-        start = parse_time(price["time_start"])
-        end = parse_time(price["time_end"])
+def _price_scheduler():
+    """Keep today's and tomorrow's prices cached, retrying until tomorrow is published."""
+    while True:
+        delay = _price_scheduler_pass(datetime.now(OSLO_TZ))
+        # Nye soner vekker løkken straks i stedet for å vente til neste runde
+        _scheduler["wake"].wait(delay)
+        _scheduler["wake"].clear()
 
-        if start <= now < end:
-            current_price = price
-            if i + 1 < len(prices_today):
-                next_price = prices_today[i + 1]
 
-    max_today = max(prices_today, key=lambda p: p["NOK_per_kWh"])
+def start_price_scheduler(zones=(DEFAULT_ZONE,)):
+    """
+    Start the background price fetcher once per process and add the given
+    price areas to it. Later callers with other areas extend the set.
+    """
+    with _scheduler_lock:
+        new_zones = set(zones) - _scheduler["zones"]
+        _scheduler["zones"].update(new_zones)
+        if _scheduler["thread"] is None:
+            thread = threading.Thread(target=_price_scheduler, daemon=True, name="price-scheduler")
+            thread.start()
+            _scheduler["thread"] = thread
+        elif new_zones:
+            _scheduler["wake"].set()
+
+
+def get_hvakosterstrom(zone=DEFAULT_ZONE, areas=None):
+    start_price_scheduler(areas or [zone])
+
+    now = datetime.now(OSLO_TZ)
+    today = now.date()
+    tomorrow = today + timedelta(days=1)
+
+    # Dagens priser hentes fra cache (evt. én gang ved kald start)
+    slots_today = get_price_slots(today, zone)
+    if not slots_today:
+        return {"error": f"No spot prices available for {today} {zone}"}
+
+    # Morgendagens priser fylles inn av scheduleren etter kl 13
+    slots_tomorrow = get_price_slots(tomorrow, zone, fetch=False)
+
+    # Finn nåværende og neste pris (time eller kvarter, avhengig av oppløsning)
+    i = _find_slot(today, zone, now)
+    if i is None:
+        return {"error": f"No spot price for {now:%H:%M} {zone}"}
+
+    current_slot = slots_today[i]
+    upcoming = slots_today[i + 1:] or slots_tomorrow
+    next_slot = upcoming[0] if upcoming else None
+
+    max_today = max(slots_today, key=lambda s: s[2])
+    max_tomorrow = max(slots_tomorrow, key=lambda s: s[2]) if slots_tomorrow else None
 
     return {
-        "now": {
-            "price": current_price["NOK_per_kWh"],
-            "from": current_price["time_start"],
-            "to": current_price["time_end"]
-        },
-        "next": {
-            "price": next_price["NOK_per_kWh"] if next_price else None,
-            "from": next_price["time_start"] if next_price else None,
-            "to": next_price["time_end"] if next_price else None
-        },
-        "max_today": {
-            "price": max_today["NOK_per_kWh"],
-            "from": max_today["time_start"],
-            "to": max_today["time_end"]
-        },
-        "max_tomorrow": {
-            "price": max_tomorrow["NOK_per_kWh"] if max_tomorrow else None,
-            "from": max_tomorrow["time_start"] if max_tomorrow else None,
-            "to": max_tomorrow["time_end"] if max_tomorrow else None
-        }
-    }
\ No newline at end of file
+        "zone": zone,
+        "resolution_minutes": int((current_slot[1] - current_slot[0]).total_seconds() // 60),
+        "now": _slot_json(current_slot),
+        "next": _slot_json(next_slot),
+        "max_today": _slot_json(max_today),
+        "max_tomorrow": _slot_json(max_tomorrow)
+    }
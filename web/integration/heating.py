@@ -0,0 +1,203 @@
+import heapq
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from integration.energy import OSLO_TZ, DEFAULT_ZONE, get_price_slots, start_price_scheduler
+from integration.mill import queue_mill_command, command_failed
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Standardverdier per rom; overstyres av CONFIG['HEATING']['rooms'][room_id]
+DEFAULT_ROOM = {
+    "name": None,
+    "comfort": 21.0,
+    "setback": 18.0,
+    "setback_share": 0.25,    # andel av døgnets dyreste slots som senkes
+    "max_setback_hours": 3,   # lengste sammenhengende senking før rommet varmes opp igjen
+    "min_recovery_hours": 1,  # minste tid på komforttemperatur før neste senking
+}
+DEFAULT_KW_PER_DEGREE = 0.1
+TICK_INTERVAL = 60
+
+# Dagsplaner per (rom, dato, sone) – beregnes på nytt bare når en ny dag med priser kommer
+_day_plans = {}
+_last_pushed = {}
+_scheduler = {"thread": None}
+_scheduler_lock = threading.Lock()
+
+
+def _room_settings(settings, room_id):
+    return {**DEFAULT_ROOM, **settings.get("rooms", {}).get(room_id, {})}
+
+
+def plan_day(slots, room):
+    """
+    Return [(start, end, setpoint)] for one day's price slots. The most
+    expensive `setback_share` of the slots get the setback temperature,
+    but never for more than `max_setback_hours` in a row, and each such
+    run is followed by at least `min_recovery_hours` at comfort.
+    """
+    if not slots:
+        return []
+
+    count = round(len(slots) * room["setback_share"])
+    expensive = set(heapq.nlargest(count, range(len(slots)), key=lambda i: slots[i][2]))
+
+    slot_hours = (slots[0][1] - slots[0][0]).total_seconds() / 3600
+    max_run = max(int(room["max_setback_hours"] / slot_hours), 1)
+    min_recovery = max(round(room["min_recovery_hours"] / slot_hours), 1)
+
+    plan = []
+    run = 0
+    recovery = 0
+    for i, (start, end, price) in enumerate(slots):
+        if i in expensive and run < max_run and recovery == 0:
+            setpoint = room["setback"]
+            run += 1
+        else:
+            setpoint = room["comfort"]
+            if run >= max_run:
+                # Senkingen ble avbrutt av taket; rommet får tid til å varme seg opp igjen
+                recovery = min_recovery
+            recovery = max(recovery - 1, 0)
+            run = 0
+        plan.append((start, end, setpoint))
+    return plan
+
+
+def _day_plan(room_id, room, day, zone, fetch):
+    key = (room_id, day.isoformat(), zone)
+    plan = _day_plans.get(key)
+    if plan is None:
+        slots = get_price_slots(day, zone, fetch=fetch)
+        if not slots:
+            return []
+        plan = _day_plans[key] = plan_day(slots, room)
+    return plan
+
+
+def get_heating_plan(settings, now=None):
+    """
+    Return per-room setpoint segments for today and (once published)
+    tomorrow, i.e. 24-36 hours ahead. Only days not planned before are
+    computed, so tomorrow's prices arriving adds one day plan per room.
+    """
+    now = now or datetime.now(OSLO_TZ)
+    zone = settings.get("zone", DEFAULT_ZONE)
+    today = now.date()
+
+    # Rydd bort planer for dager som er passert
+    for key in [k for k in _day_plans if k[1] < today.isoformat()]:
+        del _day_plans[key]
+
+    rooms = {}
+    for room_id in settings.get("rooms", {}):
+        room = _room_settings(settings, room_id)
+        slots = _day_plan(room_id, room, today, zone, True) + _day_plan(room_id, room, today + timedelta(days=1), zone, False)
+        upcoming = [s for s in slots if s[1] > now]
+
+        rooms[room_id] = {
+            "name": room["name"] or room_id,
+            "current": upcoming[0][2] if upcoming else room["comfort"],
+            "segments": _merge_segments(upcoming)
+        }
+    return rooms
+
+
+def _merge_segments(slots):
+    """Merge consecutive slots with the same setpoint into segments."""
+    segments = []
+    for start, end, setpoint in slots:
+        if segments and segments[-1]["setpoint"] == setpoint and segments[-1]["_end"] == start:
+            segments[-1]["_end"] = end
+        else:
+            segments.append({"from": start, "_end": end, "setpoint": setpoint})
+    return [
+        {"from": s["from"].isoformat(), "to": s["_end"].isoformat(), "setpoint": s["setpoint"]}
+        for s in segments
+    ]
+
+
+def apply_heating_plan(settings, username, password, now=None):
+    """Queue Mill room setpoints that differ from what was last pushed. Returns the changes."""
+    changes = {}
+    for room_id, plan in get_heating_plan(settings, now).items():
+        setpoint = plan["current"]
+        # Et settpunkt som Mill avviste, sendes på nytt ved neste runde
+        if _last_pushed.get(room_id) == setpoint and not command_failed("room", room_id):
+            continue
+        queue_mill_command(username, password, "room", room_id, target_temp=setpoint)
+        _last_pushed[room_id] = setpoint
+        changes[room_id] = setpoint
+
+    if changes:
+        logging.info(f"Heating setpoints changed: {changes}")
+    return changes
+
+
+def _heating_scheduler(settings, username, password):
+    while True:
+        try:
+            apply_heating_plan(settings, username, password)
+        except Exception as e:
+            logging.error(f"Heating scheduler failed: {e}")
+        time.sleep(TICK_INTERVAL)
+
+
+def start_heating_scheduler(settings, username, password):
+    """Start the background loop that pushes setpoints once per process."""
+    # Morgendagens priser hentes av prisplanleggeren; planen plukker dem opp ved neste tick
+    start_price_scheduler([settings.get("zone", DEFAULT_ZONE)])
+
+    with _scheduler_lock:
+        if _scheduler["thread"] is None:
+            thread = threading.Thread(
+                target=_heating_scheduler,
+                args=(settings, username, password),
+                daemon=True,
+                name="heating-scheduler"
+            )
+            thread.start()
+            _scheduler["thread"] = thread
+
+
+def simulate_heating(settings, start_day, end_day):
+    """
+    Replay stored prices between start_day and end_day (inclusive) through the
+    planner and estimate savings. Uses a simple model where each degree of
+    setback saves `kw_per_degree` kW per room; recovery heating is not counted.
+    """
+    zone = settings.get("zone", DEFAULT_ZONE)
+    kw_per_degree = settings.get("kw_per_degree", DEFAULT_KW_PER_DEGREE)
+
+    rooms = {}
+    days = 0
+    day = start_day
+    while day <= end_day:
+        slots = get_price_slots(day, zone, fetch=False)
+        if slots:
+            days += 1
+            for room_id in settings.get("rooms", {}):
+                room = _room_settings(settings, room_id)
+                totals = rooms.setdefault(room_id, {"name": room["name"] or room_id, "setback_hours": 0.0, "saved_kwh": 0.0, "saved_nok": 0.0})
+                for (start, end, price), (_, _, setpoint) in zip(slots, plan_day(slots, room)):
+                    hours = (end - start).total_seconds() / 3600
+                    saved_kwh = (room["comfort"] - setpoint) * kw_per_degree * hours
+                    if saved_kwh > 0:
+                        totals["setback_hours"] += hours
+                        totals["saved_kwh"] += saved_kwh
+                        totals["saved_nok"] += saved_kwh * price
+        day += timedelta(days=1)
+
+    for totals in rooms.values():
+        for key in ("setback_hours", "saved_kwh", "saved_nok"):
+            totals[key] = round(totals[key], 2)
+
+    return {
+        "from": start_day.isoformat(),
+        "to": end_day.isoformat(),
+        "days_with_prices": days,
+        "rooms": rooms,
+        "saved_nok": round(sum(r["saved_nok"] for r in rooms.values()), 2)
+    }
@@ -0,0 +1,91 @@
+from datetime import date, timedelta
+import logging
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Faste helligdager: (navn, ikon, (måned, dag))
+FIXED_HOLIDAYS = [
+    ("Nyttårsdag", "🎆", (1, 1)),
+    ("1. mai", "🌹", (5, 1)),
+    ("17. mai", "🇳🇴", (5, 17)),
+    ("1. juledag", "🎁", (12, 25)),
+    ("2. juledag", "🎁", (12, 26)),
+]
+
+# Bevegelige helligdager: (navn, ikon, dager fra 1. påskedag)
+EASTER_HOLIDAYS = [
+    ("Palmesøndag", "🌿", -7),
+    ("Skjærtorsdag", "🐣", -3),
+    ("Langfredag", "🐣", -2),
+    ("1. påskedag", "🐣", 0),
+    ("2. påskedag", "🐣", 1),
+    ("Kristi himmelfartsdag", "⛪", 39),
+    ("1. pinsedag", "🕊️", 49),
+    ("2. pinsedag", "🕊️", 50),
+]
+
+# Tabellen beregnes ved oppstart for disse årene; andre år legges til ved behov
+TABLE_YEARS_BACK = 1
+TABLE_YEARS_AHEAD = 10
+
+
+def easter_sunday(year):
+    """
+    Return the date of Easter Sunday (Western) for the given year,
+    using the anonymous Gregorian computus (Meeus/Jones/Butcher).
+    """
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def _compute_year(year):
+    """
+    Compute the public holidays for one year as {date: [{"name", "icon"}, ...]}.
+    A date can have several holidays, e.g. Kristi himmelfartsdag on 1. or 17. mai.
+    """
+    holidays = {}
+
+    for name, icon, (month, day) in FIXED_HOLIDAYS:
+        holidays.setdefault(date(year, month, day), []).append({"name": name, "icon": icon})
+
+    easter = easter_sunday(year)
+    for name, icon, offset in EASTER_HOLIDAYS:
+        holidays.setdefault(easter + timedelta(days=offset), []).append({"name": name, "icon": icon})
+
+    return dict(sorted(holidays.items()))
+
+
+# Flerårig tabell {år: {dato: [helligdager]}} som bygges ved import
+_holiday_table = {}
+
+
+def _build_table(start_year, end_year):
+    for year in range(start_year, end_year + 1):
+        _holiday_table[year] = _compute_year(year)
+    logging.info(f"Computed public holidays for {start_year}-{end_year}")
+
+
+def public_holidays(year):
+    """Return {date: [{"name", "icon"}, ...]} for all Norwegian public holidays in year."""
+    holidays = _holiday_table.get(year)
+    if holidays is None:
+        holidays = _holiday_table[year] = _compute_year(year)
+    return holidays
+
+
+def get_public_holiday(day):
+    """Return the list of public holidays on the given date (empty if none)."""
+    return public_holidays(day.year).get(day, [])
+
+
+_this_year = date.today().year
+_build_table(_this_year - TABLE_YEARS_BACK, _this_year + TABLE_YEARS_AHEAD)
@@ -0,0 +1,196 @@
+import json
+import logging
+import threading
+import time
+import requests
+import urllib3
+from integration.timeseries import record
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Broen bruker selvsignert sertifikat
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+RECONNECT_DELAY = 5
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 5 * 60   # broen sender keepalive, så en lang stillhet betyr brutt forbindelse
+
+# Lokal kopi av broens CLIP v2-ressurser, oppdatert av hendelsesstrømmen
+_model = {"resources": {}, "ready": False, "updated": 0}
+_model_lock = threading.Lock()
+_subscriber = {"thread": None, "stop": None}
+_subscriber_lock = threading.Lock()
+
+
+def _merge(target, update):
+    """Recursively merge an event's partial resource into the stored one."""
+    for key, value in update.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge(target[key], value)
+        else:
+            target[key] = value
+
+
+def _load_snapshot(session, base_url, key):
+    """Replace the model with the bridge's full resource list."""
+    response = session.get(
+        f"{base_url}/clip/v2/resource",
+        headers={"hue-application-key": key},
+        timeout=CONNECT_TIMEOUT,
+        verify=False
+    )
+    response.raise_for_status()
+    resources = {r["id"]: r for r in response.json().get("data", [])}
+
+    with _model_lock:
+        _model.update(resources=resources, ready=True, updated=time.time())
+    logging.info(f"Loaded {len(resources)} Hue resources")
+
+
+def apply_events(events):
+    """Apply one event-stream message (a list of add/update/delete events)."""
+    temperatures = []
+    with _model_lock:
+        resources = _model["resources"]
+        for event in events:
+            for item in event.get("data", []):
+                rid = item.get("id")
+                if event.get("type") == "delete":
+                    resources.pop(rid, None)
+                elif rid in resources and event.get("type") == "update":
+                    _merge(resources[rid], item)
+                else:
+                    resources[rid] = item
+
+                if item.get("type") == "temperature" and rid in resources:
+                    temperatures.append(rid)
+        _model["updated"] = time.time()
+
+    for sensor in _outdoor_sensors():
+        if sensor["rid"] in temperatures:
+            record(f"hue.{sensor['name']}.temperature", sensor["temperature"])
+
+
+def _read_stream(response):
+    """Yield the decoded JSON payload of each server-sent event."""
+    data = []
+    # chunk_size=None gir data etter hvert som de kommer; standard 512 byte holder igjen små hendelser
+    for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+        if line is None:
+            continue
+        if line.startswith("data:"):
+            data.append(line[5:].strip())
+        elif not line and data:
+            yield json.loads("\n".join(data))
+            data = []
+
+
+def _subscribe(base_url, key, stop):
+    session = requests.Session()
+    while not stop.is_set():
+        try:
+            # Hent full tilstand ved hver (re)tilkobling så ingen hendelser går tapt
+            _load_snapshot(session, base_url, key)
+            with session.get(
+                f"{base_url}/eventstream/clip/v2",
+                headers={"hue-application-key": key, "Accept": "text/event-stream"},
+                stream=True,
+                timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+                verify=False
+            ) as response:
+                response.raise_for_status()
+                for events in _read_stream(response):
+                    apply_events(events)
+                    if stop.is_set():
+                        break
+        except Exception as e:
+            logging.error(f"Hue event stream error: {e}")
+
+        if stop.is_set():
+            break
+
+        # Tilstanden kan være utdatert til neste snapshot; /lights faller tilbake på v1 så lenge
+        with _model_lock:
+            _model["ready"] = False
+        stop.wait(RECONNECT_DELAY)
+
+
+def start_hue_events(HUEHOST, APIKEY, base_url=None):
+    """Start the event-stream subscriber once per process."""
+    with _subscriber_lock:
+        if _subscriber["thread"] is None:
+            stop = threading.Event()
+            thread = threading.Thread(
+                target=_subscribe,
+                args=(base_url or f"https://{HUEHOST}", APIKEY, stop),
+                daemon=True,
+                name="hue-events"
+            )
+            thread.start()
+            _subscriber.update(thread=thread, stop=stop)
+
+
+def stop_hue_events():
+    """Stop the subscriber and forget the model (used by tests)."""
+    with _subscriber_lock:
+        if _subscriber["stop"] is not None:
+            _subscriber["stop"].set()
+        _subscriber.update(thread=None, stop=None)
+    with _model_lock:
+        _model.update(resources={}, ready=False, updated=0)
+
+
+def _name_of(resource, resources):
+    """A resource's own name, or the name of the device that owns it."""
+    name = resource.get("metadata", {}).get("name")
+    if name:
+        return name
+    owner = resources.get(resource.get("owner", {}).get("rid"), {})
+    return owner.get("metadata", {}).get("name", "Unknown")
+
+
+def _outdoor_sensors():
+    with _model_lock:
+        resources = _model["resources"]
+        sensors = []
+        for rid, resource in resources.items():
+            if resource.get("type") != "temperature":
+                continue
+            name = _name_of(resource, resources)
+            if "outdoor" not in name.lower() and "ute" not in name.lower():
+                continue
+            temperature = resource.get("temperature", {})
+            value = temperature.get("temperature_report", {}).get("temperature", temperature.get("temperature"))
+            if value is not None:
+                sensors.append({"rid": rid, "id": resource.get("id_v1", rid).split("/")[-1], "name": name, "temperature": value})
+        return sensors
+
+
+def get_lights_state():
+    """
+    Return {"zones", "outdoor_sensors"} in the same shape as lights.get_lights,
+    built from the local model, or None until the first snapshot is loaded.
+    Zone ids are the v1 group ids so they can be used for control.
+    """
+    with _model_lock:
+        if not _model["ready"]:
+            return None
+        resources = _model["resources"]
+
+        zones = []
+        for rid, resource in resources.items():
+            if resource.get("type") not in ("room", "zone"):
+                continue
+            grouped = next(
+                (resources.get(s["rid"], {}) for s in resource.get("services", []) if s.get("rtype") == "grouped_light"),
+                {}
+            )
+            zones.append({
+                "id": resource.get("id_v1", rid).split("/")[-1],
+                "name": resource.get("metadata", {}).get("name", "Unknown"),
+                "num_lights": len(resource.get("children", [])),
+                "status": "on" if grouped.get("on", {}).get("on") else "off"
+            })
+
+    outdoor = [{key: s[key] for key in ("id", "name", "temperature")} for s in _outdoor_sensors()]
+    return {"zones": sorted(zones, key=lambda z: (len(z["id"]), z["id"])), "outdoor_sensors": outdoor}
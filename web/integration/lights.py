@@ -1,84 +1,298 @@
 import requests
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from integration.timeseries import record
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
-def get_zones(HUEHOST, APIKEY):
-    URL = f"http://{HUEHOST}/api/{APIKEY}/groups"
+REQUEST_TIMEOUT = 5
+CACHE_TTL = 10  # sekunder; flere skjermer som oppdaterer hvert 30. sek deler ett brooppslag
+
+INDEX_TTL = 24 * 60 * 60  # nye sensorer plukkes opp av en full skanning en gang i døgnet
+
+# Én vedvarende forbindelse til broen for alle kall
+_session = requests.Session()
+_lights_cache = {}
+_lights_lock = threading.Lock()
+
+# Sensor-id-er per rolle for hver (bro, nøkkel), og siste avlesning per (bro, sensor)
+_sensor_index = {}
+_sensor_readings = {}
+_sensor_lock = threading.Lock()
 
+
+def _get_json(URL):
+    """GET a bridge resource, returning parsed JSON or None."""
     try:
-        response = requests.get(URL)
+        response = _session.get(URL, timeout=REQUEST_TIMEOUT)
         if response.status_code != 200:
-            logging.error(f"Failed to retrieve zones. Status Code: {response.status_code}")
+            logging.error(f"Hue request failed. Status Code: {response.status_code} for {URL}")
             return None
+        return response.json()
 
-        zones_data = response.json()
+    except requests.RequestException as e:
+        logging.error(f"Error connecting to Hue Bridge: {e}")
+        return None
 
-        zones = []
-        for zone_id, zone_info in zones_data.items():
-            zone_name = zone_info.get("name", "Unknown")
-            num_lights = len(zone_info.get("lights", []))
 
-            # Determine on/off status (if any light is on, consider the zone "on")
-            is_on = zone_info.get("state", {}).get("any_on", False)
+def _parse_zones(zones_data):
+    zones = []
+    for zone_id, zone_info in zones_data.items():
+        zone_name = zone_info.get("name", "Unknown")
+        num_lights = len(zone_info.get("lights", []))
 
-            zones.append({
-                "id": zone_id,
-                "name": zone_name,
-                "num_lights": num_lights,
-                "status": "on" if is_on else "off"
-            })
+        # Determine on/off status (if any light is on, consider the zone "on")
+        is_on = zone_info.get("state", {}).get("any_on", False)
 
-        return zones
+        zones.append({
+            "id": zone_id,
+            "name": zone_name,
+            "num_lights": num_lights,
+            "status": "on" if is_on else "off"
+        })
 
-    except requests.RequestException as e:
-        logging.error(f"Error connecting to Hue Bridge: {e}")
+    return zones
+
+
+def _is_outdoor_temperature(sensor_info):
+    # Look for temperature sensors (type: ZLLTemperature or CLIPTemperature) named outdoor/ute
+    sensor_type = sensor_info.get("type", "")
+    sensor_name = sensor_info.get("name", "Unknown").lower()
+    return "Temperature" in sensor_type and ("outdoor" in sensor_name or "ute" in sensor_name)
+
+
+def _index_sensors(sensors_data):
+    """Build the role index {role: [sensor ids]} from a full /sensors listing."""
+    return {
+        "outdoor_temperature": sorted(
+            (sensor_id for sensor_id, info in sensors_data.items() if _is_outdoor_temperature(info)),
+            key=lambda sensor_id: (len(sensor_id), sensor_id)
+        )
+    }
+
+
+def _update_reading(HUEHOST, sensor_id, sensor_info):
+    """Store the sensor's latest reading; a sample is recorded only when the bridge has a new one."""
+    state = sensor_info.get("state", {})
+    # Temperature is in 1/100th of degrees Celsius
+    temp_raw = state.get("temperature")
+    if temp_raw is None:
+        return
+
+    sensor_name = sensor_info.get("name", "Unknown")
+    temp_celsius = temp_raw / 100.0
+    key = (HUEHOST, sensor_id)
+    previous = _sensor_readings.get(key)
+    _sensor_readings[key] = {
+        "id": sensor_id,
+        "name": sensor_name,
+        "temperature": temp_celsius,
+        "lastupdated": state.get("lastupdated")
+    }
+
+    if previous is None or previous["lastupdated"] != state.get("lastupdated"):
+        record(f"hue.{sensor_name}.temperature", temp_celsius)
+        logging.info(f"Outdoor sensor: {sensor_name} = {temp_celsius}°C")
+
+
+def _sensor_roles(HUEHOST, APIKEY):
+    """
+    Return the role index for the bridge, scanning all sensors only when
+    there is no index for this host/key yet or it is older than INDEX_TTL.
+    """
+    index = _sensor_index.get((HUEHOST, APIKEY))
+    if index and time.time() - index["time"] < INDEX_TTL:
+        return index["roles"]
+
+    sensors_data = _get_json(f"http://{HUEHOST}/api/{APIKEY}/sensors")
+    if sensors_data is None:
+        return index["roles"] if index else None
+
+    roles = _index_sensors(sensors_data)
+    _sensor_index[(HUEHOST, APIKEY)] = {"time": time.time(), "roles": roles}
+    for sensor_id in roles["outdoor_temperature"]:
+        _update_reading(HUEHOST, sensor_id, sensors_data[sensor_id])
+    logging.info(f"Indexed Hue sensors: {roles}")
+    return roles
+
+
+def get_zones(HUEHOST, APIKEY):
+    zones_data = _get_json(f"http://{HUEHOST}/api/{APIKEY}/groups")
+    if zones_data is None:
+        logging.error("Failed to retrieve zones")
         return None
+    return _parse_zones(zones_data)
 
 
 def get_outdoor_sensor_temperatures(HUEHOST, APIKEY):
     """
     Find Philips Hue outdoor sensors and return their temperatures.
-    
+    After the first scan only the indexed sensors are polled (/sensors/<id>),
+    and the last reading is kept if a sensor does not answer.
+
     Returns:
         list: Array of temperature readings in Celsius from outdoor sensors
     """
-    URL = f"http://{HUEHOST}/api/{APIKEY}/sensors"
-
-    try:
-        response = requests.get(URL)
-        if response.status_code != 200:
-            logging.error(f"Failed to retrieve sensors. Status Code: {response.status_code}")
+    with _sensor_lock:
+        index = _sensor_index.get((HUEHOST, APIKEY))
+        fresh_scan = not index or time.time() - index["time"] >= INDEX_TTL
+        roles = _sensor_roles(HUEHOST, APIKEY)
+        if roles is None:
+            logging.error("Failed to retrieve sensors")
             return []
 
-        sensors_data = response.json()
+        sensor_ids = roles["outdoor_temperature"]
+        if not fresh_scan:
+            for sensor_id in sensor_ids:
+                sensor_info = _get_json(f"http://{HUEHOST}/api/{APIKEY}/sensors/{sensor_id}")
+                if isinstance(sensor_info, dict) and "state" in sensor_info:
+                    _update_reading(HUEHOST, sensor_id, sensor_info)
+                elif isinstance(sensor_info, list):
+                    # Sensoren er fjernet fra broen; skann på nytt neste gang
+                    _sensor_index.pop((HUEHOST, APIKEY), None)
+
         temperatures = []
+        for sensor_id in sensor_ids:
+            reading = _sensor_readings.get((HUEHOST, sensor_id))
+            if reading is not None:
+                temperatures.append({key: reading[key] for key in ("id", "name", "temperature")})
+        return temperatures
 
-        for sensor_id, sensor_info in sensors_data.items():
-            # Look for temperature sensors (type: ZLLTemperature or CLIPTemperature)
-            sensor_type = sensor_info.get("type", "")
-            sensor_name = sensor_info.get("name", "Unknown")
-            
-            # Check if it's a temperature sensor and if it's an outdoor sensor
-            if "Temperature" in sensor_type:
-                is_outdoor = "outdoor" in sensor_name.lower() or "ute" in sensor_name.lower()
-                
-                if is_outdoor:
-                    state = sensor_info.get("state", {})
-                    # Temperature is in 1/100th of degrees Celsius
-                    temp_raw = state.get("temperature")
-                    
-                    if temp_raw is not None:
-                        temp_celsius = temp_raw / 100.0
-                        temperatures.append({
-                            "id": sensor_id,
-                            "name": sensor_name,
-                            "temperature": temp_celsius
-                        })
-                        logging.info(f"Found outdoor sensor: {sensor_name} = {temp_celsius}°C")
 
-        return temperatures
+def get_lights(HUEHOST, APIKEY):
+    """
+    Return {"zones", "outdoor_sensors"} from one combined bridge fetch.
+    /groups and /sensors are requested concurrently, and the result is cached
+    for CACHE_TTL seconds; callers arriving during a fetch wait for it.
+    """
+    with _lights_lock:
+        cached = _lights_cache.get(HUEHOST)
+        if cached and time.time() - cached["time"] < CACHE_TTL:
+            return cached["data"]
 
-    except requests.RequestException as e:
-        logging.error(f"Error connecting to Hue Bridge for sensors: {e}")
-        return []
\ No newline at end of file
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            zones = executor.submit(get_zones, HUEHOST, APIKEY)
+            sensors = executor.submit(get_outdoor_sensor_temperatures, HUEHOST, APIKEY)
+            data = {"zones": zones.result(), "outdoor_sensors": sensors.result()}
+
+        # Ikke cache et svar der broen ikke svarte
+        if data["zones"] is not None:
+            _lights_cache[HUEHOST] = {"time": time.time(), "data": data}
+        return data
+
+
+# Skrivekø for gruppekommandoer: broen tåler omtrent én gruppekommando i sekundet,
+# så kommandoer til samme gruppe slås sammen mens de venter på tur
+GROUP_COMMAND_INTERVAL = 1.0
+_group_commands = {"pending": {}, "timer": None, "last_sent": 0, "target": None}
+_group_lock = threading.Lock()
+
+
+def build_group_action(on=None, brightness=None, scene=None):
+    """
+    Build a v1 group action body. brightness is 0-100 %, where 0 turns
+    the group off. Raises ValueError for invalid input.
+    """
+    action = {}
+    if scene is not None:
+        action["scene"] = str(scene)
+    if brightness is not None:
+        brightness = float(brightness)
+        if not 0 <= brightness <= 100:
+            raise ValueError("brightness must be between 0 and 100")
+        if brightness == 0:
+            action["on"] = False
+        else:
+            action.update(on=True, bri=max(1, round(brightness * 254 / 100)))
+    if on is not None:
+        action["on"] = bool(on)
+    if not action:
+        raise ValueError("Nothing to set: give on, brightness or scene")
+    return action
+
+
+def queue_group_action(HUEHOST, APIKEY, group_id, action):
+    """
+    Queue an action for a group (zone/room). Actions for a group that is
+    still waiting are merged, and a scene replaces whatever was queued
+    before it. Returns the merged action pending for the group.
+    """
+    with _group_lock:
+        _group_commands["target"] = (HUEHOST, APIKEY)
+        pending = _group_commands["pending"]
+        if "scene" in action or group_id not in pending:
+            pending[group_id] = {}
+        pending[group_id].update(action)
+        merged = dict(pending[group_id])
+        _schedule_group_command()
+        return merged
+
+
+def toggle_group(HUEHOST, APIKEY, group_id, zones):
+    """Queue the opposite of the group's current (or already queued) on state."""
+    with _group_lock:
+        queued = _group_commands["pending"].get(group_id, {}).get("on")
+    if queued is None:
+        zone = next((z for z in zones or [] if z["id"] == group_id), None)
+        if zone is None:
+            raise ValueError(f"Unknown zone: {group_id}")
+        queued = zone["status"] == "on"
+    return queue_group_action(HUEHOST, APIKEY, group_id, {"on": not queued})
+
+
+def _schedule_group_command():
+    """Start a timer for the next send, spaced GROUP_COMMAND_INTERVAL apart. Caller holds _group_lock."""
+    if _group_commands["timer"] is not None or not _group_commands["pending"]:
+        return
+    delay = max(0, _group_commands["last_sent"] + GROUP_COMMAND_INTERVAL - time.time())
+    timer = threading.Timer(delay, _send_group_command)
+    timer.daemon = True
+    timer.start()
+    _group_commands["timer"] = timer
+
+
+def _send_group_command():
+    """Send the oldest queued group action, then schedule the next one."""
+    with _group_lock:
+        pending = _group_commands["pending"]
+        group_id = next(iter(pending))
+        action = pending.pop(group_id)
+        HUEHOST, APIKEY = _group_commands["target"]
+
+    URL = f"http://{HUEHOST}/api/{APIKEY}/groups/{group_id}/action"
+    try:
+        response = _session.put(URL, json=action, timeout=REQUEST_TIMEOUT)
+        result = response.json()
+        # Broen svarer med en liste av {"success": ...}/{"error": ...}; alt annet er en feil
+        if not isinstance(result, list) or not all(isinstance(r, dict) for r in result):
+            logging.error(f"Hue group {group_id} action got unexpected response: {result}")
+        elif any("error" in r for r in result):
+            logging.error(f"Hue group {group_id} action failed: {[r['error'] for r in result if 'error' in r]}")
+        else:
+            logging.info(f"Hue group {group_id} set to {action}")
+    except (requests.RequestException, ValueError) as e:
+        logging.error(f"Error sending Hue group action: {e}")
+    finally:
+        # Køen må alltid gå videre, ellers blir senere kommandoer liggende for alltid
+        with _group_lock:
+            _lights_cache.pop(HUEHOST, None)
+            _group_commands["last_sent"] = time.time()
+            _group_commands["timer"] = None
+            _schedule_group_command()
+
+
+def get_scenes(HUEHOST, APIKEY):
+    """Return the bridge's group scenes as [{"id", "name", "group"}]."""
+    scenes_data = _get_json(f"http://{HUEHOST}/api/{APIKEY}/scenes")
+    if scenes_data is None:
+        return None
+    return sorted(
+        (
+            {"id": scene_id, "name": scene.get("name", "Unknown"), "group": scene.get("group")}
+            for scene_id, scene in scenes_data.items()
+            if scene.get("type") == "GroupScene"
+        ),
+        key=lambda s: (s["group"] or "", s["name"])
+    )
@@ -1,10 +1,48 @@
 import requests
 import logging
+import threading
+import time
+from bisect import bisect_right
+from integration.timeseries import record
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
 BASE_URL = "https://api.millnorwaycloud.com"
 
+# idToken er gyldig i 10 minutter
+TOKEN_TTL = 9 * 60
+POLL_INTERVAL = 60
+MAX_CHANGES = 2000
+
+# Felter som spores per enhet; numeriske felter lagres også som tidsserier
+TRACKED_FIELDS = ("connected", "ambient_temp", "target_temp", "power", "humidity", "mode")
+NUMERIC_FIELDS = ("ambient_temp", "target_temp", "power", "humidity")
+
+_auth_cache = {"token": None, "expires": 0}
+
+# Siste snapshot per enhet og logg over endringer (sortert på tid)
+_tracker = {
+    "devices": {},
+    "changes": [],
+    "change_times": [],
+    "version": 0,
+    "last_poll": 0,
+    "rooms": None,
+    "rooms_version": -1,
+}
+_tracker_lock = threading.Lock()
+
+# Skrivekø: endringer samles i COMMAND_DELAY sekunder og sendes som ett kall per enhet/rom
+COMMAND_DELAY = 2.0
+# Kommandoer som ikke kunne sendes fordi innloggingen feilet, prøves igjen etter dette
+COMMAND_RETRY_DELAY = 60
+# Driftsmoduser Mill godtar i operation_mode
+OPERATION_MODES = ("weekly_program", "control_individually", "off")
+_commands = {"pending": {}, "timer": None, "credentials": None}
+_command_lock = threading.Lock()
+# Utfallet av siste sending per mål (kind, id): {"ok": bool, "ts": epoch}
+_command_results = {}
+
 def authenticate(username, password):
     """
     Authenticate with Mill API and return tokens
@@ -81,6 +119,7 @@ def get_mill_devices(id_token):
                 # Data is a list of rooms with devices
                 for room in rooms_data:
                     room_name = room.get("roomName", "Unknown")
+                    room_id = room.get("roomId") or room.get("id")
                     devices = room.get("devices", [])
                     
                     for device in devices:
@@ -101,8 +140,10 @@ def get_mill_devices(id_token):
                         mode = settings.get("operation_mode", "unknown")
                         
                         all_devices.append({
+                            "id": device.get("deviceId"),
                             "house": house_name,
                             "room": room_name,
+                            "room_id": room_id,
                             "name": name,
                             "type": device_type,
                             "connected": is_connected,
@@ -118,3 +159,258 @@ def get_mill_devices(id_token):
     except Exception as e:
         logging.error(f"Error fetching Mill devices: {e}")
         return []
+
+
+def get_token(username, password):
+    """Return a cached idToken, signing in again when it is about to expire."""
+    if _auth_cache["token"] and time.time() < _auth_cache["expires"]:
+        return _auth_cache["token"]
+
+    auth = authenticate(username, password)
+    if not auth or not auth.get("idToken"):
+        return None
+
+    _auth_cache.update(token=auth["idToken"], expires=time.time() + TOKEN_TTL)
+    return _auth_cache["token"]
+
+
+def _device_key(device):
+    return device.get("id") or f"{device['house']}/{device['room']}/{device['name']}"
+
+
+def track_mill_devices(devices, now=None):
+    """
+    Compare devices with the last snapshot per device and record field-level
+    deltas. Only changed numeric fields are written to the time-series store.
+    Returns the list of change records added.
+    """
+    now = now or time.time()
+    added = []
+
+    with _tracker_lock:
+        snapshots = _tracker["devices"]
+        for device in devices:
+            key = _device_key(device)
+            previous = snapshots.get(key)
+
+            delta = {}
+            for field in TRACKED_FIELDS:
+                old = previous.get(field) if previous else None
+                new = device.get(field)
+                if previous is None or old != new:
+                    delta[field] = {"old": old, "new": new}
+
+            snapshots[key] = device
+            if not delta:
+                continue
+
+            added.append({
+                "ts": now,
+                "device_id": key,
+                "room": device["room"],
+                "name": device["name"],
+                "changes": delta
+            })
+            for field in NUMERIC_FIELDS:
+                if field in delta:
+                    record(f"mill.{device['room']}.{device['name']}.{field}", delta[field]["new"], now)
+
+        if added:
+            _tracker["changes"].extend(added)
+            _tracker["change_times"].extend(c["ts"] for c in added)
+            overflow = len(_tracker["changes"]) - MAX_CHANGES
+            if overflow > 0:
+                del _tracker["changes"][:overflow]
+                del _tracker["change_times"][:overflow]
+            _tracker["version"] += 1
+
+    return added
+
+
+def get_mill_changes(since=0):
+    """Return change records newer than the given epoch timestamp."""
+    with _tracker_lock:
+        start = bisect_right(_tracker["change_times"], since)
+        return _tracker["changes"][start:]
+
+
+def get_mill_rooms():
+    """Return the latest snapshot grouped by room, regrouped only after changes."""
+    with _tracker_lock:
+        if _tracker["rooms_version"] != _tracker["version"]:
+            rooms = {}
+            for device in _tracker["devices"].values():
+                rooms.setdefault(device["room"], []).append(device)
+            _tracker["rooms"] = rooms
+            _tracker["rooms_version"] = _tracker["version"]
+        return _tracker["rooms"]
+
+
+def poll_mill(username, password):
+    """
+    Refresh device state from the cloud at most every POLL_INTERVAL seconds.
+    Returns False if authentication fails.
+    """
+    if time.time() - _tracker["last_poll"] < POLL_INTERVAL:
+        return True
+
+    token = get_token(username, password)
+    if not token:
+        return False
+
+    devices = get_mill_devices(token)
+    if devices:
+        track_mill_devices(devices)
+        _tracker["last_poll"] = time.time()
+    return True
+
+
+def queue_mill_command(username, password, kind, target_id, target_temp=None, mode=None):
+    """
+    Queue a setpoint change for a device or room ("device"/"room").
+    Changes for the same target within COMMAND_DELAY seconds are merged,
+    so a burst of +/- presses results in a single cloud call.
+    Returns the merged settings pending for that target.
+    """
+    if kind not in ("device", "room"):
+        raise ValueError(f"Unknown target kind: {kind}")
+
+    settings = {}
+    if target_temp is not None:
+        settings["target_temp"] = float(target_temp)
+    if mode is not None:
+        if mode not in OPERATION_MODES:
+            raise ValueError(f"Unknown Mill mode: {mode} (expected one of {', '.join(OPERATION_MODES)})")
+        settings["mode"] = mode
+    if not settings:
+        raise ValueError("Nothing to change")
+
+    with _command_lock:
+        _commands["credentials"] = (username, password)
+        pending = _commands["pending"].setdefault((kind, target_id), {})
+        pending.update(settings)
+        _start_flush_timer(COMMAND_DELAY)
+
+        return dict(pending)
+
+
+def _start_flush_timer(delay):
+    """Arm the flush timer unless one is already running. Call with _command_lock held."""
+    if _commands["timer"] is None:
+        timer = threading.Timer(delay, flush_mill_commands)
+        timer.daemon = True
+        timer.start()
+        _commands["timer"] = timer
+
+
+def _requeue(pending):
+    """Put unsent commands back; anything queued since the flush started wins."""
+    with _command_lock:
+        for target, settings in pending.items():
+            _commands["pending"][target] = {**settings, **_commands["pending"].get(target, {})}
+        _start_flush_timer(COMMAND_RETRY_DELAY)
+
+
+def _room_devices(room_id):
+    with _tracker_lock:
+        return [d for d in _tracker["devices"].values() if d.get("room_id") == room_id and d.get("id")]
+
+
+def _device_payload(settings):
+    """Only the fields that were asked for; a temperature change leaves the device's mode alone."""
+    payload = {}
+    if "mode" in settings:
+        payload["operation_mode"] = settings["mode"]
+    if "target_temp" in settings:
+        payload["temperature_normal"] = settings["target_temp"]
+    return {"deviceType": "Heaters", "enabled": True, "settings": payload}
+
+
+def flush_mill_commands():
+    """Send all queued changes: one call per room temperature and one per device."""
+    with _command_lock:
+        pending, _commands["pending"] = _commands["pending"], {}
+        timer, _commands["timer"] = _commands["timer"], None
+        credentials = _commands["credentials"]
+
+    if timer is not None:
+        timer.cancel()
+    if not pending:
+        return []
+
+    token = get_token(*credentials)
+    if not token:
+        logging.error(f"Mill authentication failed, {len(pending)} commands kept for retry")
+        _requeue(pending)
+        results = []
+        for target in pending:
+            results.append({"url": f"{target[0]}/{target[1]}", "error": "Mill authentication failed"})
+            _record_result(target, results[-1])
+        return results
+
+    # Romvise moduser trenger enhetslisten; hent den først hvis rommet ikke er kjent ennå
+    mode_rooms = [target_id for (kind, target_id), settings in pending.items() if kind == "room" and "mode" in settings]
+    if any(not _room_devices(room_id) for room_id in mode_rooms):
+        devices = get_mill_devices(token)
+        if devices:
+            track_mill_devices(devices)
+
+    # Romvise moduser brytes ned til enhetene i rommet, slått sammen med enhetsendringer
+    device_settings = {}
+    room_temps = {}
+    results = []
+    for (kind, target_id), settings in pending.items():
+        if kind == "room":
+            if "target_temp" in settings:
+                room_temps[target_id] = settings["target_temp"]
+            if "mode" in settings:
+                devices = _room_devices(target_id)
+                if not devices:
+                    logging.error(f"Mill room {target_id} has no known devices, mode not sent")
+                    results.append({"url": f"room/{target_id}", "error": "No known devices in room"})
+                    _record_result(("room", target_id), results[-1])
+                for device in devices:
+                    device_settings.setdefault(device["id"], {}).setdefault("mode", settings["mode"])
+        else:
+            device_settings.setdefault(target_id, {}).update(settings)
+
+    headers = {"Authorization": f"Bearer {token}"}
+    session = requests.Session()
+
+    for room_id, temp in room_temps.items():
+        url = f"{BASE_URL}/rooms/{room_id}/temperature"
+        results.append(_send(session, "post", url, headers, {"roomComfortTemperature": temp}))
+        _record_result(("room", room_id), results[-1])
+
+    for device_id, settings in device_settings.items():
+        url = f"{BASE_URL}/devices/{device_id}/settings"
+        results.append(_send(session, "patch", url, headers, _device_payload(settings)))
+        _record_result(("device", device_id), results[-1])
+
+    # Hent ny status ved neste /mill
+    _tracker["last_poll"] = 0
+    return results
+
+
+def _record_result(target, result):
+    ok = "error" not in result and result["status"] < 300
+    with _command_lock:
+        _command_results[target] = {"ok": ok, "ts": time.time()}
+
+
+def command_failed(kind, target_id):
+    """True if the last command sent to this device/room was not accepted by Mill."""
+    with _command_lock:
+        result = _command_results.get((kind, target_id))
+    return result is not None and not result["ok"]
+
+
+def _send(session, method, url, headers, payload):
+    try:
+        response = getattr(session, method)(url, json=payload, headers=headers, timeout=10)
+        if response.status_code >= 300:
+            logging.error(f"Mill command failed {response.status_code} for {url}: {response.text}")
+        return {"url": url, "status": response.status_code}
+    except requests.RequestException as e:
+        logging.error(f"Mill command error for {url}: {e}")
+        return {"url": url, "error": str(e)}
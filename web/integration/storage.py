@@ -0,0 +1,14 @@
+import json
+import os
+
+
+def write_json_atomic(path, payload):
+    """
+    Write payload as JSON to path via a temporary file and os.replace, so a
+    reader (or a crash mid-write) never sees a half-written cache file.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False)
+    os.replace(tmp, path)
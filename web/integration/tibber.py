@@ -0,0 +1,192 @@
+import base64
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+import requests
+from config import CONFIG
+from integration.timeseries import record
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+TIBBER_URL = "https://api.tibber.com/v1-beta/gql"
+
+# Første synk henter siste 31 døgn, deretter sider fra siste lagrede time
+INITIAL_HOURS = 31 * 24
+PAGE_SIZE = 200
+SYNC_INTERVAL = 60 * 60  # 1 hour
+RETRY_INTERVAL = 5 * 60  # vent minst så lenge etter en feilet synk
+
+CONSUMPTION_QUERY = """
+query($first: Int, $last: Int, $after: String) {
+  viewer {
+    homes {
+      consumption(resolution: HOURLY, first: $first, last: $last, after: $after) {
+        pageInfo { endCursor hasNextPage }
+        nodes { from to cost unitPrice consumption }
+      }
+    }
+  }
+}
+"""
+
+# Strftime-format for aggregering per periode
+PERIODS = {
+    "day": "%Y-%m-%d",
+    "month": "%Y-%m",
+}
+
+_state = {"path": None, "conn": None, "last_sync": 0, "last_attempt": 0, "syncing": False}
+_lock = threading.Lock()
+_sync_lock = threading.Lock()
+
+
+def _base_dir():
+    return Path(__file__).resolve().parents[2]
+
+
+def configure(path=None):
+    """Point the store at another database file (used by tests)."""
+    with _lock:
+        if _state["conn"] is not None:
+            _state["conn"].close()
+        _state.update(path=Path(path) if path else None, conn=None, last_sync=0, last_attempt=0)
+
+
+def _connect():
+    if _state["conn"] is None:
+        path = _state["path"] or Path(CONFIG.get("TIBBER_DB", _base_dir() / "data" / "tibber.sqlite"))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(path, check_same_thread=False)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS consumption ("
+            "ts INTEGER PRIMARY KEY, time_from TEXT NOT NULL, "
+            "consumption REAL, cost REAL, unit_price REAL)"
+        )
+        conn.commit()
+        _state["conn"] = conn
+    return _state["conn"]
+
+
+def _cursor_for(time_from):
+    """Tibber's pagination cursors are base64-encoded 'from' timestamps."""
+    return base64.b64encode(time_from.encode("utf-8")).decode("ascii")
+
+
+def _last_stored():
+    row = _connect().execute("SELECT time_from FROM consumption ORDER BY ts DESC LIMIT 1").fetchone()
+    return row[0] if row else None
+
+
+def _fetch_page(token, variables):
+    response = requests.post(
+        TIBBER_URL,
+        json={"query": CONSUMPTION_QUERY, "variables": variables},
+        headers={"Authorization": f"Bearer {token}"},
+        timeout=15
+    )
+    response.raise_for_status()
+    data = response.json()
+    logging.debug(f"Tibber consumption page: {data}")
+
+    if data.get("errors"):
+        raise RuntimeError(f"Tibber API error: {data['errors'][0].get('message')}")
+
+    homes = data["data"]["viewer"]["homes"]
+    if not homes:
+        raise RuntimeError("No home data found in Tibber API response")
+    return homes[0]["consumption"]
+
+
+def sync_tibber_consumption(token):
+    """
+    Pull hourly consumption newer than the last stored hour, following the
+    pagination cursor until there are no more pages. Returns the number of
+    new hours stored.
+    """
+    with _sync_lock:
+        with _lock:
+            last = _last_stored()
+        if last:
+            variables = {"first": PAGE_SIZE, "after": _cursor_for(last)}
+        else:
+            variables = {"last": INITIAL_HOURS}
+
+        new_rows = 0
+        while True:
+            page = _fetch_page(token, variables)
+            rows = [
+                (int(datetime.fromisoformat(n["from"]).timestamp()), n["from"], n["consumption"], n["cost"], n["unitPrice"])
+                for n in page.get("nodes", [])
+                if n.get("consumption") is not None
+            ]
+
+            with _lock, _connect() as conn:
+                for row in rows:
+                    cursor = conn.execute("INSERT OR IGNORE INTO consumption VALUES (?, ?, ?, ?, ?)", row)
+                    if cursor.rowcount:
+                        new_rows += 1
+                        record("tibber.consumption", row[2], row[0])
+                        record("tibber.cost", row[3], row[0])
+
+            page_info = page.get("pageInfo", {})
+            if "first" not in variables or not page_info.get("hasNextPage") or not page_info.get("endCursor"):
+                break
+            variables = {"first": PAGE_SIZE, "after": page_info["endCursor"]}
+
+        _state["last_sync"] = time.time()
+        logging.info(f"Tibber sync stored {new_rows} new hours")
+        return new_rows
+
+
+def _sync_in_background(token):
+    try:
+        sync_tibber_consumption(token)
+    except Exception as e:
+        logging.error(f"Tibber sync failed: {e}")
+    finally:
+        _state["syncing"] = False
+
+
+def ensure_tibber_sync(token):
+    """
+    Start a background sync if the last one is older than SYNC_INTERVAL.
+    After a failed attempt the next one waits RETRY_INTERVAL, so requests
+    do not call Tibber again while it is down.
+    """
+    now = time.time()
+    with _lock:
+        if _state["syncing"] or now - _state["last_sync"] < SYNC_INTERVAL or now - _state["last_attempt"] < RETRY_INTERVAL:
+            return
+        _state["syncing"] = True
+        _state["last_attempt"] = now
+    threading.Thread(target=_sync_in_background, args=(token,), daemon=True, name="tibber-sync").start()
+
+
+def get_tibber_consumption(token, period="day", limit=31):
+    """
+    Return aggregated consumption and cost per day or month from the local
+    store, newest first. Triggers a background sync when the data is stale.
+    """
+    if period not in PERIODS:
+        return {"error": f"Unknown period: {period}"}
+
+    ensure_tibber_sync(token)
+
+    with _lock:
+        rows = _connect().execute(
+            "SELECT strftime(?, ts, 'unixepoch', 'localtime') AS period, "
+            "SUM(consumption), SUM(cost), COUNT(*) FROM consumption "
+            "GROUP BY period ORDER BY period DESC LIMIT ?",
+            (PERIODS[period], limit)
+        ).fetchall()
+
+    return {
+        "period": period,
+        "items": [
+            {"period": p, "consumption": round(kwh or 0, 3), "cost": round(cost or 0, 2), "hours": hours}
+            for p, kwh, cost, hours in rows
+        ]
+    }
@@ -1,52 +1,73 @@
 import json
 import os
+import threading
 from datetime import datetime
-import locale
 import logging
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
+# Faste ukedagsnavn i stedet for locale.setlocale, som gjelder hele prosessen og ikke er trådsikker
+WEEKDAYS = ["mandag", "tirsdag", "onsdag", "torsdag", "fredag", "lørdag", "søndag"]
+WEEKDAYS_EN = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+# Indeks per mappe: {"signature", "days": {ukedag: {barn: fag}}}
+_plan_index = {}
+_index_lock = threading.Lock()
 
-def get_dagens_dag():
-    try:
-        locale.setlocale(locale.LC_TIME, "nb_NO.UTF-8")
-    except locale.Error:
-        pass  # fallback til engelsk
 
+def get_dagens_dag():
     # Finn riktig ukedag som nøkkel
-    today = datetime.now()
-    weekday_key = today.strftime('%A').lower()
-    
-    return weekday_key
+    return WEEKDAYS[datetime.now().weekday()]
 
-def get_dagens_timeplaner(planmappe='./timeplaner'):
-    # Sørg for norsk ukedag hvis ønskelig (må være installert på systemet)
-    try:
-        locale.setlocale(locale.LC_TIME, "nb_NO.UTF-8")
-    except locale.Error:
-        pass  # fallback til engelsk
 
-    # Finn riktig ukedag som nøkkel
-    today = datetime.now()
-    weekday_key = today.strftime('%A').lower()  # f.eks. 'mandag'
+def _signature(planmappe):
+    """Directory mtime plus (name, mtime, size) of each .json file; changes whenever a plan does."""
+    entries = []
+    with os.scandir(planmappe) as it:
+        for entry in it:
+            if entry.name.endswith('.json'):
+                stat = entry.stat()
+                entries.append((entry.name, stat.st_mtime_ns, stat.st_size))
+    return os.stat(planmappe).st_mtime_ns, tuple(sorted(entries))
 
-    resultater = {}
 
-    # Gå gjennom alle .json-filer i angitt mappe
-    for filnavn in os.listdir(planmappe):
-        if not filnavn.endswith('.json'):
-            continue
+def _build_index(planmappe, filnavn_liste):
+    """Parse every plan once into {ukedag: {barn: fag}}."""
+    days = {weekday: {} for weekday in WEEKDAYS}
 
+    for filnavn in filnavn_liste:
         barn_navn = os.path.splitext(filnavn)[0]  # f.eks. "ola"
         filsti = os.path.join(planmappe, filnavn)
 
         try:
             with open(filsti, 'r', encoding='utf-8') as f:
                 plan = json.load(f)
-            dagens_fag = plan.get(weekday_key, [])
+            for i, weekday in enumerate(WEEKDAYS):
+                # Engelske nøkler støttes fortsatt for planer laget uten norsk locale
+                days[weekday][barn_navn] = plan.get(weekday, plan.get(WEEKDAYS_EN[i], []))
         except Exception as e:
-            dagens_fag = [f"<Feil ved lesing: {e}>"]
+            for weekday in WEEKDAYS:
+                days[weekday][barn_navn] = [f"<Feil ved lesing: {e}>"]
+
+    return days
 
-        resultater[barn_navn] = dagens_fag
 
-    return resultater
\ No newline at end of file
+def _get_index(planmappe):
+    """Return the weekday index for the folder, rebuilding it only when the folder or a plan has changed."""
+    with _index_lock:
+        signature = _signature(planmappe)
+        cached = _plan_index.get(planmappe)
+        if cached and cached["signature"] == signature:
+            return cached["days"]
+
+        days = _build_index(planmappe, [name for name, _, _ in signature[1]])
+        _plan_index[planmappe] = {"signature": signature, "days": days}
+        logging.info(f"Loaded {len(signature[1])} timeplaner from {planmappe}")
+        return days
+
+
+def get_dagens_timeplaner(planmappe='./timeplaner'):
+    # Finn riktig ukedag som nøkkel, f.eks. 'mandag'
+    weekday_key = get_dagens_dag()
+
+    return dict(_get_index(planmappe)[weekday_key])
@@ -0,0 +1,333 @@
+import atexit
+import json
+import logging
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from config import CONFIG
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+MINUTE = 60
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+
+# Rollup-nivåer: bøttestørrelse i sekunder -> tabell
+ROLLUPS = {
+    MINUTE: "rollup_minute",
+    HOUR: "rollup_hour",
+    DAY: "rollup_day",
+}
+
+# Hvor lenge hvert nivå beholdes i sekunder (None = for alltid)
+DEFAULT_RETENTION = {
+    "samples": 2 * DAY,
+    MINUTE: 14 * DAY,
+    HOUR: 2 * 365 * DAY,
+    DAY: None,
+}
+
+# SQL for hver aggregering: (fra rollup-tabell, fra rå samples)
+AGGREGATES = {
+    "avg": ("SUM(sum) / SUM(count)", "AVG(value)"),
+    "min": ("MIN(min)", "MIN(value)"),
+    "max": ("MAX(max)", "MAX(value)"),
+}
+
+
+BATCH_SIZE = 200
+FLUSH_INTERVAL = MINUTE
+PRUNE_INTERVAL = HOUR
+
+_state = {
+    "path": None,
+    "conn": None,
+    "buffer": [],
+    "last_flush": time.time(),
+    "last_prune": 0,
+    "retention": dict(DEFAULT_RETENTION),
+    "influx": None,
+}
+_lock = threading.RLock()
+
+
+def _base_dir():
+    return Path(__file__).resolve().parents[2]
+
+
+def _db_path():
+    if _state["path"] is None:
+        _state["path"] = Path(CONFIG.get("TIMESERIES_DB", _base_dir() / "data" / "timeseries.sqlite"))
+    return _state["path"]
+
+
+def configure(path=None, retention=None):
+    """Point the store at another database file and/or retention policy (used by tests)."""
+    with _lock:
+        if _state["conn"] is not None:
+            _state["conn"].close()
+        _state.update(path=Path(path) if path else None, conn=None, buffer=[], last_prune=0)
+        _state["retention"] = {**DEFAULT_RETENTION, **(retention or {})}
+
+
+def _connect():
+    if _state["conn"] is None:
+        path = _db_path()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS samples (metric TEXT NOT NULL, ts INTEGER NOT NULL, value REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS samples_metric_ts ON samples (metric, ts)")
+        for table in ROLLUPS.values():
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} ("
+                "metric TEXT NOT NULL, ts INTEGER NOT NULL, count INTEGER NOT NULL, "
+                "sum REAL NOT NULL, min REAL NOT NULL, max REAL NOT NULL, "
+                "PRIMARY KEY (metric, ts)) WITHOUT ROWID"
+            )
+        conn.commit()
+        _state["conn"] = conn
+    return _state["conn"]
+
+
+def _local_midnight(day):
+    return int(datetime(day.year, day.month, day.day).timestamp())
+
+
+def bucket_start(ts, step):
+    """Start of the bucket containing ts. Daily buckets follow local midnight, also on DST days."""
+    if step == DAY:
+        return _local_midnight(date.fromtimestamp(ts))
+    return ts - ts % step
+
+
+def record(metric, value, ts=None):
+    """
+    Queue one reading. Readings are written in batches, either when the buffer
+    is full or when FLUSH_INTERVAL has passed since the last write.
+    """
+    if value is None:
+        return
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return
+
+    now = time.time()
+    with _lock:
+        _state["buffer"].append((metric, int(ts if ts is not None else now), value))
+        due = len(_state["buffer"]) >= BATCH_SIZE or now - _state["last_flush"] >= FLUSH_INTERVAL
+
+    if due:
+        flush()
+
+
+def record_many(prefix, values, ts=None):
+    """Queue several readings sharing a metric prefix, e.g. record_many("airthings", {"co2": 612})."""
+    for key, value in values.items():
+        record(f"{prefix}.{key}", value, ts)
+
+
+def flush():
+    """Write buffered readings to the raw table and all rollups in one transaction."""
+    with _lock:
+        batch, _state["buffer"] = _state["buffer"], []
+        _state["last_flush"] = time.time()
+        if not batch:
+            return
+
+        try:
+            conn = _connect()
+            with conn:
+                conn.executemany("INSERT INTO samples (metric, ts, value) VALUES (?, ?, ?)", batch)
+                for step, table in ROLLUPS.items():
+                    conn.executemany(
+                        f"INSERT INTO {table} (metric, ts, count, sum, min, max) VALUES (?, ?, ?, ?, ?, ?) "
+                        "ON CONFLICT (metric, ts) DO UPDATE SET "
+                        "count = count + excluded.count, sum = sum + excluded.sum, "
+                        "min = MIN(min, excluded.min), max = MAX(max, excluded.max)",
+                        _aggregate(batch, step)
+                    )
+        except sqlite3.Error as e:
+            logging.error(f"Time-series write failed ({len(batch)} readings dropped): {e}")
+            return
+
+        if time.time() - _state["last_prune"] >= PRUNE_INTERVAL:
+            prune()
+
+    _write_influx(batch)
+
+
+def _aggregate(batch, step):
+    """Pre-aggregate a batch into (metric, bucket, count, sum, min, max) rows."""
+    buckets = {}
+    for metric, ts, value in batch:
+        key = (metric, bucket_start(ts, step))
+        agg = buckets.get(key)
+        if agg is None:
+            buckets[key] = [1, value, value, value]
+        else:
+            agg[0] += 1
+            agg[1] += value
+            agg[2] = min(agg[2], value)
+            agg[3] = max(agg[3], value)
+    return [(metric, ts, *agg) for (metric, ts), agg in buckets.items()]
+
+
+def prune(now=None):
+    """Delete rows older than the retention policy for each level."""
+    now = now or time.time()
+    retention = _state["retention"]
+    with _lock:
+        conn = _connect()
+        with conn:
+            if retention.get("samples") is not None:
+                conn.execute("DELETE FROM samples WHERE ts < ?", (now - retention["samples"],))
+            for step, table in ROLLUPS.items():
+                if retention.get(step) is not None:
+                    conn.execute(f"DELETE FROM {table} WHERE ts < ?", (now - retention[step],))
+        _state["last_prune"] = now
+
+
+def query(metric, start, end, step=None):
+    """
+    Return [(ts, avg, min, max)] for metric between start and end (epoch seconds)
+    from the rollup with the given bucket size, or raw samples if step is None.
+    """
+    flush()
+    with _lock:
+        conn = _connect()
+        if step is None:
+            rows = conn.execute(
+                "SELECT ts, value, value, value FROM samples WHERE metric = ? AND ts >= ? AND ts < ? ORDER BY ts",
+                (metric, start, end)
+            )
+        else:
+            rows = conn.execute(
+                f"SELECT ts, sum / count, min, max FROM {ROLLUPS[step]} "
+                "WHERE metric = ? AND ts >= ? AND ts < ? ORDER BY ts",
+                (metric, bucket_start(start, step), end)
+            )
+        return rows.fetchall()
+
+
+def pick_resolution(step):
+    """Return the coarsest rollup bucket size that still fits in step, or None for raw samples."""
+    fitting = [size for size in ROLLUPS if size <= step]
+    return max(fitting) if fitting else None
+
+
+def history(metric, start, end, step, agg="avg"):
+    """
+    Return (timestamps, values) for metric between start and end, bucketed
+    by step seconds. Reads the coarsest rollup that satisfies step, so a
+    30-day query with a daily step touches 30 rows instead of every sample.
+    """
+    flush()
+    resolution = pick_resolution(step)
+    if resolution == DAY and step % DAY == 0:
+        return _history_days(metric, start, end, step // DAY, agg)
+    from_rollup, from_samples = AGGREGATES[agg]
+
+    if resolution is None:
+        table, value_sql, origin = "samples", from_samples, start
+    else:
+        table, value_sql, origin = ROLLUPS[resolution], from_rollup, bucket_start(start, resolution)
+
+    sql = (
+        f"SELECT (ts - :origin) / :step * :step + :origin AS bucket, {value_sql} FROM {table} "
+        "WHERE metric = :metric AND ts >= :origin AND ts < :end GROUP BY bucket ORDER BY bucket"
+    )
+    params = {"origin": int(origin), "step": int(step), "metric": metric, "end": int(end)}
+
+    timestamps, values = [], []
+    with _lock:
+        for bucket, value in _connect().execute(sql, params):
+            timestamps.append(bucket)
+            values.append(round(value, 3))
+    return timestamps, values
+
+
+def _history_days(metric, start, end, days, agg):
+    """
+    history() for steps of whole days. A local day is 23 or 25 hours around DST
+    changes, so day rows are grouped by calendar date instead of fixed seconds.
+    """
+    origin = bucket_start(start, DAY)
+    origin_day = date.fromtimestamp(origin)
+    with _lock:
+        rows = _connect().execute(
+            f"SELECT ts, count, sum, min, max FROM {ROLLUPS[DAY]} WHERE metric = ? AND ts >= ? AND ts < ? ORDER BY ts",
+            (metric, origin, int(end))
+        ).fetchall()
+
+    buckets = {}
+    for ts, count, total, low, high in rows:
+        # Nærmeste dato, så rader lagret en time fra midnatt havner på riktig dag
+        index = (date.fromtimestamp(ts + DAY // 2) - origin_day).days // days
+        agg_row = buckets.setdefault(index, [0, 0.0, low, high])
+        agg_row[0] += count
+        agg_row[1] += total
+        agg_row[2] = min(agg_row[2], low)
+        agg_row[3] = max(agg_row[3], high)
+
+    timestamps, values = [], []
+    for index, (count, total, low, high) in sorted(buckets.items()):
+        timestamps.append(_local_midnight(origin_day + timedelta(days=index * days)))
+        values.append(round({"avg": total / count, "min": low, "max": high}[agg], 3))
+    return timestamps, values
+
+
+def history_json(metrics, start, end, step, agg="avg"):
+    """
+    Stream a compact JSON document with one {"t": [...], "v": [...]} pair per
+    metric, yielding each metric as soon as it has been read. If a query fails
+    once streaming has started, the document is closed with an "error" key so
+    the client still gets valid JSON.
+    """
+    header = {"from": int(start), "to": int(end), "step": int(step), "resolution": pick_resolution(step) or 0}
+    yield json.dumps(header)[:-1] + ', "metrics": {'
+
+    try:
+        for i, metric in enumerate(metrics):
+            timestamps, values = history(metric, start, end, step, agg)
+            prefix = ", " if i else ""
+            yield f'{prefix}{json.dumps(metric)}: {json.dumps({"t": timestamps, "v": values}, separators=(",", ":"))}'
+    except Exception as e:
+        logging.error(f"History query failed: {e}")
+        yield f'}}, "error": {json.dumps(str(e))}}}'
+        return
+
+    yield "}}"
+
+
+def _influx_client():
+    """Optional InfluxDB 1.x sink, enabled by CONFIG['INFLUXDB']."""
+    if _state["influx"] is None:
+        settings = CONFIG.get("INFLUXDB")
+        _state["influx"] = False
+        if settings:
+            try:
+                from influxdb import InfluxDBClient
+                _state["influx"] = InfluxDBClient(**settings)
+            except ImportError:
+                logging.error("influxdb not installed, InfluxDB sink disabled")
+    return _state["influx"]
+
+
+def _write_influx(batch):
+    client = _influx_client()
+    if not client:
+        return
+    points = [{"measurement": metric, "time": ts, "fields": {"value": value}} for metric, ts, value in batch]
+    try:
+        client.write_points(points, time_precision="s")
+    except Exception as e:
+        logging.error(f"InfluxDB write failed: {e}")
+
+
+atexit.register(flush)
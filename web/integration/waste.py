@@ -1,31 +1,165 @@
 # https://www.oslo.kommune.no/xmlhttprequest.php?service=ren.search&street=Årvollveien&number=34&letter=&street_id=18808
+import json
+import logging
+import re
+import threading
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
 import requests
 
-def get_garbage(GBURL):
-    URL = GBURL
-    #%C3%98streheimsveien&number=20&letter=C&street_id=18703
-    HEADERS = {"User-Agent": "homeauto/1.0 (tkjelsrud@gmail.com)"}  # Customize user agent
+from integration.storage import write_json_atomic
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+HEADERS = {"User-Agent": "homeauto/1.0 (tkjelsrud@gmail.com)"}  # Customize user agent
+FRACTIONS = ["Restavfall", "Papir"]
+RETRY_TTL = 60 * 60      # uten kommende hentedato spørres kommunen igjen om en time
+FAILURE_RETRY = 5 * 60   # etter en feilet henting spørres kommunen ikke igjen før etter dette
+SCHEDULE_WEEKS = 12      # hvor langt frem timeplanen regnes ut
+
+# "Hver uke", "Hver 2. uke", "Hver 4. uke"
+FREQUENCY_RE = re.compile(r"hver\s+(?:(\d+)\.\s*)?uke", re.IGNORECASE)
+
+_waste_cache = {}
+_waste_lock = threading.Lock()
+# Tidspunkt for siste feilede henting per URL
+_failures = {}
+
+
+def _base_dir():
+    return Path(__file__).resolve().parents[2]
+
+
+def _cache_path():
+    return _base_dir() / "data" / "waste" / "schedule.json"
+
+
+def _parse_date(date_str):
+    # Format: "11.03.2025"
+    return datetime.strptime(date_str, "%d.%m.%Y").date()
+
+
+def _frequency_weeks(text):
+    """Weeks between pickups from HenteHyppighet, or None if the text is not understood."""
+    match = FREQUENCY_RE.search(text or "")
+    if not match:
+        return None
+    return int(match.group(1) or 1)
+
 
-    response = requests.get(URL, headers=HEADERS)
+def _parse_schedule(data):
+    """Return {"next": {fraksjon: "dd.mm.yyyy"}, "weeks": {fraksjon: N}} from the API answer."""
+    pickups = {}
+    weeks = {}
 
-    if response.status_code == 200:
-        data = response.json()
+    # ✅ Only process the first entry (to avoid duplicates)
+    hentepunkts = data["data"]["result"][0]["HentePunkts"]
 
-        schedule = {}
+    for hentepunkt in hentepunkts:  # Only check unique pickup locations
+        for tjeneste in hentepunkt["Tjenester"]:  # Services per location
+            fraksjon = tjeneste["Fraksjon"]["Tekst"]  # "Restavfall" or "Papir"
+            dato = tjeneste["TommeDato"]  # Pickup date
+            hyppighet = tjeneste.get("HenteHyppighet", {}).get("Tekst")  # e.g., "Hver 4. uke"
 
-        # ✅ Only process the first entry (to avoid duplicates)
-        hentepunkts = data["data"]["result"][0]["HentePunkts"]
+            if fraksjon in FRACTIONS and fraksjon not in pickups:
+                pickups[fraksjon] = dato  # Save only the first match
+                weeks[fraksjon] = _frequency_weeks(hyppighet)
 
-        for hentepunkt in hentepunkts:  # Only check unique pickup locations
-            for tjeneste in hentepunkt["Tjenester"]:  # Services per location
-                fraksjon = tjeneste["Fraksjon"]["Tekst"]  # "Restavfall" or "Papir"
-                dato = tjeneste["TommeDato"]  # Pickup date
-                #hyppighet = tjeneste["HenteHyppighet"]["Tekst"]  # e.g., "Hver 4. uke"
+    return {"next": pickups, "weeks": weeks}
 
-                if fraksjon in ["Restavfall", "Papir"] and fraksjon not in schedule:
-                    schedule[fraksjon] = dato  # Save only the first match
 
-        return schedule  # ✅ Example output: {'Restavfall': '11.03.2025', 'Papir': '19.03.2025'}
+def _expires(schedule, today=None):
+    """The cache is valid until the earliest upcoming pickup has passed (midnight after it)."""
+    today = today or date.today()
+    upcoming = [d for d in (_parse_date(s) for s in schedule["next"].values()) if d >= today]
+    if not upcoming:
+        return time.time() + RETRY_TTL
+    return datetime.combine(min(upcoming) + timedelta(days=1), datetime.min.time()).timestamp()
 
-    else:
+
+def _load_cached(GBURL):
+    entry = _waste_cache.get(GBURL)
+    if entry is None:
+        try:
+            with open(_cache_path(), encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get("url") != GBURL:
+            return None
+        _waste_cache[GBURL] = entry
+    return entry
+
+
+def _get_schedule(GBURL):
+    """Parsed schedule from memory/disk, fetched from the kommune only when it has expired."""
+    with _waste_lock:
+        cached = _load_cached(GBURL)
+        if cached and time.time() < cached["expires"]:
+            return cached
+        if time.time() - _failures.get(GBURL, 0) < FAILURE_RETRY:
+            return cached
+
+        try:
+            response = requests.get(GBURL, headers=HEADERS, timeout=10)
+            if response.status_code != 200:
+                raise RuntimeError(f"Status Code: {response.status_code}")
+            schedule = _parse_schedule(response.json())
+        except (requests.RequestException, RuntimeError, ValueError, KeyError, IndexError) as e:
+            logging.error(f"Failed to fetch waste schedule: {e}")
+            _failures[GBURL] = time.time()
+            # Gammel plan er bedre enn ingen
+            return cached
+
+        _failures.pop(GBURL, None)
+        entry = {"url": GBURL, "expires": _expires(schedule), **schedule}
+        _waste_cache[GBURL] = entry
+        try:
+            write_json_atomic(_cache_path(), entry)
+        except OSError as e:
+            logging.error(f"Could not write waste cache: {e}")
+        return entry
+
+
+def get_garbage(GBURL):
+    entry = _get_schedule(GBURL)
+    if entry is None:
         return {"error": "Failed to fetch data"}
+    return dict(entry["next"])  # ✅ Example output: {'Restavfall': '11.03.2025', 'Papir': '19.03.2025'}
+
+
+def get_garbage_schedule(GBURL, start=None, weeks=SCHEDULE_WEEKS):
+    """
+    Pickup dates per fraction from `start` (default today) and `weeks` ahead,
+    derived from the next TommeDato and HenteHyppighet without extra calls.
+    Fractions with an unknown frequency only get their next date.
+
+    Returns:
+        dict: {'Restavfall': ['11.03.2025', '08.04.2025', ...], ...} or an error
+    """
+    entry = _get_schedule(GBURL)
+    if entry is None:
+        return {"error": "Failed to fetch data"}
+
+    start = start or date.today()
+    end = start + timedelta(weeks=weeks)
+    schedule = {}
+    for fraksjon, date_str in entry["next"].items():
+        anchor = _parse_date(date_str)
+        step = entry["weeks"].get(fraksjon)
+        if not step:
+            schedule[fraksjon] = [date_str] if start <= anchor <= end else []
+            continue
+
+        # Samme rytme bakover og fremover fra kjent dato
+        period = timedelta(weeks=step)
+        current = anchor - ((anchor - start) // period) * period
+        dates = []
+        while current <= end:
+            dates.append(current.strftime("%d.%m.%Y"))
+            current += period
+        schedule[fraksjon] = dates
+
+    return schedule
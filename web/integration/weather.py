@@ -1,61 +1,227 @@
-import requests
+import json
 import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+import requests
+from integration.storage import write_json_atomic
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
+HEADERS = {"User-Agent": "homeweather/1.0 (your@email.com)"}
+
+PRODUCT_URLS = {
+    "locationforecast": "https://api.met.no/weatherapi/locationforecast/2.0/compact",
+    "nowcast": "https://api.met.no/weatherapi/nowcast/2.0/complete",
+}
+
+# Brukes når met.no ikke sender Expires
+DEFAULT_TTL = 10 * 60
+# Etter en feilet forespørsel spørres met.no ikke igjen for samme punkt før etter dette
+FAILURE_RETRY = 60
+
+# Feltene frontend og ESP32 bruker; resten av met.no-svaret kastes ved parsing
+INSTANT_FIELDS = ("air_temperature", "relative_humidity", "wind_speed", "wind_from_direction")
+PERIODS = ("next_1_hours", "next_6_hours")
+
+# met.no ber om maks 4 desimaler; samme avrundede punkt deler cache og forespørsel
+COORDINATE_DECIMALS = 4
+
+# Cache per (lat, lon, produkt): {"expires": epoch, "last_modified": str, "timeseries": [...]}
+_weather_cache = {}
+_cache_lock = threading.Lock()
 
-def _fetch_timeseries(url, headers):
-    """Helper to fetch timeseries from met.no endpoints with basic error handling."""
+# Pågående forespørsler per nøkkel; samtidige kall venter på samme Future
+_inflight = {}
+# Tidspunkt for siste feilede forespørsel per nøkkel
+_failures = {}
+
+
+def _base_dir():
+    return Path(__file__).resolve().parents[2]
+
+
+def _cache_path(lat, lon, product):
+    return _base_dir() / "data" / "weather" / f"{product}_{lat}_{lon}.json"
+
+
+def _load_entry(key):
+    """Return the cached entry for key from memory, falling back to disk."""
+    entry = _weather_cache.get(key)
+    if entry is None:
+        path = _cache_path(*key)
+        if path.exists():
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    entry = _weather_cache[key] = json.load(f)
+            except (OSError, ValueError) as e:
+                logging.error(f"Could not read weather cache {path}: {e}")
+    return entry
+
+
+def _store_entry(key, entry):
+    _weather_cache[key] = entry
     try:
+        write_json_atomic(_cache_path(*key), entry)
+    except OSError as e:
+        logging.error(f"Could not write weather cache: {e}")
+
+
+def _expires_at(resp):
+    """Epoch seconds from the Expires header, or DEFAULT_TTL from now."""
+    try:
+        return parsedate_to_datetime(resp.headers["Expires"]).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return time.time() + DEFAULT_TTL
+
+
+def _compact_entry(entry):
+    """
+    Keep only the fields we serve from one met.no timeseries entry, in the same
+    nested shape (data.instant.details, data.next_1_hours.summary/details, ...).
+    """
+    data = entry.get("data", {})
+    details = data.get("instant", {}).get("details", {})
+    compact = {"instant": {"details": {key: details[key] for key in INSTANT_FIELDS if key in details}}}
+    for period in PERIODS:
+        if period in data:
+            compact[period] = {
+                "summary": {"symbol_code": data[period].get("summary", {}).get("symbol_code")},
+                "details": {"precipitation_amount": data[period].get("details", {}).get("precipitation_amount")},
+            }
+    return {"time": entry.get("time"), "data": compact}
+
+
+def _fetch_timeseries(lat, lon, product):
+    """
+    Return the product's timeseries for (lat, lon). Served from cache until
+    met.no's Expires time, then revalidated with If-Modified-Since as their
+    terms of service require. Stale data is returned if the request fails.
+    Coordinates are rounded to 4 decimals, and simultaneous calls for the
+    same rounded point share one upstream request.
+    """
+    key = (round(float(lat), COORDINATE_DECIMALS), round(float(lon), COORDINATE_DECIMALS), product)
+    with _cache_lock:
+        entry = _load_entry(key)
+        if entry and time.time() < entry["expires"]:
+            return entry["timeseries"]
+
+        future = _inflight.get(key)
+        leader = future is None
+        if leader:
+            future = _inflight[key] = Future()
+
+    if not leader:
+        return future.result()
+
+    try:
+        timeseries = _request_timeseries(key, entry)
+        future.set_result(timeseries)
+        return timeseries
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _cache_lock:
+            del _inflight[key]
+
+
+def _request_timeseries(key, entry):
+    """Do the (conditional) request for one cache key and store the result."""
+    lat, lon, product = key
+    if time.time() - _failures.get(key, 0) < FAILURE_RETRY:
+        return entry["timeseries"] if entry else None
+
+    headers = dict(HEADERS)
+    if entry and entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+
+    url = f"{PRODUCT_URLS[product]}?lat={lat}&lon={lon}"
+    try:
+        logging.info(f"Requesting {product} from {url}")
         resp = requests.get(url, headers=headers, timeout=8)
-        if resp.status_code != 200:
+
+        if resp.status_code == 304 and entry:
+            entry = {**entry, "expires": _expires_at(resp)}
+        elif resp.status_code == 200:
+            entry = {
+                "expires": _expires_at(resp),
+                "last_modified": resp.headers.get("Last-Modified"),
+                "timeseries": [_compact_entry(e) for e in resp.json().get("properties", {}).get("timeseries", [])],
+            }
+        else:
             logging.error(f"Weather request failed {resp.status_code} for {url}")
-            return None
-        return resp.json().get("properties", {}).get("timeseries", [])
+            _failures[key] = time.time()
+            return entry["timeseries"] if entry else None
     except Exception as e:
         logging.error(f"Weather request error for {url}: {e}")
-        return None
+        _failures[key] = time.time()
+        return entry["timeseries"] if entry else None
+
+    with _cache_lock:
+        _failures.pop(key, None)
+        _store_entry(key, entry)
+    return entry["timeseries"]
+
+
+def _fetch_products(lat, lon):
+    """Fetch locationforecast and nowcast concurrently. Returns (forecast, nowcast) timeseries."""
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        loc = executor.submit(_fetch_timeseries, lat, lon, "locationforecast")
+        now = executor.submit(_fetch_timeseries, lat, lon, "nowcast")
+        return loc.result() or [], now.result() or []
+
+
+def _current_index(series, now=None):
+    """Index of the entry covering the current hour (the last one that has started)."""
+    now = now or datetime.now(timezone.utc)
+    stamp = now.strftime("%Y-%m-%dT%H:%M:%SZ")
+    index = 0
+    for i, entry in enumerate(series):
+        if entry["time"] > stamp:
+            break
+        index = i
+    return index
 
 
 def get_weather(LAT, LON):
     """
     Fetch location forecast and overlay current temperature from nowcast.
-    - Base: locationforecast (structure expected by frontend)
+    - Base: locationforecast entry for the current hour (structure expected by frontend)
     - Override: replace instant.air_temperature with nowcast when available
     """
-    HEADERS = {"User-Agent": "homeweather/1.0 (your@email.com)"}
-
-    loc_url = f"https://api.met.no/weatherapi/locationforecast/2.0/compact?lat={LAT}&lon={LON}"
-    now_url = f"https://api.met.no/weatherapi/nowcast/2.0/complete?lat={LAT}&lon={LON}"
-
-    logging.info(f"Requesting locationforecast from {loc_url}")
-    loc_series = _fetch_timeseries(loc_url, HEADERS) or []
+    loc_series, now_series = _fetch_products(LAT, LON)
 
     if not loc_series:
         return {"error": "No weather data available"}
 
-    # Use first entry as base response
-    base_entry = loc_series[0]
-
-    # Try to fetch a more accurate current temperature from nowcast
-    logging.info(f"Requesting nowcast from {now_url}")
-    now_series = _fetch_timeseries(now_url, HEADERS) or []
+    base_entry = loc_series[_current_index(loc_series)]
+    details = base_entry["data"]["instant"]["details"]
 
+    # Use nowcast for a more accurate current temperature
     if now_series:
-        now_entry = now_series[0]
-        now_temp = (
-            now_entry.get("data", {})
-            .get("instant", {})
-            .get("details", {})
-            .get("air_temperature")
-        )
+        now_temp = now_series[0]["data"]["instant"]["details"].get("air_temperature")
         if now_temp is not None:
-            try:
-                base_entry.setdefault("data", {}).setdefault("instant", {}).setdefault("details", {})[
-                    "air_temperature"
-                ] = now_temp
-                logging.info(f"Overrode air_temperature with nowcast: {now_temp}°C")
-            except Exception:
-                pass
-
-    return base_entry
\ No newline at end of file
+            details = {**details, "air_temperature": now_temp}
+            logging.info(f"Overrode air_temperature with nowcast: {now_temp}°C")
+
+    # Ny dict så cachen ikke endres
+    return {"time": base_entry["time"], "data": {**base_entry["data"], "instant": {"details": details}}}
+
+
+def get_weather_forecast(LAT, LON, hours=12):
+    """Return the parsed forecast entries for the next `hours` hours."""
+    loc_series = _fetch_timeseries(LAT, LON, "locationforecast") or []
+    if not loc_series:
+        return {"error": "No weather data available"}
+
+    start = _current_index(loc_series)
+    hour = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    end = (hour + timedelta(hours=hours)).strftime("%Y-%m-%dT%H:%M:%SZ")
+    return {
+        "hours": hours,
+        "timeseries": [entry for entry in loc_series[start:] if entry["time"] < end]
+    }
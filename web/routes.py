@@ -1,28 +1,34 @@
-from flask import Blueprint, jsonify, render_template_string
-import subprocess, os, logging, json
+from flask import Blueprint, Response, jsonify, render_template_string, request, stream_with_context
+import subprocess, os, logging, json, time
 from pathlib import Path
 from config import CONFIG
 from integration.calendar import get_calendar, get_calendarweek
 from integration.ukeplan import load_latest_ukeplan
 from integration.birthday import get_birthdays_week, get_holidays_week
-from integration.weather import get_weather
-from integration.lights import get_zones, get_outdoor_sensor_temperatures
+from integration.weather import get_weather, get_weather_forecast
+from integration.lights import get_lights, get_scenes, build_group_action, queue_group_action, toggle_group
+from integration.hue_events import start_hue_events, get_lights_state
 from integration.dinner import get_dinner, get_dinnerweek
-from integration.energy import get_hvakosterstrom
-from integration.waste import get_garbage
+from integration.energy import get_hvakosterstrom, plan_cheapest
+from integration.tibber import get_tibber_consumption
+from integration.waste import get_garbage, get_garbage_schedule
 from integration.network import get_network
-from integration.bluesound import get_powernode
+from integration.bluesound import get_music, wait_for_any_change
 from integration.timeplan import get_dagens_timeplaner, get_dagens_dag
-from integration.mill import authenticate, get_mill_devices
+from integration.mill import poll_mill, get_mill_rooms, get_mill_changes, queue_mill_command
+from integration.heating import get_heating_plan, simulate_heating
 from integration.renovation import get_renovation_costs
 from integration.trello import get_trello_tasks
 from integration.airthings import get_airthings
+from integration.airquality import get_active_alerts
+from integration.timeseries import history_json
 
 # Define a Blueprint for routes
 routes = Blueprint("routes", __name__)
 
 HOUR = 60 * 60
 MINUTE = 60
+MUSIC_STREAM_SECONDS = 5 * MINUTE
 
 def api_response(title, icon, data, refresh=1 * MINUTE):
     return jsonify({
@@ -147,15 +153,16 @@ def bigcalendar():
         except Exception as e:
             logging.error(f"Dinner fetch failed: {e}")
         
-        # Fetch waste data with error handling
+        # Fetch waste data with error handling (hentedatoer for denne uken, fra bufret plan)
         waste_data = {}
         try:
-            waste_data = get_garbage(CONFIG['GARBAGEURL'])
+            monday = datetime.now().date() - timedelta(days=datetime.now().weekday())
+            waste_data = get_garbage_schedule(CONFIG['GARBAGEURL'], start=monday, weeks=1)
         except Exception as e:
             logging.error(f"Waste fetch failed: {e}")
 
         # Middagsplan har alltid week_offset = 0 → denne ukens middag
-        for dinner in dinner_data["days"]:
+        for dinner in dinner_data.get("days", []):
             idx = dinner["weekday_index"]
             days[idx]["dinner"] = dinner["description"]
 
@@ -231,8 +238,10 @@ def bigcalendar():
             "Papir": "📄"
         }
 
-        for waste_type, date_str in waste_data.items():
-            if waste_type in ["Restavfall", "Papir"]:
+        for waste_type, dates in waste_data.items():
+            if waste_type not in ["Restavfall", "Papir"]:
+                continue
+            for date_str in dates:
                 # Parse date (format: "11.03.2025")
                 try:
                     day, month, year = date_str.split(".")
@@ -262,21 +271,54 @@ def bigcalendar():
 @routes.route("/lights", methods=["GET"])
 def lights():
     try:
-        # Fetch zones and outdoor sensor temperatures
-        zone_data = get_zones(CONFIG['PHILIPSHUE_HOST'], CONFIG['PHILIPSHUE_KEY'])
-        outdoor_temps = get_outdoor_sensor_temperatures(CONFIG['PHILIPSHUE_HOST'], CONFIG['PHILIPSHUE_KEY'])
-        
-        # Combine data
-        lights_data = {
-            "zones": zone_data,
-            "outdoor_sensors": outdoor_temps
-        }
+        # Lokal tilstand fra CLIP v2-hendelsesstrømmen; v1-henting til den er klar
+        if CONFIG.get('PHILIPSHUE_EVENTS', True):
+            start_hue_events(CONFIG['PHILIPSHUE_HOST'], CONFIG['PHILIPSHUE_KEY'], CONFIG.get('PHILIPSHUE_V2_URL'))
+            lights_data = get_lights_state()
+            if lights_data is not None:
+                return api_response("Lys", "✨", lights_data, 5)
+
+        # Zones and outdoor sensor temperatures from one cached bridge fetch
+        lights_data = get_lights(CONFIG['PHILIPSHUE_HOST'], CONFIG['PHILIPSHUE_KEY'])
 
         return api_response("Lys", "✨", lights_data, 30)
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@routes.route("/lights/<group_id>", methods=["POST"])
+def lights_set(group_id):
+    try:
+        # Body: {"toggle": true}, {"on": false}, {"brightness": 40} (prosent) eller {"scene": "<scene-id>"}
+        body = request.get_json(silent=True) or {}
+        host, key = CONFIG['PHILIPSHUE_HOST'], CONFIG['PHILIPSHUE_KEY']
+
+        if body.get("toggle"):
+            zones = (get_lights_state() or get_lights(host, key))["zones"]
+            pending = toggle_group(host, key, group_id, zones)
+        else:
+            action = build_group_action(body.get("on"), body.get("brightness"), body.get("scene"))
+            pending = queue_group_action(host, key, group_id, action)
+
+        return jsonify({"queued": {"id": group_id, "action": pending}}), 202
+
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@routes.route("/lights/scenes", methods=["GET"])
+def lights_scenes():
+    try:
+        scenes = get_scenes(CONFIG['PHILIPSHUE_HOST'], CONFIG['PHILIPSHUE_KEY'])
+        if scenes is None:
+            return jsonify({"error": "Failed to retrieve scenes"}), 500
+
+        return api_response("Scener", "✨", scenes, HOUR)
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @routes.route("/dinner", methods=["GET"])
 def dinner():
     try:
@@ -300,22 +342,71 @@ def timeplaner():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def _weather_location():
+    """
+    Return (lat, lon) for ?location=<name> from WEATHER_LOCATIONS, e.g.
+    {"hjemme": {"lat": 59.91, "lon": 10.75}, "hytta": {...}}. Defaults to the
+    first location, or LAT/LON when no locations are configured. Returns
+    None for an unknown location.
+    """
+    locations = CONFIG.get('WEATHER_LOCATIONS') or {"home": {"lat": CONFIG['LAT'], "lon": CONFIG['LON']}}
+    name = request.args.get("location") or next(iter(locations))
+    if name not in locations:
+        return None
+    return locations[name]["lat"], locations[name]["lon"]
+
 @routes.route("/weather", methods=["GET"])
 def weather():
     try:
-        # Fetch and parse calendar data from CONFIG
-        weather_data = get_weather(CONFIG['LAT'], CONFIG['LON'])
+        location = _weather_location()
+        if location is None:
+            return jsonify({"error": f"Unknown location: {request.args.get('location')}"}), 404
+        weather_data = get_weather(*location)
 
         return api_response("Været", "🌤", weather_data['data'])
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@routes.route("/weather/forecast", methods=["GET"])
+def weather_forecast():
+    try:
+        # F.eks. /weather/forecast?hours=24 – time for time fra den parsede cachen
+        hours = min(max(int(request.args.get("hours", 12)), 1), 48)
+        location = _weather_location()
+        if location is None:
+            return jsonify({"error": f"Unknown location: {request.args.get('location')}"}), 404
+        forecast = get_weather_forecast(*location, hours)
+
+        if "error" in forecast:
+            return jsonify(forecast), 500
+
+        return api_response("Værmelding", "🌤", forecast, 10 * MINUTE)
+
+    except ValueError as e:
+        return jsonify({"error": f"Invalid parameter: {e}"}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def _price_zone():
+    """
+    Return ?zone= if it is one of CONFIG['PRICE_AREAS'] (default the first),
+    or None. Zones end up in outbound URLs, cache keys and file names, so
+    only configured areas are accepted.
+    """
+    areas = CONFIG.get('PRICE_AREAS', ["NO1"])
+    zone = request.args.get("zone", areas[0])
+    return zone if zone in areas else None
+
 @routes.route("/energy", methods=["GET"])
 def energy():
     try:
         # Fetch and parse calendar data from CONFIG
-        energy_data = get_hvakosterstrom() #get_tibber(CONFIG['TIBBER_TOKEN'])
+        areas = CONFIG.get('PRICE_AREAS', ["NO1"])
+        zone = _price_zone()
+        if zone is None:
+            return jsonify({"error": f"Unknown price area: {request.args.get('zone')}"}), 400
+        energy_data = get_hvakosterstrom(zone, areas) #get_tibber(CONFIG['TIBBER_TOKEN'])
 
         if "error" in energy_data:
             return jsonify(energy_data), 500  # Return proper HTTP status
@@ -325,6 +416,46 @@ def energy():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@routes.route("/energy/consumption", methods=["GET"])
+def energy_consumption():
+    try:
+        # Forbruk og kostnad per dag eller måned fra lokal Tibber-kopi
+        period = request.args.get("period", "day")
+        consumption = get_tibber_consumption(CONFIG['TIBBER_TOKEN'], period)
+
+        if "error" in consumption:
+            return jsonify(consumption), 400
+
+        return api_response("Strømforbruk", "⚡", consumption, HOUR)
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@routes.route("/energy/cheapest", methods=["GET"])
+def energy_cheapest():
+    try:
+        # F.eks. /energy/cheapest?hours=3&before=07:00 for oppvaskmaskinen
+        hours = float(request.args.get("hours", 1))
+        deadline = request.args.get("before")
+        contiguous = request.args.get("contiguous", "true").lower() != "false"
+
+        zone = _price_zone()
+        if zone is None:
+            return jsonify({"error": f"Unknown price area: {request.args.get('zone')}"}), 400
+
+        areas = CONFIG.get('PRICE_AREAS', ["NO1"])
+        plan = plan_cheapest(hours, deadline, contiguous, zone, areas=areas)
+
+        if "error" in plan:
+            return jsonify(plan), 404
+
+        return api_response("Billigste strøm", "⚡", plan, MINUTE)
+
+    except ValueError as e:
+        return jsonify({"error": f"Invalid parameter: {e}"}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 
 
 
@@ -339,6 +470,20 @@ def waste():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@routes.route("/waste/schedule", methods=["GET"])
+def waste_schedule():
+    try:
+        # Hentedatoer flere uker frem, regnet ut fra neste dato og hentehyppighet
+        weeks = min(max(int(request.args.get("weeks", 12)), 1), 52)
+        garbage_schedule = get_garbage_schedule(CONFIG['GARBAGEURL'], weeks=weeks)
+
+        return api_response("Søppelhenting", "♻️", garbage_schedule, HOUR)
+
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @routes.route("/network", methods=["GET"])
 def network():
     try:
@@ -354,14 +499,41 @@ def network():
 @routes.route("/music", methods=["GET"])
 def bluesound():
     try:
-        # Fetch and parse calendar data from CONFIG
-        bluesound = get_powernode()
+        # Status for alle spillere fra long-polling-watcherne i minnet; ingen kall mot spillerne her
+        bluesound = get_music(CONFIG.get('BLUOS_PLAYERS'), CONFIG.get('BLUOS_DISCOVERY', False))
 
         return api_response("Bluesound", "🎵", bluesound, 10)
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@routes.route("/music/events", methods=["GET"])
+def music_events():
+    # Server-sent events: sender samlet status straks en spiller endrer seg, ellers keepalive
+    hosts, discover = CONFIG.get('BLUOS_PLAYERS'), CONFIG.get('BLUOS_DISCOVERY', False)
+
+    def stream():
+        # Strømmen avsluttes etter MUSIC_STREAM_SECONDS og nettleseren kobler til igjen (retry),
+        # så en klient som har forsvunnet uten at keepalive merker det, holder ikke en tråd for alltid
+        closes_at = time.time() + MUSIC_STREAM_SECONDS
+        yield "retry: 2000\n\n"
+
+        # Starter watcherne; første endring under er gjeldende status
+        status = get_music(hosts, discover)
+        if "error" in status:
+            yield f"data: {json.dumps(status)}\n\n"
+        version = 0
+        while time.time() < closes_at:
+            changed = wait_for_any_change(version=version, timeout=min(25, max(0, closes_at - time.time())))
+            if changed is None:
+                yield ": keepalive\n\n"
+                continue
+            version = changed
+            yield f"data: {json.dumps(get_music(hosts, discover))}\n\n"
+
+    return Response(stream_with_context(stream()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache"})
+
 @routes.route("/ruter", methods=["GET"])
 def ruter():
     return jsonify({
@@ -372,22 +544,74 @@ def ruter():
 
 @routes.route("/mill", methods=["GET"])
 def mill():
-    # Authenticate and get devices
-    auth = authenticate(CONFIG['MILL_USERNAME'], CONFIG['MILL_PASSWORD'])
-    if not auth:
+    # Refresh devices (at most once a minute) and read the grouped snapshot
+    if not poll_mill(CONFIG['MILL_USERNAME'], CONFIG['MILL_PASSWORD']):
         return api_response("Mill", "🔥", {"error": "Authentication failed"}, refresh=5*MINUTE)
-    
-    devices = get_mill_devices(auth['idToken'])
-    
-    # Group devices by room
-    rooms = {}
-    for device in devices:
-        room = device['room']
-        if room not in rooms:
-            rooms[room] = []
-        rooms[room].append(device)
-    
-    return api_response("Mill Varme", "🔥", {"rooms": rooms}, refresh=2*MINUTE)
+
+    return api_response("Mill Varme", "🔥", {"rooms": get_mill_rooms()}, refresh=2*MINUTE)
+
+@routes.route("/mill/<kind>/<target_id>", methods=["POST"])
+def mill_set(kind, target_id):
+    try:
+        # Body: {"target_temp": 21, "mode": "control_individually"} for "device" eller "room"
+        body = request.get_json(silent=True) or {}
+        pending = queue_mill_command(
+            CONFIG['MILL_USERNAME'],
+            CONFIG['MILL_PASSWORD'],
+            kind,
+            target_id,
+            target_temp=body.get("target_temp"),
+            mode=body.get("mode")
+        )
+        return jsonify({"queued": {"kind": kind, "id": target_id, "settings": pending}}), 202
+
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@routes.route("/mill/changes", methods=["GET"])
+def mill_changes():
+    try:
+        # Kun enheter som har endret seg siden ?since=<epoch>
+        since = float(request.args.get("since", 0))
+        if not poll_mill(CONFIG['MILL_USERNAME'], CONFIG['MILL_PASSWORD']):
+            return jsonify({"error": "Authentication failed"}), 500
+
+        changes = get_mill_changes(since)
+        now = time.time()
+        return api_response("Mill endringer", "🔥", {"since": since, "now": now, "changes": changes}, refresh=MINUTE)
+
+    except ValueError as e:
+        return jsonify({"error": f"Invalid parameter: {e}"}), 400
+
+@routes.route("/heating/plan", methods=["GET"])
+def heating_plan():
+    try:
+        # Senkeplan per rom for resten av i dag og i morgen (når prisene er publisert)
+        plan = get_heating_plan(CONFIG.get('HEATING', {}))
+        return api_response("Varmeplan", "🔥", {"rooms": plan}, refresh=5*MINUTE)
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@routes.route("/heating/simulate", methods=["GET"])
+def heating_simulate():
+    try:
+        from datetime import date, datetime, timedelta
+
+        # F.eks. /heating/simulate?from=2025-01-01&to=2025-01-31 – spiller av lagrede priser
+        today = datetime.now().date()
+        end = date.fromisoformat(request.args.get("to", today.isoformat()))
+        start = date.fromisoformat(request.args.get("from", (end - timedelta(days=30)).isoformat()))
+
+        result = simulate_heating(CONFIG.get('HEATING', {}), start, end)
+        return api_response("Varmesimulering", "🔥", result, refresh=HOUR)
+
+    except ValueError as e:
+        return jsonify({"error": f"Invalid parameter: {e}"}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
 @routes.route('/update', methods=['GET'])
 def update():
@@ -466,13 +690,58 @@ def renovation():
 @routes.route("/airthings", methods=["GET"])
 def airthings():
     try:
-        mac_address = CONFIG.get('AIRTHINGS_MAC')
-        if not mac_address:
-            return jsonify({"error": "AIRTHINGS_MAC not configured"}), 500
-        airthings_data = get_airthings(mac_address)
+        # AIRTHINGS_DEVICES: [{"name": "kjeller", "mac": "...", "adapter": "hci0"}], ellers én AIRTHINGS_MAC
+        devices = CONFIG.get('AIRTHINGS_DEVICES')
+        if not devices and CONFIG.get('AIRTHINGS_MAC'):
+            devices = [{"mac": CONFIG['AIRTHINGS_MAC']}]
+        if not devices:
+            return jsonify({"error": "AIRTHINGS_DEVICES or AIRTHINGS_MAC not configured"}), 500
+        airthings_data = get_airthings(devices)
         if "error" in airthings_data:
             return jsonify(airthings_data), 500
         return api_response("Luftkvalitet", "🌬️", airthings_data, 15 * MINUTE)
     except Exception as e:
         logging.error(f"Airthings error: {e}")
         return jsonify({"error": str(e)}), 500
+
+
+@routes.route("/airthings/alerts", methods=["GET"])
+def airthings_alerts():
+    # Billig å polle: ingen BLE-avlesning, og 304 så lenge ingen varsler har endret seg
+    alerts = get_active_alerts()
+    response = api_response("Luftkvalitet varsler", "⚠️", alerts, MINUTE)
+    response.set_etag(str(alerts["version"]))
+    return response.make_conditional(request)
+
+
+def _parse_history_time(value, default):
+    """Accept epoch seconds, ISO timestamps or relative offsets like -30d / -12h."""
+    if not value:
+        return default
+    if value.isdigit():
+        return int(value)
+    if value.startswith("-") and value[-1] in "dhm":
+        unit = {"d": 24 * HOUR, "h": HOUR, "m": MINUTE}[value[-1]]
+        return int(time.time() - int(value[1:-1]) * unit)
+    from datetime import datetime
+    return int(datetime.fromisoformat(value).timestamp())
+
+@routes.route("/history/<metrics>", methods=["GET"])
+def history(metrics):
+    try:
+        # F.eks. /history/energy.price.NO1,airthings.radon_24h?from=-30d&step=86400
+        names = [m for m in metrics.split(",") if m]
+        end = _parse_history_time(request.args.get("to"), int(time.time()))
+        start = _parse_history_time(request.args.get("from"), end - 24 * HOUR)
+        step = int(request.args.get("step", max(MINUTE, (end - start) // 500)))
+        agg = request.args.get("agg", "avg")
+
+        if start >= end or step <= 0 or agg not in ("avg", "min", "max"):
+            return jsonify({"error": "Invalid from/to/step/agg"}), 400
+
+        return Response(stream_with_context(history_json(names, start, end, step, agg)), mimetype="application/json")
+
+    except ValueError as e:
+        return jsonify({"error": f"Invalid parameter: {e}"}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500